@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+Times falling_balls scenes of different sizes, stage by stage.
+
+Each scenario runs in a fresh process with a fixed seed, so its numbers
+don't depend on what ran before, and its peak memory is its own. Results
+are written as JSON, and compare_to prints speedups against an earlier run.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from falling_balls import build_scene
+from fire import Fire
+from pathlib import Path
+from sketch.canvas import Canvas
+from sketch.encoders import FFmpegEncoder
+from sketch.profiler import Profiler
+from sketch.recorder import draw_frame
+from sketch.sounds import AudioSampler
+from sketch.util.point import Point
+from tempfile import TemporaryDirectory
+from typing import Any, Dict, Optional
+import json
+import platform
+import resource
+import subprocess
+import time
+
+
+# name -> arguments of run_scenario
+SCENARIOS = {
+    "default": dict(),
+    "no_audio": dict(with_audio=False),
+    "many_balls": dict(num_balls=500),
+    "many_boxes": dict(num_balls=200, num_boxes=64),
+    "large_canvas": dict(canvas_width=1920, canvas_height=1080),
+    "high_framerate": dict(framerate=120),
+}
+
+
+def run_scenario(
+    canvas_width:int=800,
+    canvas_height:int=800,
+    num_balls:int=20,
+    num_boxes:int=16,
+    framerate:int=60,
+    duration:float=10,
+    with_audio:bool=True,
+    encode:bool=True,
+    seed:int=0,
+)->Dict[str, Any]:
+  """
+  Steps, draws and (if encode) encodes every frame of the scene, then mixes
+  its audio. Returns the time spent in each stage, and peak memory.
+  """
+  scene = build_scene(
+      canvas_width=canvas_width,
+      canvas_height=canvas_height,
+      num_balls=num_balls,
+      num_boxes=num_boxes,
+      with_audio=with_audio,
+      seed=seed,
+  )
+  canvas_size = Point(canvas_width, canvas_height)
+  profiler = Profiler()
+  scene.profiler = profiler
+  audio_sampler = AudioSampler(duration=duration, out_path=None)
+  audio_sampler.profiler = profiler
+  canvas = Canvas(canvas_size)
+  timestep = 1.0 / framerate
+  num_frames = 0
+  with TemporaryDirectory() as tmp_dir:
+    video_encoder = None
+    if encode:
+      video_encoder = FFmpegEncoder(
+          path=Path(tmp_dir).joinpath("benchmark.mp4"),
+          framerate=framerate,
+          canvas_size=canvas_size,
+          image_format=canvas.image_format,
+      )
+      video_encoder.profiler = profiler
+      video_encoder.open()
+    start = time.perf_counter()
+    try:
+      while scene.clock < duration:
+        scene.step(timestep, audio_sampler=audio_sampler)
+        draw_frame(scene, canvas)
+        if video_encoder is not None:
+          video_encoder.write(canvas.array)
+        num_frames += 1
+    finally:
+      if video_encoder is not None:
+        with profiler.section("close", "video"):
+          video_encoder.close()
+    if len(audio_sampler.events) > 0:
+      audio_sampler.mix()
+    wall_seconds = time.perf_counter() - start
+
+  stages = {}
+  for name, (calls, seconds) in profiler.totals().items():
+    stages[name] = {
+        "calls": calls,
+        "seconds": seconds,
+        "per_second": calls / seconds if seconds > 0 else None,
+    }
+  # Step phases, together, are what limits the simulation's frame rate
+  simulate = sum(
+      stages[name]["seconds"]
+      for name in ("step", "pre_collision", "check_collisions", "collision_step")
+  )
+  return {
+      "frames": num_frames,
+      "wall_seconds": wall_seconds,
+      "fps": num_frames / wall_seconds,
+      "simulate_fps": num_frames / simulate if simulate > 0 else None,
+      "draw_fps": num_frames / stages["draw"]["seconds"],
+      "encode_fps": (
+        num_frames / stages["encode"]["seconds"] if encode else None
+      ),
+      "audio_mix_seconds": stages.get("mix", {}).get("seconds", 0),
+      "triggers": len(audio_sampler.events),
+      # Linux reports kilobytes
+      "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+      "stages": stages,
+      "counts": dict(profiler.counts),
+  }
+
+
+def git_commit()->Optional[str]:
+  try:
+    return subprocess.run(
+        ["git", "rev-parse", "HEAD"],
+        cwd=Path(__file__).parent,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout.strip()
+  except (OSError, subprocess.CalledProcessError):
+    return None
+
+
+def compare(results:Dict[str, Any], baseline:Dict[str, Any])->None:
+  """
+  Prints how many times faster each scenario's stages are than baseline.
+  """
+  keys = ("fps", "simulate_fps", "draw_fps", "encode_fps")
+  print(f"\nvs {baseline.get('commit')}")
+  print(f"{'scenario':<16}" + "".join(f"{key:>14}" for key in keys))
+  for name, result in results["scenarios"].items():
+    before = baseline["scenarios"].get(name)
+    if before is None:
+      continue
+    cells = []
+    for key in keys:
+      if result.get(key) and before.get(key):
+        cells.append(f"{result[key] / before[key]:>13.2f}x")
+      else:
+        cells.append(f"{'-':>14}")
+    print(f"{name:<16}" + "".join(cells))
+
+
+def main(
+    out_path="benchmark.json",
+    scenarios=None,
+    duration=10,
+    encode=True,
+    seed=0,
+    compare_to=None,
+):
+  """
+  out_path - where the JSON results go
+  scenarios - names from SCENARIOS, comma separated. Defaults to all.
+  duration - seconds of scene time per scenario
+  encode - if false, frames are drawn but not encoded
+  seed - every scenario starts from this random seed
+  compare_to - a JSON file from an earlier run, to print speedups against
+  """
+  if scenarios is None:
+    scenarios = list(SCENARIOS)
+  elif isinstance(scenarios, str):
+    scenarios = scenarios.split(",")
+  for name in scenarios:
+    assert name in SCENARIOS, f"Unknown scenario: {name}"
+  out_path = Path(out_path)
+
+  results = {
+      "commit": git_commit(),
+      "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+      "python": platform.python_version(),
+      "machine": platform.platform(),
+      "duration": duration,
+      "seed": seed,
+      "scenarios": {},
+  }
+  for name in scenarios:
+    kwargs = dict(SCENARIOS[name], duration=duration, encode=encode, seed=seed)
+    # A fresh process per scenario, so memory and caches start clean
+    with ProcessPoolExecutor(max_workers=1) as pool:
+      result = pool.submit(run_scenario, **kwargs).result()
+    result["params"] = kwargs
+    results["scenarios"][name] = result
+    print(
+        f"{name:<16} {result['fps']:8.1f} fps  "
+        f"simulate {result['simulate_fps']:8.1f}  "
+        f"draw {result['draw_fps']:8.1f}  "
+        f"mix {result['audio_mix_seconds']:6.3f}s  "
+        f"{result['peak_rss_mb']:7.1f} MB"
+    )
+
+  with open(out_path, "w") as out_file:
+    json.dump(results, out_file, indent=2)
+  if compare_to is not None:
+    with open(compare_to) as baseline_file:
+      compare(results, json.load(baseline_file))
+
+
+if __name__ == "__main__":
+  Fire(main)
@@ -0,0 +1 @@
+# Lets tests import sketch and the scripts from the repository root
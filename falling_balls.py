@@ -2,30 +2,77 @@
 
 from fire import Fire
 from pathlib import Path
-from pydub.generators import Sine
 from sketch.util.point import Point
 from sketch.util.color import Color
 from sketch.entities.physics_entity import PhysicsCircle
 from sketch.entities.music_box import MusicBox
 from sketch.recorder import Recorder
 from sketch.scene import Scene
-from sketch.sounds import SoundDescription
-from sketch.sounds import pitch_to_frequency
-from sketch.sound_effects import fade_in_and_out
+from sketch.trajectory import TrajectoryPlayer
+from sketch.trajectory import record_trajectory
+from sketch.sounds import tone_bank
+from sketch.sound_effects import fade_in_and_out_samples
 from sketch.entities.falling_ball import FallingBall
+from random import choice
 from random import random
+from random import seed as seed_random
 import math
 
 
 
-def main(
+PITCHES = [
+    #16, # c2
+    #18, 20, 23, 25,
+    28, # c3
+    30, 32, 35, 38,
+    40, # c4
+    42, 44, 47, 50,
+    52, # c5
+    54, 56, 59, 62,
+    64, # c6
+]
+
+
+def make_notes(num_notes=len(PITCHES)):
+  """
+  The scale the boxes play.
+  """
+  # The whole scale in one batch, much faster than pydub's generators
+  return tone_bank(
+      PITCHES[:num_notes],
+      duration=0.3,
+      volume=-15,
+      effect=fade_in_and_out_samples(0.1, 0.2),
+  )
+
+
+def build_scene(
     canvas_width=800,
     canvas_height=800,
-    out_path="test.mp4",
-    framerate=60,
-    duration=20
-):
-  out_path = Path(out_path)
+    num_balls=20,
+    num_boxes=16,
+    with_audio=True,
+    seed=None,
+    notes=None,
+    palette=None,
+    continuous_collision=False,
+)->Scene:
+  """
+  Balls fall from above the canvas onto a staggered grid of music boxes.
+  num_boxes - boxes are laid out on the smallest square grid that fits
+    them, and play the pitches in turn.
+  with_audio - if false, boxes still bounce, but have no sounds
+  seed - if set, the random module is seeded first, so the scene is the
+    same every time
+  notes - sounds for the boxes, in turn. Defaults to make_notes, pass them
+    in to share one bank between scenes.
+  palette - (r, g, b) colors, from 0 to 1, balls pick from. Defaults to
+    random colors.
+  continuous_collision - if true, balls can't pass through boxes between
+    steps, so low framerates still bounce correctly
+  """
+  if seed is not None:
+    seed_random(seed)
   canvas_size = Point(canvas_width, canvas_height)
   background_color = Color(r=0.2, g=0.4, b=0.8)
 
@@ -34,13 +81,13 @@ def main(
   alive_rect = [(-100, -100), (canvas_width+200, canvas_height+200)]
   gravity = Point.Down() * 300
   ball_radius = 15
-  num_balls = 20
-  box_size = 75
-  box_rotation = math.pi / 4
-  horizintal_spacing = canvas_width/5
-  vertical_spacing = canvas_height/5
-  horizintal_margin = canvas_width/5
-  vertical_margin = canvas_width/5
+  grid_size = max(math.ceil(math.sqrt(num_boxes)), 1)
+  horizintal_spacing = canvas_width/(grid_size+1)
+  vertical_spacing = canvas_height/(grid_size+1)
+  horizintal_margin = canvas_width/(grid_size+1)
+  vertical_margin = canvas_width/(grid_size+1)
+  # 75 on the original 4 x 4 grid, smaller on denser ones
+  box_size = min(75, 0.47 * horizintal_spacing)
 
   falling_balls = [
       FallingBall(
@@ -48,32 +95,20 @@ def main(
         alive_rect=alive_rect,
         radius=ball_radius,
         acceleration=gravity,
-        color=Color.Random(),
+        color=(
+          Color.Random() if palette is None else Color(*choice(palette))
+        ),
       )
       for _ in range(num_balls)
   ]
 
-  notes = [
-      SoundDescription().add_generator(
-        Sine(freq=pitch_to_frequency(pitch)),
-        volume=-15,
-        duration=0.3,
-        effect=fade_in_and_out(0.1, 0.2)
-      ) for pitch in [
-        #16, # c2
-        #18, 20, 23, 25,
-        28, # c3
-        30, 32, 35, 38,
-        40, # c4
-        42, 44, 47, 50,
-        52, # c5
-        54, 56, 59, 62,
-        64, # c6
-      ]
-  ]
+  if not with_audio:
+    notes = []
+  elif notes is None:
+    notes = make_notes(num_boxes)
   positions = []
-  for x in range(4):
-    for y in range(4):
+  for x in range(grid_size):
+    for y in range(grid_size):
       offset = 0
       if y % 2 == 0:
         offset += horizintal_spacing/2
@@ -94,9 +129,9 @@ def main(
         pos.y/canvas_height,
         pos.x/canvas_width
       ),
-      sounds=[note]
+      sounds=[notes[idx % len(notes)]] if with_audio else [],
     )
-    for pos, note in zip(positions, notes)
+    for idx, pos in enumerate(positions[:num_boxes])
   ]
   for ball in falling_balls:
     ball.collides_with += music_boxes
@@ -104,18 +139,65 @@ def main(
     box.collides_with += falling_balls
   entities = falling_balls + music_boxes
 
-  scene = Scene(
+  return Scene(
       canvas_size=canvas_size,
       background_color=background_color,
       entities=entities,
+      continuous_collision=continuous_collision,
   )
 
+
+def main(
+    canvas_width=800,
+    canvas_height=800,
+    out_path="test.mp4",
+    framerate=60,
+    duration=20,
+    trajectory_path=None,
+    seed=None,
+    continuous_collision=False,
+    physics_rate=None,
+):
+  """
+  trajectory_path - if set, the simulation is saved here the first time, and
+    later runs only redraw it.
+  seed - if set, the same scene is made every time
+  continuous_collision - see build_scene
+  physics_rate - steps per second of the simulation, see Recorder. Not
+    used with trajectory_path, which replays at the framerate.
+  """
+  out_path = Path(out_path)
+  canvas_size = Point(canvas_width, canvas_height)
+  def make_scene():
+    return build_scene(
+        canvas_width,
+        canvas_height,
+        seed=seed,
+        continuous_collision=continuous_collision,
+    )
+
+  if trajectory_path is not None:
+    trajectory_path = Path(trajectory_path)
+    # Replays never build the scene, or synthesize its notes
+    if not trajectory_path.exists():
+      record_trajectory(
+          scene=make_scene(),
+          framerate=framerate,
+          duration=duration,
+          out_dir=trajectory_path,
+      )
+    scene = TrajectoryPlayer(trajectory_path, canvas_size=canvas_size)
+    physics_rate = None
+  else:
+    scene = make_scene()
+
   recorder = Recorder(
       scene=scene,
       framerate=framerate,
       out_path=out_path,
       canvas_size=canvas_size,
       duration=duration,
+      physics_rate=physics_rate,
   )
 
   with recorder:
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+Renders every combination of a grid of falling_balls parameters.
+
+Jobs run on a pool of worker processes that stay up between jobs, so
+imports and the note bank are paid for once per worker rather than once per
+video. Each job records into its own temporary files, and its video only
+appears under its final name once it is complete, so rerunning the farm
+skips finished videos.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import as_completed
+from falling_balls import build_scene
+from falling_balls import make_notes
+from fire import Fire
+from itertools import product
+from pathlib import Path
+from sketch.recorder import Recorder
+from sketch.sounds import SoundDescription
+from sketch.util.point import Point
+from typing import Any, Dict, List, Optional
+import inspect
+import json
+import os
+import time
+
+# Parameters that go to build_scene. The rest go to Recorder.
+SCENE_PARAMS = set(inspect.signature(build_scene).parameters) - {"notes"}
+
+# Used by jobs that don't set them, and part of every job's name
+DEFAULTS = {"duration": 20, "framerate": 60}
+
+# Set in each worker by _init_worker
+_notes = None
+
+
+def _init_worker(notes:List[SoundDescription])->None:
+  global _notes
+  _notes = notes
+
+
+def job_name(params:Dict[str, Any])->str:
+  """
+  A file name made of the parameters, in a fixed order.
+  """
+  return "_".join(
+      f"{key}={params[key]}".replace("/", "-").replace(" ", "")
+      for key in sorted(params)
+  )
+
+
+def expand_grid(
+    grid:Dict[str, Any],
+    fixed:Optional[Dict[str, Any]]=None,
+)->List[Dict[str, Any]]:
+  """
+  Every combination of the grid's values, on top of DEFAULTS. Values that
+  aren't lists are used in every job, as is everything in fixed, which is
+  how list values such as palette get through whole.
+  """
+  fixed = {} if fixed is None else fixed
+  assert len(set(grid) & set(fixed)) == 0, \
+      "Parameters can't be both in the grid and fixed."
+  keys = sorted(grid)
+  values = [
+      grid[key] if isinstance(grid[key], (list, tuple)) else [grid[key]]
+      for key in keys
+  ]
+  return [
+      {**DEFAULTS, **fixed, **dict(zip(keys, combo))}
+      for combo in product(*values)
+  ]
+
+
+def render_job(
+    params:Dict[str, Any],
+    out_path:Path,
+    tmp_dir:Path,
+)->Dict[str, Any]:
+  """
+  Runs in a worker. Renders one video and returns how long each part took.
+  """
+  start = time.perf_counter()
+  scene_params = {k: v for k, v in params.items() if k in SCENE_PARAMS}
+  recorder_params = {k: v for k, v in params.items() if k not in SCENE_PARAMS}
+  scene = build_scene(notes=_notes, **scene_params)
+  built = time.perf_counter()
+  # Written under a temporary name, renamed once complete
+  partial_path = out_path.with_name(f".{out_path.stem}.partial.mp4")
+  if partial_path.exists():
+    partial_path.unlink()
+  recorder = Recorder(
+      scene=scene,
+      out_path=partial_path,
+      canvas_size=scene.canvas_size,
+      tmp_dir=tmp_dir,
+      silence_pbar=True,
+      **recorder_params,
+  )
+  with recorder:
+    recorder.record()
+  os.replace(partial_path, out_path)
+  end = time.perf_counter()
+  return {
+      "name": out_path.stem,
+      "params": params,
+      "pid": os.getpid(),
+      "build_seconds": built - start,
+      "render_seconds": end - built,
+      "total_seconds": end - start,
+  }
+
+
+def _load_params(params:Any)->Dict[str, Any]:
+  if params is None or isinstance(params, dict):
+    return params
+  with open(params) as params_file:
+    return json.load(params_file)
+
+
+def main(
+    grid,
+    fixed=None,
+    out_dir="renders",
+    tmp_dir="/tmp",
+    workers=None,
+    threads_per_job=1,
+):
+  """
+  grid - parameter name -> list of values, as a dict or a JSON file. Names
+    are build_scene or Recorder arguments, such as
+    {"seed": [0, 1, 2], "num_balls": [20, 200], "duration": 20,
+    "framerate": 60}. duration and framerate default to DEFAULTS.
+  fixed - parameter name -> value used whole in every job, as a dict or a
+    JSON file, for values that are lists themselves, such as
+    {"palette": [[1, 0, 0], [0, 1, 0]]}
+  out_dir - videos are written here as <params>.mp4, along with
+    timing.jsonl, one line per finished job
+  tmp_dir - for each job's temporary files
+  workers - processes rendering at once. Defaults to one per core.
+  threads_per_job - ffmpeg threads per job. Keeping this at 1 lets the
+    farm scale with cores, instead of jobs fighting over them.
+  """
+  grid = _load_params(grid)
+  fixed = _load_params(fixed)
+  out_dir = Path(out_dir)
+  out_dir.mkdir(parents=True, exist_ok=True)
+  if workers is None:
+    workers = os.cpu_count()
+
+  jobs = []
+  for params in expand_grid(grid, fixed):
+    out_path = out_dir.joinpath(f"{job_name(params)}.mp4")
+    if out_path.exists():
+      print("Skipping finished", out_path)
+      continue
+    if "threads" not in params and "workers" not in params:
+      params["threads"] = threads_per_job
+    jobs.append((params, out_path))
+  print(f"{len(jobs)} jobs on {workers} workers")
+  if len(jobs) == 0:
+    return
+
+  # Synthesized once here, and pickled to each worker once
+  notes = make_notes()
+  start = time.perf_counter()
+  failures = 0
+  with ProcessPoolExecutor(
+      max_workers=workers,
+      initializer=_init_worker,
+      initargs=(notes,),
+  ) as pool, open(out_dir.joinpath("timing.jsonl"), "a") as timing_file:
+    futures = {
+        pool.submit(render_job, params, out_path, Path(tmp_dir)): out_path
+        for params, out_path in jobs
+    }
+    for future in as_completed(futures):
+      try:
+        timing = future.result()
+      except Exception as e:
+        failures += 1
+        print("Failed", futures[future], repr(e))
+        continue
+      timing_file.write(json.dumps(timing) + "\n")
+      timing_file.flush()
+      print(f"{timing['total_seconds']:8.1f}s {futures[future]}")
+  elapsed = time.perf_counter() - start
+  print(
+      f"{len(jobs) - failures}/{len(jobs)} jobs in {elapsed:.1f}s, "
+      f"{(len(jobs) - failures) / elapsed * 60:.1f} per minute"
+  )
+
+
+if __name__ == "__main__":
+  Fire(main)
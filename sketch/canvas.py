@@ -0,0 +1,45 @@
+from PIL import Image, ImageDraw
+from sketch.sprites import SpriteCache
+from sketch.sprites import SpriteDraw
+from sketch.util.point import Point
+from typing import Optional
+import numpy as np
+
+class Canvas(object):
+  """
+  A frame whose pixels live in a preallocated NumPy array. PIL draws straight
+  into that memory, so encoders can take canvas.array without any copies or
+  conversions.
+  """
+  def __init__(
+      self,
+      canvas_size:Point,
+      image_format:str="RGBA",
+      sprite_cache:Optional[SpriteCache]=None,
+  ):
+    """
+    canvas_size - x/y = width/height in pixels
+    image_format - PIL mode. Must be 4 bytes per pixel, since that is how
+      PIL lays out pixels internally.
+    sprite_cache - if set, draw_ctx is a SpriteDraw using this cache, so
+      entities that support it paste anti-aliased sprites.
+    """
+    assert image_format in ("RGBA", "RGBX"), \
+        f"Unsupported image format: {image_format}"
+    canvas_size = Point(canvas_size)
+    assert canvas_size.is_positive(), "Must supply positive canvas size."
+    self.size = (int(canvas_size.x), int(canvas_size.y))
+    self.image_format = image_format
+    # Height x Width x Channels, as encoders expect
+    self.array = np.zeros((self.size[1], self.size[0], 4), dtype=np.uint8)
+    self.image = Image.frombuffer(
+        image_format, self.size, self.array, "raw", image_format, 0, 1
+    )
+    # frombuffer marks the image read only, and ImageDraw would respond by
+    # drawing into a private copy. The array is ours, so draw into it.
+    self.image.readonly = 0
+    self.sprite_cache = sprite_cache
+    if sprite_cache is None:
+      self.draw_ctx = ImageDraw.Draw(self.image)
+    else:
+      self.draw_ctx = SpriteDraw(self.image, sprite_cache)
@@ -0,0 +1,203 @@
+"""
+Batched narrow phase for circle vs convex polygon pairs.
+
+Mirrors collision.tests.test_poly_circle / test_circle_poly, but runs every
+candidate pair at once with NumPy, so results match collision.collide.
+"""
+from typing import List, Optional, Tuple, Union
+import collision
+import numpy as np
+
+Shape = Union[collision.Circle, collision.Poly]
+
+
+def is_circle_poly_pair(a:Shape, b:Shape)->bool:
+  """
+  True if this pair can be handled by collide_circle_poly_pairs.
+  """
+  return (
+      (type(a) is collision.Circle and type(b) is collision.Poly)
+      or (type(a) is collision.Poly and type(b) is collision.Circle)
+  )
+
+
+def _dot(a:np.ndarray, b:np.ndarray)->np.ndarray:
+  return a[..., 0] * b[..., 0] + a[..., 1] * b[..., 1]
+
+
+def polygon_circle_overlaps(
+    poly_pos:np.ndarray,
+    poly_points:np.ndarray,
+    poly_edges:np.ndarray,
+    circle_pos:np.ndarray,
+    circle_radius:np.ndarray,
+)->Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+  """
+  Tests P polygon vs circle pairs, with the polygon as the first shape.
+  poly_pos - P x 2 polygon positions
+  poly_points - P x K x 2 rotated points, relative to poly_pos
+  poly_edges - P x K x 2 edges, as in collision.Poly.edges
+  circle_pos - P x 2 circle centers
+  circle_radius - P circle radii
+  Returns hit, overlap, overlap_n (P x 2), a_in_b, b_in_a. Values other than
+  hit are only meaningful where hit is true.
+  """
+  num_pairs, num_points = poly_points.shape[:2]
+  radius = circle_radius
+  radius2 = radius * radius
+
+  # collision.collide tests bounding boxes before running SAT
+  abs_points = poly_pos[:, None, :] + poly_points
+  mins = abs_points.min(axis=1)
+  maxs = abs_points.max(axis=1)
+  hit = (
+      (mins[:, 0] <= circle_pos[:, 0] + radius)
+      & (circle_pos[:, 0] - radius <= maxs[:, 0])
+      & (mins[:, 1] <= circle_pos[:, 1] + radius)
+      & (circle_pos[:, 1] - radius <= maxs[:, 1])
+  )
+
+  rel_pos = circle_pos - poly_pos
+  overlap = np.full(num_pairs, np.inf)
+  overlap_n = np.zeros((num_pairs, 2))
+  a_in_b = np.ones(num_pairs, dtype=bool)
+  b_in_a = np.ones(num_pairs, dtype=bool)
+
+  with np.errstate(divide="ignore", invalid="ignore"):
+    for i in range(num_points):
+      prev_i = (i - 1) % num_points
+      next_i = (i + 1) % num_points
+      edge = poly_edges[:, i]
+      point = rel_pos - poly_points[:, i]
+      point_ln2 = _dot(point, point)
+      a_in_b &= ~(point_ln2 > radius2)
+
+      dp = _dot(point, edge)
+      left = dp < 0
+      right = ~left & (dp > _dot(edge, edge))
+      middle = ~left & ~right
+
+      # Left region, which is a vertex region if right of the previous edge.
+      prev_edge = poly_edges[:, prev_i]
+      prev_point = rel_pos - poly_points[:, prev_i]
+      prev_dp = _dot(prev_point, prev_edge)
+      left_corner = left & ~(prev_dp < 0) & (prev_dp > _dot(prev_edge, prev_edge))
+      left_dist = np.sqrt(point_ln2)
+      left_miss = left_corner & (left_dist > radius)
+      left_hit = left_corner & ~left_miss
+
+      # Right region, which is a vertex region if left of the next edge.
+      next_edge = poly_edges[:, next_i]
+      next_point = rel_pos - poly_points[:, next_i]
+      right_corner = right & (_dot(next_point, next_edge) < 0)
+      right_dist = np.sqrt(_dot(next_point, next_point))
+      right_miss = right_corner & (right_dist > radius)
+      right_hit = right_corner & ~right_miss
+
+      # Middle region, distance along the edge normal.
+      edge_ln = np.sqrt(_dot(edge, edge))
+      normal = np.stack([edge[:, 1] / edge_ln, -edge[:, 0] / edge_ln], axis=1)
+      middle_dist = _dot(point, normal)
+      middle_miss = middle & (middle_dist > 0) & (np.abs(middle_dist) > radius)
+      middle_hit = middle & ~middle_miss
+      middle_overlap = radius - middle_dist
+
+      hit &= ~(left_miss | right_miss | middle_miss)
+      b_in_a &= ~(left_hit | right_hit)
+      b_in_a &= ~(
+          middle_hit & ((middle_dist >= 0) | (middle_overlap < 2 * radius))
+      )
+
+      edge_overlap = np.where(
+          middle_hit,
+          middle_overlap,
+          np.where(left_hit, radius - left_dist, radius - right_dist)
+      )
+      edge_n = np.where(
+          middle_hit[:, None],
+          normal,
+          np.where(
+            left_hit[:, None],
+            point / left_dist[:, None],
+            next_point / right_dist[:, None]
+          )
+      )
+      update = (
+          (left_hit | right_hit | middle_hit)
+          & (np.abs(edge_overlap) < np.abs(overlap))
+      )
+      overlap = np.where(update, edge_overlap, overlap)
+      overlap_n = np.where(update[:, None], edge_n, overlap_n)
+
+  return hit, overlap, overlap_n, a_in_b, b_in_a
+
+
+def collide_circle_poly_pairs(
+    pairs:List[Tuple[Shape, Shape, bool]],
+)->List[Tuple[bool, Optional[collision.Response]]]:
+  """
+  Batched collision.collide for (a, b, want_response) triples where one
+  shape is a collision.Circle and the other a collision.Poly.
+  Returns (collided, response) per pair. As with collision.collide, the
+  response is from a's point of view, and is only made when requested.
+  """
+  results = [(False, None)] * len(pairs)
+  # Pairs are batched by polygon point count so arrays are rectangular
+  by_num_points = {}
+  for idx, (a, b, _) in enumerate(pairs):
+    poly = a if type(a) is collision.Poly else b
+    by_num_points.setdefault(len(poly.rel_points), []).append(idx)
+
+  for num_points, indices in by_num_points.items():
+    num_pairs = len(indices)
+    poly_pos = np.empty((num_pairs, 2))
+    poly_points = np.empty((num_pairs, num_points, 2))
+    poly_edges = np.empty((num_pairs, num_points, 2))
+    circle_pos = np.empty((num_pairs, 2))
+    circle_radius = np.empty(num_pairs)
+    # Each polygon is converted once, even if it appears in many pairs
+    poly_cache = {}
+    for row, idx in enumerate(indices):
+      a, b, _ = pairs[idx]
+      poly, circle = (a, b) if type(a) is collision.Poly else (b, a)
+      key = id(poly)
+      if key not in poly_cache:
+        poly_cache[key] = (
+            (poly.pos.x, poly.pos.y),
+            [(p.x, p.y) for p in poly.rel_points],
+            [(e.x, e.y) for e in poly.edges],
+        )
+      poly_pos[row], poly_points[row], poly_edges[row] = poly_cache[key]
+      circle_pos[row] = (circle.pos.x, circle.pos.y)
+      circle_radius[row] = circle.radius
+
+    hit, overlap, overlap_n, a_in_b, b_in_a = polygon_circle_overlaps(
+        poly_pos=poly_pos,
+        poly_points=poly_points,
+        poly_edges=poly_edges,
+        circle_pos=circle_pos,
+        circle_radius=circle_radius,
+    )
+    for row in np.flatnonzero(hit).tolist():
+      idx = indices[row]
+      a, b, want_response = pairs[idx]
+      response = None
+      if want_response:
+        response = collision.Response()
+        nx, ny = overlap_n[row].tolist()
+        amount = float(overlap[row])
+        if type(a) is collision.Poly:
+          response.a, response.b = a, b
+          response.a_in_b = bool(a_in_b[row])
+          response.b_in_a = bool(b_in_a[row])
+        else:
+          # Same flip as collision.tests.test_circle_poly
+          nx, ny = -nx, -ny
+          response.a, response.b = a, b
+          response.a_in_b = bool(b_in_a[row])
+          response.b_in_a = bool(a_in_b[row])
+        response.overlap = amount
+        response.overlap_n = collision.Vector(nx, ny)
+        response.overlap_v = collision.Vector(nx * amount, ny * amount)
+      results[idx] = (True, response)
+  return results
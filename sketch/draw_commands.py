@@ -0,0 +1,118 @@
+from PIL.ImageDraw import Draw
+from sketch.sprites import draw_outline
+import numpy as np
+
+
+def draw_circles(
+    draw_ctx:Draw,
+    centers:np.ndarray,
+    radii:np.ndarray,
+    fills:np.ndarray,
+)->None:
+  """
+  DrawCommandBuffer.circles, one ImageDraw.ellipse at a time.
+  """
+  for (x, y), r, fill in zip(centers.tolist(), radii.tolist(), fills.tolist()):
+    draw_ctx.ellipse((x-r, y-r, x+r, y+r), fill=tuple(fill))
+
+
+def draw_polygons(
+    draw_ctx:Draw,
+    points:np.ndarray,
+    fills:np.ndarray,
+)->None:
+  """
+  DrawCommandBuffer.polygons, one ImageDraw.polygon at a time.
+  """
+  for polygon, fill in zip(points.tolist(), fills.tolist()):
+    draw_ctx.polygon([tuple(p) for p in polygon], fill=tuple(fill))
+
+
+class DrawCommandBuffer(object):
+  """
+  Stands in for a PIL ImageDraw during Scene.draw, and records each call
+  instead of drawing it. Entities pass freshly built coordinates and fill
+  tuples, so a filled buffer is a snapshot of the frame that can be replayed
+  later, on another thread, while the scene keeps moving.
+
+  Besides the ImageDraw methods, circles and polygons take whole arrays of
+  shapes in one call. Check draws_batches before using them.
+  """
+  draws_batches = True
+
+  def __init__(self, draws_sprites:bool=False):
+    """
+    draws_sprites - if true, entities record sprite calls, as they would
+      for a SpriteDraw.
+    """
+    self.draws_sprites = draws_sprites
+    # (method name, args, kwargs) in call order
+    self.commands = []
+
+  def rectangle(self, *args, **kwargs)->None:
+    self.commands.append(("rectangle", args, kwargs))
+
+  def ellipse(self, *args, **kwargs)->None:
+    self.commands.append(("ellipse", args, kwargs))
+
+  def polygon(self, *args, **kwargs)->None:
+    self.commands.append(("polygon", args, kwargs))
+
+  def line(self, *args, **kwargs)->None:
+    self.commands.append(("line", args, kwargs))
+
+  def sprite(self, *args, **kwargs)->None:
+    self.commands.append(("sprite", args, kwargs))
+
+  def circles(
+      self,
+      centers:np.ndarray,
+      radii:np.ndarray,
+      fills:np.ndarray,
+  )->None:
+    """
+    Filled circles, drawn in order.
+    centers - N x 2
+    radii - N
+    fills - N x 4 RGBA, 0-255
+    """
+    self.commands.append((
+        "circles",
+        (
+          np.array(centers, dtype=np.float64),
+          np.array(radii, dtype=np.float64),
+          np.array(fills, dtype=np.uint8),
+        ),
+        {}
+    ))
+
+  def polygons(self, points:np.ndarray, fills:np.ndarray)->None:
+    """
+    Filled convex polygons, drawn in order.
+    points - N x K x 2
+    fills - N x 4 RGBA, 0-255
+    """
+    self.commands.append((
+        "polygons",
+        (np.array(points, dtype=np.float64), np.array(fills, dtype=np.uint8)),
+        {}
+    ))
+
+  def replay(self, draw_ctx:Draw)->None:
+    """
+    Performs every recorded call, in order, on a real draw context.
+    Sprites are drawn as geometry if draw_ctx can't paste them.
+    """
+    draws_sprites = getattr(draw_ctx, "draws_sprites", False)
+    for method, args, kwargs in self.commands:
+      if method == "sprite" and not draws_sprites:
+        draw_outline(draw_ctx, *args, **kwargs)
+      elif method == "circles":
+        draw_circles(draw_ctx, *args)
+      elif method == "polygons":
+        draw_polygons(draw_ctx, *args)
+      else:
+        getattr(draw_ctx, method)(*args, **kwargs)
+
+  def __len__(self):
+    return len(self.commands)
@@ -0,0 +1,249 @@
+from moviepy.config import get_setting
+from pathlib import Path
+from sketch.profiler import NULL_PROFILER
+from sketch.sounds import AudioSampler
+from sketch.sounds import StreamingAudioSampler
+from sketch.util.point import Point
+from typing import List
+import cv2
+import moviepy.editor as mp
+import numpy as np
+import subprocess
+
+def image_to_array(image):
+  # outputs Height x Width x Channels (weirdly whats expected)
+  data = np.array(image.copy())
+  # Convert colors to BGR
+  data = cv2.cvtColor(data, cv2.COLOR_RGB2BGR)
+  return data
+
+
+# PIL image mode -> ffmpeg rawvideo pixel format
+FFMPEG_PIXEL_FORMATS = {
+    "RGBA": "rgba",
+    "RGBX": "rgb0",
+}
+
+
+def ffmpeg_binary()->str:
+  """
+  The ffmpeg executable moviepy is configured to use.
+  """
+  return get_setting("FFMPEG_BINARY")
+
+
+class OpenCVEncoder(object):
+  """
+  Writes frames with cv2.VideoWriter, then has moviepy re-encode the result
+  with the audio attached.
+  """
+  # Times each write, see sketch.profiler
+  profiler = NULL_PROFILER
+
+  def __init__(
+      self,
+      path:Path,
+      framerate:int,
+      canvas_size:Point,
+  ):
+    self.path = Path(path)
+    self.framerate = framerate
+    self.canvas_size = Point(canvas_size)
+    self.video_writer = None
+    # Reused for every RGBA to BGR conversion
+    self._bgr = np.empty(
+        (int(self.canvas_size.y), int(self.canvas_size.x), 3),
+        dtype=np.uint8
+    )
+
+  @property
+  def is_open(self)->bool:
+    return self.video_writer is not None
+
+  def open(self)->None:
+    self.video_writer = cv2.VideoWriter(
+        str(self.path),
+        cv2.VideoWriter_fourcc(*"avc1"),
+        self.framerate,
+        (self.canvas_size.x, self.canvas_size.y)
+    )
+
+  def write(self, frame:np.ndarray)->None:
+    """
+    frame - Height x Width x 4 RGBA pixels, such as Canvas.array
+    """
+    with self.profiler.section("convert", "video"):
+      cv2.cvtColor(frame, cv2.COLOR_RGBA2BGR, dst=self._bgr)
+    with self.profiler.section("encode", "video"):
+      self.video_writer.write(self._bgr)
+
+  def close(self)->None:
+    self.video_writer.release()
+    self.video_writer = None
+
+  def mux(self, audio_sampler:AudioSampler, out_path:Path)->None:
+    audio_sampler.export()
+    mp.VideoFileClip(str(self.path)).set_audio(
+      mp.AudioFileClip(str(audio_sampler.out_path))
+    ).write_videofile(str(out_path))
+    audio_sampler.out_path.unlink()
+
+
+class FFmpegEncoder(object):
+  """
+  Streams raw frames over a pipe into a single ffmpeg process, the only
+  video encode. Audio is only final once the scene is done, as later
+  triggers still mix into, stop or steal earlier sounds, so mux is a
+  second ffmpeg run that copies the encoded video stream as is and only
+  encodes the audio. Feeding the audio to the encoding process instead,
+  through a pipe, deadlocks: ffmpeg stops reading an input that gets ahead
+  of the others, so it stops taking frames while it waits for audio.
+  """
+  # Times each write, see sketch.profiler
+  profiler = NULL_PROFILER
+
+  def __init__(
+      self,
+      path:Path,
+      framerate:int,
+      canvas_size:Point,
+      image_format:str="RGBA",
+      codec:str="libx264",
+      preset:str="medium",
+      crf:int=23,
+      threads:int=0,
+      audio_codec:str="aac",
+  ):
+    """
+    path - where the video stream is written, without audio
+    framerate - frames per second
+    canvas_size - x/y = width/height of each frame
+    image_format - channel layout of the frames passed to write
+    codec - ffmpeg video encoder
+    preset - encoder speed / compression tradeoff
+    crf - constant rate factor, lower is higher quality
+    threads - encoder threads, 0 lets ffmpeg decide
+    audio_codec - ffmpeg audio encoder used by mux
+    """
+    assert image_format in FFMPEG_PIXEL_FORMATS, \
+        f"Unsupported image format: {image_format}"
+    self.path = Path(path)
+    self.framerate = framerate
+    self.canvas_size = Point(canvas_size)
+    self.image_format = image_format
+    self.codec = codec
+    self.preset = preset
+    self.crf = crf
+    self.threads = threads
+    self.audio_codec = audio_codec
+    self.process = None
+
+  @property
+  def is_open(self)->bool:
+    return self.process is not None
+
+  def open(self)->None:
+    self.process = subprocess.Popen(
+        [
+          ffmpeg_binary(), "-y", "-loglevel", "error",
+          "-f", "rawvideo",
+          "-pix_fmt", FFMPEG_PIXEL_FORMATS[self.image_format],
+          "-s", f"{int(self.canvas_size.x)}x{int(self.canvas_size.y)}",
+          "-r", str(self.framerate),
+          "-i", "-",
+          "-an",
+          "-c:v", self.codec,
+          "-preset", self.preset,
+          "-crf", str(self.crf),
+          "-threads", str(self.threads),
+          "-pix_fmt", "yuv420p",
+          str(self.path),
+        ],
+        stdin=subprocess.PIPE,
+        # Unbuffered, so frames go from our array straight into the pipe
+        bufsize=0,
+    )
+
+  def write(self, frame:np.ndarray)->None:
+    """
+    frame - Height x Width x Channels pixels in image_format, such as
+      Canvas.array. Must be contiguous, it is handed over without a copy.
+    """
+    data = frame.data.cast("B")
+    with self.profiler.section("encode", "video"):
+      while len(data) > 0:
+        # Unbuffered writes may be partial
+        data = data[self.process.stdin.write(data):]
+
+  def close(self)->None:
+    self.process.stdin.close()
+    return_code = self.process.wait()
+    self.process = None
+    assert return_code == 0, f"ffmpeg failed with code {return_code}"
+
+  def concat(self, segment_paths:List[Path])->None:
+    """
+    Joins videos made by encoders with the same settings into path,
+    without re-encoding.
+    """
+    list_path = self.path.with_suffix(".txt")
+    with open(list_path, "w") as list_file:
+      for segment_path in segment_paths:
+        list_file.write(f"file '{Path(segment_path).absolute()}'\n")
+    try:
+      subprocess.run(
+          [
+            ffmpeg_binary(), "-y", "-loglevel", "error",
+            "-f", "concat", "-safe", "0",
+            "-i", str(list_path),
+            "-c", "copy",
+            str(self.path),
+          ],
+          check=True,
+      )
+    finally:
+      list_path.unlink()
+
+  def mux(self, audio_sampler:AudioSampler, out_path:Path)->None:
+    """
+    Pipes the mixed audio into ffmpeg next to the finished video stream.
+    Streamed audio is read from its wav file instead.
+    """
+    if isinstance(audio_sampler, StreamingAudioSampler):
+      audio_sampler.export()
+      try:
+        subprocess.run(
+            [
+              ffmpeg_binary(), "-y", "-loglevel", "error",
+              "-i", str(self.path),
+              "-i", str(audio_sampler.out_path),
+              "-map", "0:v", "-map", "1:a",
+              "-c:v", "copy",
+              "-c:a", self.audio_codec,
+              "-shortest",
+              str(out_path),
+            ],
+            check=True,
+        )
+      finally:
+        audio_sampler.out_path.unlink()
+      return
+    audio = audio_sampler.mix()
+    sample_format = {1: "s8", 2: "s16le", 4: "s32le"}[audio.sample_width]
+    subprocess.run(
+        [
+          ffmpeg_binary(), "-y", "-loglevel", "error",
+          "-i", str(self.path),
+          "-f", sample_format,
+          "-ar", str(audio.frame_rate),
+          "-ac", str(audio.channels),
+          "-i", "-",
+          "-map", "0:v", "-map", "1:a",
+          "-c:v", "copy",
+          "-c:a", self.audio_codec,
+          "-shortest",
+          str(out_path),
+        ],
+        input=audio.raw_data,
+        check=True,
+    )
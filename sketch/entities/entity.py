@@ -3,9 +3,11 @@ from abc import ABC
 from abc import abstractmethod
 from sketch.sounds import AudioSampler
 from sketch.util.point import Point
+from sketch.util.point import PointView
 from sketch.util.color import Color
-from typing import Union, List, Tuple, Optional
+from typing import Any, Dict, Union, List, Tuple, Optional
 import collision
+import math
 
 
 class Entity(ABC):
@@ -41,12 +43,35 @@ class Entity(ABC):
     self.angle = angle
     # Child classes set this to true if needed
     self._needs_collision_response = False
+    # (shape id, x, y, angle) last copied into the collision shape
+    self._collision_pose = None
+    # Set by put, so a scene doesn't draw this between where it was and
+    # where it was put, see Scene.interpolated
+    self._teleported = False
     if color is None:
       # Default color is white
       self.color = Color(1,1,1)
     else:
       self.color = color
 
+  def __getstate__(self):
+    state = self.__dict__.copy()
+    # Keyed on object ids, which are meaningless in another process
+    state.pop("_partner_id_cache", None)
+    return state
+
+  @property
+  def position(self)->Point:
+    return self._position
+
+  @position.setter
+  def position(self, position:Point)->None:
+    if isinstance(getattr(self, "_position", None), PointView):
+      # Bound to array storage, write through so the array stays current.
+      self._position.set(position)
+    else:
+      self._position = position
+
   ## The following stubs are listed in order of calls per-frame
 
   @abstractmethod
@@ -61,10 +86,20 @@ class Entity(ABC):
     """
     Gives the entity a chance to update collision object parameters.
     """
-    if self.collision_shape is not None:
-      self.collision_shape.pos.set(self.position)
-      if hasattr(self.collision_shape, "angle"):
-        self.collision_shape.angle = self.angle
+    self._sync_collision_shape()
+
+  def _sync_collision_shape(self)->None:
+    # Moves the collision shape to this entity's position and angle
+    shape = self.collision_shape
+    if shape is not None:
+      position = self.position
+      pose = (id(shape), position.x, position.y, self.angle)
+      # Setting a Poly's angle recomputes all of its points, skip if unmoved
+      if pose != self._collision_pose:
+        shape.pos.set(position)
+        if hasattr(shape, "angle") and shape.angle != self.angle:
+          shape.angle = self.angle
+        self._collision_pose = pose
 
   # Optional Override
   def on_collision(self, other, response:Optional[collision.Response])->None:
@@ -95,6 +130,102 @@ class Entity(ABC):
 
   def put(self, position:Point):
     self.position = position.copy()
+    self._teleported = True
+
+  # Optional Override
+  def respawn(self)->None:
+    """
+    Puts a recycled entity back in its starting state, see EntityPool.
+    """
+    pass
+
+  def get_state(self)->Dict[str, Any]:
+    """
+    Everything about this entity that changes while a scene runs.
+    Child classes extend this, along with set_state, for checkpoints.
+    """
+    return {
+        "position": tuple(self.position),
+        "angle": self.angle,
+        "active": self.active,
+        "visible": self.visible,
+    }
+
+  def set_state(self, state:Dict[str, Any])->None:
+    """
+    Restores the result of get_state.
+    """
+    self.put(Point(state["position"]))
+    self.angle = state["angle"]
+    self.active = state["active"]
+    self.visible = state["visible"]
+
+  def get_outline(self)->Optional[Tuple[str, Any]]:
+    """
+    What this entity looks like, for drawing without the entity itself:
+    ("circle", radius) or ("polygon", [(x, y), ...]) relative to position,
+    before rotation and scaling. None if draw does something else.
+    """
+    return None
+
+  def get_draw_transform(self)->Tuple[float, float, float, float]:
+    """
+    The (x, y, angle, scale) the outline is drawn with this frame.
+    """
+    return (self.position.x, self.position.y, self.angle, 1.0)
+
+  def is_static(self)->bool:
+    """
+    True if this entity will look the same next frame as long as
+    get_draw_transform and visible don't change. Scenes cache static
+    entities into a pre-rendered layer instead of drawing them each frame.
+    """
+    return False
+
+  def is_sleeping(self)->bool:
+    """
+    True if step, pre_collision and collision_step would do nothing this
+    frame unless something collides with this entity. Scenes then skip
+    those calls, only running collision_step after a collision, and stop
+    updating the collision shape until the entity wakes up. Asked every
+    step, so changes such as unfreezing take effect on the next one, but
+    call Scene.wake after moving a sleeping entity. Off by default, so only
+    override it where that holds.
+    """
+    return False
+
+  def draw_bounds(
+      self
+  )->Optional[Tuple[Tuple[float, float], Tuple[float, float]]]:
+    """
+    Axis-aligned ((x_min, y_min), (x_max, y_max)) containing every pixel
+    draw touches, from the outline. None if unknown.
+    """
+    outline = self.get_outline()
+    if outline is None:
+      return None
+    kind, shape = outline
+    x, y, angle, scale = self.get_draw_transform()
+    if kind == "circle":
+      return ((x-shape, y-shape), (x+shape, y+shape))
+    cos, sin = math.cos(angle), math.sin(angle)
+    xs = [x + scale * (px*cos - py*sin) for px, py in shape]
+    ys = [y + scale * (px*sin + py*cos) for px, py in shape]
+    return ((min(xs), min(ys)), (max(xs), max(ys)))
+
+  def bounds(self)->Optional[Tuple[Tuple[float, float], Tuple[float, float]]]:
+    """
+    Axis-aligned ((x_min, y_min), (x_max, y_max)) of the collision shape.
+    Returns None if this entity cannot collide.
+    """
+    if self.collision_shape is None:
+      return None
+    if isinstance(self.collision_shape, collision.Circle):
+      pos = self.collision_shape.pos
+      r = self.collision_shape.radius
+      return ((pos.x-r, pos.y-r), (pos.x+r, pos.y+r))
+    aabb = self.collision_shape.aabb
+    return (aabb[0], aabb[3])
 
   def check_collision(self, other)->Tuple[bool, Optional[collision.Response]]:
     collided = False
@@ -122,3 +253,17 @@ class Entity(ABC):
           self.on_collision(other, response)
 
 
+def reverse_response(response:collision.Response)->collision.Response:
+  """
+  Returns the response from the other party's point of view, as if
+  collision.collide had been called with the shapes swapped.
+  """
+  reverse = collision.Response()
+  reverse.a = response.b
+  reverse.b = response.a
+  reverse.overlap = response.overlap
+  reverse.overlap_n = response.overlap_n.reverse()
+  reverse.overlap_v = response.overlap_v.reverse()
+  reverse.a_in_b = response.b_in_a
+  reverse.b_in_a = response.a_in_b
+  return reverse
@@ -1,8 +1,10 @@
+from sketch.entities.entity import Entity
 from sketch.entities.physics_entity import PhysicsRectangle
 from sketch.entities.physics_entity import to_collision_rect
 import collision
 from sketch.sounds import SoundDescription
 from random import choice
+from typing import Any, Dict, Tuple
 
 class MusicBox(PhysicsRectangle):
   """
@@ -20,6 +22,32 @@ class MusicBox(PhysicsRectangle):
     self._on_collision_scale = 1.2
 
 
+  def get_state(self)->Dict[str, Any]:
+    state = PhysicsRectangle.get_state(self)
+    state["scale"] = self._scale
+    return state
+
+  def set_state(self, state:Dict[str, Any])->None:
+    PhysicsRectangle.set_state(self, state)
+    self._scale = state["scale"]
+
+  def get_draw_transform(self)->Tuple[float, float, float, float]:
+    if self._scale == 1:
+      return PhysicsRectangle.get_draw_transform(self)
+    return (self.position.x, self.position.y, self.angle, self._scale)
+
+  def draw_bounds(self)->Tuple[Tuple[float, float], Tuple[float, float]]:
+    if self._scale == 1:
+      return PhysicsRectangle.draw_bounds(self)
+    return Entity.draw_bounds(self)
+
+  def is_static(self)->bool:
+    return self.frozen and self._scale == 1
+
+  def is_sleeping(self)->bool:
+    # Bouncing boxes still have to shrink back each step
+    return self.frozen and self._scale == 1
+
   def step(self, timestep, scene, audio_sampler)->None:
     PhysicsRectangle.step(self, timestep, scene, audio_sampler)
     if self._scale > 1:
@@ -38,12 +66,23 @@ class MusicBox(PhysicsRectangle):
   def collision_step(self, timestep, scene, audio_sampler)->None:
     PhysicsRectangle.collision_step(self, timestep, scene, audio_sampler)
     if self._collided_this_frame:
-      sound = choice(self.sounds)
-      audio_sampler.trigger(sound, scene.clock)
+      # Silent boxes still bounce
+      if len(self.sounds) > 0:
+        sound = choice(self.sounds)
+        audio_sampler.trigger(sound, scene.clock)
       self._scale = self._on_collision_scale
+      # Sleeping boxes skip pre_collision, so reset here too
+      self._collided_this_frame = False
 
   def draw(self, draw_ctx)->None:
-    if self._scale == 1:
+    if getattr(draw_ctx, "draws_sprites", False):
+      # Scaled boxes are cached too, no new collision shape needed
+      draw_ctx.sprite(
+          self.get_outline(),
+          self.get_draw_transform(),
+          fill=self.color.to8bit_rgba()
+      )
+    elif self._scale == 1:
       draw_ctx.polygon(
           [(p.x, p.y) for p in self.collision_shape.points],
           fill=self.color.to8bit_rgba()
@@ -1,7 +1,10 @@
 from sketch.entities.entity import Entity
 from sketch.util.point import Point
+from sketch.util.point import PointArray
 import collision
 from abc import ABCMeta
+from typing import Any, Dict, List, Tuple
+import numpy as np
 
 class PhysicsEntity(Entity, metaclass=ABCMeta):
   def __init__(
@@ -11,6 +14,8 @@ class PhysicsEntity(Entity, metaclass=ABCMeta):
       frozen:bool=False,
       **entity_kwargs
   ):
+    # Set by PhysicsArrays.bind when a scene integrates this entity.
+    self._physics_arrays = None
     Entity.__init__(self, **entity_kwargs)
     def get_or_zero(pt):
       if pt is None:
@@ -25,16 +30,69 @@ class PhysicsEntity(Entity, metaclass=ABCMeta):
     self._post_collision_dir = Point(0, 0)
     self._post_collision_delta = Point(0, 0)
 
+  @property
+  def velocity(self)->Point:
+    return self._velocity
+
+  @velocity.setter
+  def velocity(self, velocity:Point)->None:
+    if self._physics_arrays is not None:
+      self._velocity.set(velocity)
+    else:
+      self._velocity = velocity
+
+  @property
+  def acceleration(self)->Point:
+    return self._acceleration
+
+  @acceleration.setter
+  def acceleration(self, acceleration:Point)->None:
+    if self._physics_arrays is not None:
+      self._acceleration.set(acceleration)
+    else:
+      self._acceleration = acceleration
+
+  @property
+  def frozen(self)->bool:
+    if self._physics_arrays is not None:
+      return bool(self._physics_arrays.frozen[self._physics_index])
+    return self._frozen
+
+  @frozen.setter
+  def frozen(self, frozen:bool)->None:
+    if self._physics_arrays is not None:
+      self._physics_arrays.frozen[self._physics_index] = frozen
+    self._frozen = frozen
+
+  def get_state(self)->Dict[str, Any]:
+    state = Entity.get_state(self)
+    state["velocity"] = tuple(self.velocity)
+    state["acceleration"] = tuple(self.acceleration)
+    state["frozen"] = self.frozen
+    return state
+
+  def set_state(self, state:Dict[str, Any])->None:
+    Entity.set_state(self, state)
+    self.velocity = Point(state["velocity"])
+    self.acceleration = Point(state["acceleration"])
+    self.frozen = state["frozen"]
+
+  def is_static(self)->bool:
+    # Subclasses that animate while frozen must override this
+    return self.frozen
+
   def step(self, timestep, scene, audio_sampler):
     Entity.step(self, timestep, scene, audio_sampler)
-    if not self.frozen:
-      self.move(self.velocity * timestep)
-      self.velocity += self.acceleration * timestep
+    # Bound entities were already moved by PhysicsArrays.integrate
+    if not self.frozen and self._physics_arrays is None:
+      # In place, without temporary points
+      self.position.add_scaled(self.velocity, timestep)
+      self.velocity.add_scaled(self.acceleration, timestep)
 
   def pre_collision(self)->None:
     Entity.pre_collision(self)
-    self._post_collision_dir = Point(0, 0)
-    self._post_collision_delta = Point(0, 0)
+    self._post_collision_dir.set((0, 0))
+    self._post_collision_delta.set((0, 0))
 
   def on_collision(self, other:Entity, response:collision.Response)->None:
     Entity.on_collision(self, other, response)
@@ -45,14 +103,57 @@ class PhysicsEntity(Entity, metaclass=ABCMeta):
     Entity.collision_step(self, timestep, scene, audio_sampler)
     if not self.frozen:
       if self._post_collision_dir.magnitude() > 0:
-        self.velocity += (
-            self.velocity.to_collision_vec()
-            .reflect(
-              self._post_collision_dir.to_collision_vec()
-            )
-        )
+        self.velocity.reflect(self._post_collision_dir)
         self.velocity *= 0.8
       self.move(self._post_collision_delta)
+    # Sleeping entities skip pre_collision, so don't let collisions pile up
+    self._post_collision_dir.set((0, 0))
+    self._post_collision_delta.set((0, 0))
+
+
+class PhysicsArrays(object):
+  """
+  Struct-of-arrays storage for the motion of many PhysicsEntities. Once
+  bound, an entity's position, velocity and acceleration are views into rows
+  of these arrays, so the whole group is integrated in one vectorized call.
+  """
+  def __init__(self, entities:List[PhysicsEntity]):
+    num = len(entities)
+    self.entities = list(entities)
+    self.position = PointArray.zeros(num)
+    self.velocity = PointArray.zeros(num)
+    self.acceleration = PointArray.zeros(num)
+    self.frozen = np.zeros(num, dtype=bool)
+    for idx, entity in enumerate(self.entities):
+      self.bind(entity, idx)
+
+  def bind(self, entity:PhysicsEntity, idx:int)->None:
+    """
+    Copies the entity's current motion into row idx and replaces its points
+    with views of that row.
+    """
+    self.position.data[idx] = tuple(entity.position)
+    self.velocity.data[idx] = tuple(entity.velocity)
+    self.acceleration.data[idx] = tuple(entity.acceleration)
+    self.frozen[idx] = entity.frozen
+    entity._physics_arrays = self
+    entity._physics_index = idx
+    entity._position = self.position[idx]
+    entity._velocity = self.velocity[idx]
+    entity._acceleration = self.acceleration[idx]
+
+  def integrate(self, timestep:float)->None:
+    """
+    Same update as PhysicsEntity.step, for every active, unfrozen entity.
+    """
+    moving = ~self.frozen
+    moving &= np.fromiter(
+        (e.active for e in self.entities),
+        dtype=bool,
+        count=len(self.entities)
+    )
+    self.position.add_scaled(self.velocity, timestep, where=moving)
+    self.velocity.add_scaled(self.acceleration, timestep, where=moving)
 
 
 class PhysicsCircle(PhysicsEntity):
@@ -63,8 +164,35 @@ class PhysicsCircle(PhysicsEntity):
         collision.Vector(0, 0),
         self.radius
     )
+    # Fraction of this step's motion still to travel after a swept hit,
+    # see Scene.continuous_collision
+    self._unswept = 0.0
+
+  def collision_step(self, timestep, scene, audio_sampler)->None:
+    PhysicsEntity.collision_step(self, timestep, scene, audio_sampler)
+    if self._unswept > 0:
+      # Spend the rest of the step moving away from the hit
+      rest = self._unswept
+      self._unswept = 0.0
+      if not self.frozen:
+        scene.sweep(self, self.velocity * (rest * timestep))
+
+  def get_outline(self)->Tuple[str, Any]:
+    return ("circle", self.radius)
+
+  def draw_bounds(self)->Tuple[Tuple[float, float], Tuple[float, float]]:
+    x, y = self.position
+    r = self.radius
+    return ((x-r, y-r), (x+r, y+r))
 
   def draw(self, draw_ctx)->None:
+    if getattr(draw_ctx, "draws_sprites", False):
+      draw_ctx.sprite(
+          self.get_outline(),
+          self.get_draw_transform(),
+          fill=self.color.to8bit_rgba()
+      )
+      return
     top_left = self.position - (self.radius, self.radius)
     bot_right = self.position + (self.radius, self.radius)
     draw_ctx.ellipse(
@@ -100,8 +228,38 @@ class PhysicsRectangle(PhysicsEntity):
     PhysicsEntity.__init__(self, **kwargs)
     self.size = size
     self.collision_shape = to_collision_rect(self.size)
+    self._outline = None
+
+  def get_outline(self)->Tuple[str, Any]:
+    # Rebuilt only if size changes
+    size = (self.size.x, self.size.y)
+    if self._outline is None or self._outline[0] != size:
+      self._outline = (
+          size,
+          (
+            "polygon",
+            [(p.x, p.y) for p in to_collision_rect(self.size).rel_points]
+          )
+      )
+    return self._outline[1]
+
+  def get_draw_transform(self)->Tuple[float, float, float, float]:
+    # draw uses the collision shape, as placed by pre_collision
+    pos = self.collision_shape.pos
+    return (pos.x, pos.y, self.collision_shape.angle, 1.0)
+
+  def draw_bounds(self)->Tuple[Tuple[float, float], Tuple[float, float]]:
+    # draw fills the collision shape exactly
+    return self.bounds()
 
   def draw(self, draw_ctx)->None:
+    if getattr(draw_ctx, "draws_sprites", False):
+      draw_ctx.sprite(
+          self.get_outline(),
+          self.get_draw_transform(),
+          fill=self.color.to8bit_rgba()
+      )
+      return
     draw_ctx.polygon(
         [(p.x, p.y) for p in self.collision_shape.points],
         fill=self.color.to8bit_rgba()
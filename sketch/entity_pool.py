@@ -0,0 +1,73 @@
+"""
+Recycles short-lived entities instead of adding and removing them.
+
+Entities given back to a pool stay in the scene, inactive and invisible, so
+the scene's orders, vectorized physics and checkpoints are left alone. When
+one is taken again, its respawn puts it back in its starting state, like
+FallingBall does for itself.
+"""
+from sketch.entities.entity import Entity
+from sketch.scene import Scene
+from typing import Callable, List
+
+
+class EntityPool(object):
+  """
+  Hands out entities made by factory, adding new ones to scene only when
+  none are free.
+  """
+  def __init__(self, scene:Scene, factory:Callable[[], Entity]):
+    """
+    scene - where new entities are added
+    factory - makes a new entity in its starting state
+    """
+    self.scene = scene
+    self.factory = factory
+    self.entities = []
+    self._free = []
+
+  def __len__(self):
+    return len(self.entities)
+
+  @property
+  def num_free(self)->int:
+    return len(self._free)
+
+  def reserve(self, count:int)->None:
+    """
+    Makes sure at least count entities are free, adding them to the scene in
+    one batch.
+    """
+    new = [self.factory() for _ in range(count - len(self._free))]
+    for entity in new:
+      entity.active = False
+      entity.visible = False
+    self.entities.extend(new)
+    self._free.extend(new)
+    self.scene.add_entities(new)
+
+  def acquire(self)->Entity:
+    """
+    Returns a free entity, respawned, active and visible.
+    """
+    if len(self._free) == 0:
+      self.reserve(1)
+    entity = self._free.pop()
+    entity.respawn()
+    entity.active = True
+    entity.visible = True
+    self.scene.wake(entity)
+    return entity
+
+  def acquire_many(self, count:int)->List[Entity]:
+    self.reserve(count)
+    return [self.acquire() for _ in range(count)]
+
+  def release(self, entity:Entity)->None:
+    """
+    Hides entity and stops updating it, until acquired again.
+    """
+    assert entity.active, "Entity was already released."
+    entity.active = False
+    entity.visible = False
+    self._free.append(entity)
@@ -0,0 +1,172 @@
+"""
+Timing of render stages, for finding where a slow render spends its time.
+
+Scenes, audio samplers and recorders hold a profiler, NULL_PROFILER unless
+profiling was asked for, and wrap each stage in profiler.section(name).
+The null profiler's sections do nothing, so leaving the calls in costs
+next to nothing.
+"""
+from collections import Counter
+from contextlib import nullcontext
+from pathlib import Path
+from typing import Dict, Iterable, List, Tuple
+import json
+import os
+import threading
+import time
+
+# (name, category, start ns, duration ns, process id, thread id)
+Event = Tuple[str, str, int, int, int, int]
+
+
+class _Section(object):
+  __slots__ = ("profiler", "name", "category", "start")
+
+  def __init__(self, profiler:"Profiler", name:str, category:str):
+    self.profiler = profiler
+    self.name = name
+    self.category = category
+
+  def __enter__(self):
+    self.start = time.perf_counter_ns()
+    return self
+
+  def __exit__(self, *exc_info):
+    end = time.perf_counter_ns()
+    # list.append is atomic, so pipeline threads can share a profiler
+    self.profiler.events.append((
+        self.name,
+        self.category,
+        self.start,
+        end - self.start,
+        self.profiler.pid,
+        threading.get_ident(),
+    ))
+    return False
+
+
+class Profiler(object):
+  """
+  Records how long each section took, and counts of anything else.
+  """
+  enabled = True
+
+  def __init__(self):
+    self.events = []
+    self.counts = Counter()
+    self.pid = os.getpid()
+    self._lock = threading.Lock()
+
+  def __getstate__(self):
+    state = self.__dict__.copy()
+    del state["_lock"]
+    return state
+
+  def __setstate__(self, state):
+    self.__dict__.update(state)
+    self._lock = threading.Lock()
+
+  def section(self, name:str, category:str="")->_Section:
+    """
+    Context manager timing the code inside it.
+    """
+    return _Section(self, name, category)
+
+  def count(self, name:str, amount:int=1)->None:
+    with self._lock:
+      self.counts[name] += amount
+
+  def count_classes(self, name:str, objects:Iterable[object])->None:
+    """
+    Counts objects under "name:ClassName", such as entities stepped.
+    """
+    counts = Counter(f"{name}:{type(o).__name__}" for o in objects)
+    with self._lock:
+      self.counts.update(counts)
+
+  def merge(self, events:List[Event], counts:Dict[str, int])->None:
+    """
+    Adds what another profiler recorded, such as one in a worker process.
+    """
+    self.events.extend(events)
+    with self._lock:
+      self.counts.update(counts)
+
+  def totals(self)->Dict[str, Tuple[int, float]]:
+    """
+    Section name -> (calls, total seconds).
+    """
+    totals = {}
+    for name, _, _, duration, _, _ in self.events:
+      calls, total = totals.get(name, (0, 0))
+      totals[name] = (calls + 1, total + duration)
+    return {
+        name: (calls, total / 1e9) for name, (calls, total) in totals.items()
+    }
+
+  def summary(self)->str:
+    """
+    A table of sections, slowest first, followed by the counts.
+    """
+    totals = sorted(self.totals().items(), key=lambda t: -t[1][1])
+    width = max([len(name) for name, _ in totals] + [7])
+    lines = [
+        f"{'section':<{width}} {'calls':>9} {'total s':>10} {'mean ms':>10}"
+    ]
+    for name, (calls, total) in totals:
+      lines.append(
+          f"{name:<{width}} {calls:>9} {total:>10.3f} "
+          f"{1000 * total / calls:>10.4f}"
+      )
+    if len(self.counts) > 0:
+      width = max(len(name) for name in self.counts)
+      lines.append("")
+      lines.append(f"{'count':<{width}} {'calls':>9}")
+      for name, amount in sorted(self.counts.items()):
+        lines.append(f"{name:<{width}} {amount:>9}")
+    return "\n".join(lines)
+
+  def write_chrome_trace(self, path:Path)->None:
+    """
+    Writes the sections in the Chrome trace event format, which
+    chrome://tracing and Perfetto open. Counts are kept under otherData.
+    """
+    origin = min((start for _, _, start, _, _, _ in self.events), default=0)
+    trace = {
+        "traceEvents": [
+          {
+            "name": name,
+            "cat": category,
+            "ph": "X",
+            "ts": (start - origin) / 1000,
+            "dur": duration / 1000,
+            "pid": pid,
+            "tid": tid,
+          }
+          for name, category, start, duration, pid, tid in self.events
+        ],
+        "displayTimeUnit": "ms",
+        "otherData": {"counts": dict(self.counts)},
+    }
+    with open(path, "w") as trace_file:
+      json.dump(trace, trace_file)
+
+
+class NullProfiler(object):
+  """
+  Stands in for a Profiler when profiling is off.
+  """
+  enabled = False
+  _section = nullcontext()
+
+  def section(self, name:str, category:str="")->nullcontext:
+    return self._section
+
+  def count(self, name:str, amount:int=1)->None:
+    pass
+
+  def count_classes(self, name:str, objects:Iterable[object])->None:
+    pass
+
+
+NULL_PROFILER = NullProfiler()
@@ -0,0 +1,351 @@
+"""
+Batched NumPy rasterizer for recorded draw commands.
+
+PIL draws one primitive per Python call. NumpyRasterizer instead takes a
+frame's DrawCommandBuffer, groups consecutive filled ellipses and convex
+polygons, works out the span each shape covers on each row, and fills all
+of a group's spans straight into the canvas array at once. Polygons that
+turn out not to be convex are left to PIL. Like PIL on an RGBA image,
+fills overwrite pixels rather than blend, and later commands land on top.
+"""
+from sketch.canvas import Canvas
+from sketch.draw_commands import DrawCommandBuffer
+from sketch.draw_commands import draw_circles
+from sketch.draw_commands import draw_polygons
+from sketch.sprites import draw_outline
+from itertools import groupby
+from operator import itemgetter
+from typing import Iterator, Tuple
+import numpy as np
+
+# Filled primitives handled without PIL
+BATCHED = ("ellipse", "polygon", "rectangle")
+FILL_ONLY = {"fill"}
+
+
+def _box_coords(xy)->Tuple[float, float, float, float]:
+  """
+  PIL accepts boxes as (x0, y0, x1, y1) or [(x0, y0), (x1, y1)].
+  """
+  if len(xy) == 2:
+    (x0, y0), (x1, y1) = xy
+  else:
+    x0, y0, x1, y1 = xy
+  return x0, y0, x1, y1
+
+
+def _pack_colors(fills)->np.ndarray:
+  """
+  RGB(A) tuples, or an N x 4 uint8 array, as one uint32 per pixel, laid
+  out like the canvas array.
+  """
+  try:
+    colors = np.array(fills, dtype=np.uint8)
+  except ValueError:
+    # Mixed RGB and RGBA
+    colors = np.array(
+        [tuple(fill) + (255,) * (4 - len(fill)) for fill in fills],
+        dtype=np.uint8
+    )
+  if colors.shape[1] == 3:
+    colors = np.concatenate(
+        [colors, np.full((len(colors), 1), 255, dtype=np.uint8)],
+        axis=1
+    )
+  return np.ascontiguousarray(colors).view(np.uint32).reshape(-1)
+
+
+def _polygon_points(xys)->Tuple[np.ndarray, np.ndarray]:
+  """
+  Polygon xy arguments with the same number of items as an N x K x 2
+  array, and which of them can be filled as spans: lists of three or more
+  (x, y) points, making a convex shape that isn't flat and doesn't wind
+  around more than once.
+  """
+  try:
+    points = np.array(xys, dtype=np.float64)
+  except (TypeError, ValueError):
+    points = None
+  if points is None or points.ndim != 3 or points.shape[1] < 3 \
+      or points.shape[2] != 2:
+    # Such as flat [x0, y0, x1, y1, ...] lists
+    return points, np.zeros(len(xys), dtype=bool)
+  edges = np.roll(points, -1, axis=1) - points
+  following = np.roll(edges, -1, axis=1)
+  cross = edges[..., 0] * following[..., 1] - edges[..., 1] * following[..., 0]
+  dot = (edges * following).sum(axis=2)
+  # Once around, turning the same way at every corner
+  turning = np.arctan2(cross, dot).sum(axis=1)
+  area = (
+      points[:, :, 0] * np.roll(points[:, :, 1], -1, axis=1)
+      - points[:, :, 1] * np.roll(points[:, :, 0], -1, axis=1)
+  ).sum(axis=1)
+  convex = (
+      ((cross >= 0).all(axis=1) | (cross <= 0).all(axis=1))
+      & (np.abs(np.abs(turning) - 2 * np.pi) < 1e-6)
+      & (area != 0)
+  )
+  return points, convex
+
+
+class NumpyRasterizer(object):
+  """
+  Replays DrawCommandBuffers onto canvases. Filled ellipses, convex
+  polygons and rectangles are handled here, anything else, including
+  polygons that fail the convexity check, is passed to the canvas's PIL
+  draw context in order.
+  """
+  def __init__(self, max_batch_rows:int=1 << 16):
+    """
+    max_batch_rows - bounds the rows of pixels worked out at once, which
+      bounds the temporary arrays made for each batch.
+    """
+    assert max_batch_rows > 0, "Batches must hold some rows."
+    self.max_batch_rows = max_batch_rows
+
+  def replay(self, commands:DrawCommandBuffer, canvas:Canvas)->None:
+    """
+    Draws every command, in order, onto canvas.
+    """
+    height, width = canvas.array.shape[:2]
+    # One uint32 per RGBA pixel, sharing the canvas memory
+    pixels = canvas.array.view(np.uint32).reshape(-1)
+    # Runs of the same method are checked and gathered with comprehensions,
+    # since a Python loop per command would cost more than the filling.
+    for method, run in groupby(commands.commands, key=itemgetter(0)):
+      run = list(run)
+      if method == "circles":
+        for _, (centers, radii, fills), _ in run:
+          if len(centers) == 0:
+            continue
+          boxes = np.concatenate(
+              [centers - radii[:, None], centers + radii[:, None]],
+              axis=1
+          )
+          self._fill_ellipses(
+              boxes, _pack_colors(fills), pixels, width, height
+          )
+      elif method == "polygons":
+        for _, (points, fills), _ in run:
+          if len(points) == 0:
+            continue
+          self._fill_polygons(
+              points, _pack_colors(fills), pixels, width, height
+          )
+      elif method in BATCHED and all(
+          [len(args) == 1 and kwargs.keys() == FILL_ONLY
+           for _, args, kwargs in run]
+      ):
+        if method == "polygon":
+          self._fill_polygon_run(run, canvas, pixels, width, height)
+        else:
+          self._fill(method, run, pixels, width, height)
+      else:
+        for command in run:
+          self._draw_one(command, canvas, pixels, width, height)
+
+  def _draw_one(self, command, canvas:Canvas, pixels, width, height)->None:
+    method, args, kwargs = command
+    if method == "polygon" and len(args) == 1 \
+        and kwargs.keys() == FILL_ONLY:
+      self._fill_polygon_run([command], canvas, pixels, width, height)
+    elif method in BATCHED and len(args) == 1 \
+        and kwargs.keys() == FILL_ONLY:
+      self._fill(method, [command], pixels, width, height)
+    elif method == "sprite" and not getattr(
+        canvas.draw_ctx, "draws_sprites", False
+    ):
+      draw_outline(canvas.draw_ctx, *args, **kwargs)
+    elif method == "circles":
+      draw_circles(canvas.draw_ctx, *args)
+    elif method == "polygons":
+      draw_polygons(canvas.draw_ctx, *args)
+    else:
+      # Whatever PIL would do, in order
+      getattr(canvas.draw_ctx, method)(*args, **kwargs)
+
+  def _fill(
+      self,
+      kind:str,
+      batch:list,
+      pixels:np.ndarray,
+      width:int,
+      height:int,
+  )->None:
+    """
+    Fills a run of ellipse or rectangle commands, each
+    (method, (xy,), {fill}).
+    """
+    colors = _pack_colors([kwargs["fill"] for _, _, kwargs in batch])
+    xys = [args[0] for _, args, _ in batch]
+    if kind == "rectangle":
+      # Few and usually large, so slices beat coverage tests
+      image = pixels.reshape(height, width)
+      for xy, color in zip(xys, colors):
+        x0, y0, x1, y1 = _box_coords(xy)
+        # PIL includes the far edge
+        x0, y0 = max(int(np.ceil(x0)), 0), max(int(np.ceil(y0)), 0)
+        x1 = max(int(np.floor(x1)) + 1, 0)
+        y1 = max(int(np.floor(y1)) + 1, 0)
+        image[y0:y1, x0:x1] = color
+      return
+    try:
+      boxes = np.array(xys, dtype=np.float64).reshape(len(xys), 4)
+    except ValueError:
+      # Mixed box forms
+      boxes = np.array([_box_coords(xy) for xy in xys], dtype=np.float64)
+    self._fill_ellipses(boxes, colors, pixels, width, height)
+
+  def _fill_polygon_run(
+      self,
+      run:list,
+      canvas:Canvas,
+      pixels:np.ndarray,
+      width:int,
+      height:int,
+  )->None:
+    """
+    Fills a run of polygon commands, each (method, (xy,), {fill}), in
+    order. Convex ones are batched by vertex count, so arrays are
+    rectangular, and the rest are drawn by PIL.
+    """
+    for _, group in groupby(run, key=lambda c: len(c[1][0])):
+      group = list(group)
+      points, convex = _polygon_points([args[0] for _, args, _ in group])
+      start = 0
+      for is_convex, same in groupby(convex.tolist()):
+        end = start + len(list(same))
+        if is_convex:
+          colors = _pack_colors(
+              [kwargs["fill"] for _, _, kwargs in group[start:end]]
+          )
+          self._fill_polygons(
+              points[start:end], colors, pixels, width, height
+          )
+        else:
+          for _, args, kwargs in group[start:end]:
+            canvas.draw_ctx.polygon(*args, **kwargs)
+        start = end
+
+  def _chunks(self, top:np.ndarray, bottom:np.ndarray)->Iterator[slice]:
+    """
+    Splits shapes, in order, into runs covering at most max_batch_rows rows
+    in total (padded to the tallest shape in the batch).
+    """
+    num = len(top)
+    rows = int(max((bottom - top).max() + 1, 1))
+    run = max(self.max_batch_rows // rows, 1)
+    for start in range(0, num, run):
+      yield slice(start, min(start + run, num))
+
+  def _fill_spans(
+      self,
+      ys:np.ndarray,
+      x_min:np.ndarray,
+      x_max:np.ndarray,
+      colors:np.ndarray,
+      pixels:np.ndarray,
+      width:int,
+      height:int,
+  )->None:
+    """
+    Fills the pixels x_min <= x <= x_max of row y, for each span in order.
+    All arguments are shapes x rows, colors is per shape.
+    """
+    x_min = np.maximum(np.ceil(x_min), 0)
+    x_max = np.minimum(np.floor(x_max), width - 1)
+    lengths = (x_max - x_min + 1).astype(np.int64)
+    lengths[(lengths < 0) | (ys < 0) | (ys >= height)] = 0
+    lengths = lengths.reshape(-1)
+    total = int(lengths.sum())
+    if total == 0:
+      return
+    # 32 bit indices halve the memory traffic, and fit any sane canvas
+    starts = (ys * width + x_min.astype(np.int64)).reshape(-1)
+    starts = starts.astype(np.int32)
+    lengths = lengths.astype(np.int32)
+    # Flat index of every covered pixel, span after span
+    ends = np.cumsum(lengths, dtype=np.int32)
+    index = np.repeat(starts - ends + lengths, lengths)
+    index += np.arange(total, dtype=np.int32)
+    span_colors = np.broadcast_to(colors[:, None], ys.shape).reshape(-1)
+    # Spans are in shape order, and NumPy assigns repeated indices in
+    # order, so later shapes overwrite earlier ones as with PIL.
+    pixels[index] = np.repeat(span_colors, lengths)
+
+  def _fill_ellipses(
+      self,
+      boxes:np.ndarray,
+      colors:np.ndarray,
+      pixels:np.ndarray,
+      width:int,
+      height:int,
+  )->None:
+    """
+    boxes - N x (x0, y0, x1, y1), as given to ImageDraw.ellipse
+    """
+    center_x = (boxes[:, 0] + boxes[:, 2]) / 2
+    center_y = (boxes[:, 1] + boxes[:, 3]) / 2
+    radius_x = (boxes[:, 2] - boxes[:, 0]) / 2
+    radius_y = np.maximum((boxes[:, 3] - boxes[:, 1]) / 2, 1e-9)
+    top = np.ceil(boxes[:, 1]).astype(np.int64)
+    bottom = np.floor(boxes[:, 3]).astype(np.int64)
+    for chunk in self._chunks(top, bottom):
+      rows = int(max((bottom[chunk] - top[chunk]).max() + 1, 1))
+      ys = top[chunk, None] + np.arange(rows)
+      # Pixels are covered when their coordinate is inside the ellipse
+      dy = (ys - center_y[chunk, None]) / radius_y[chunk, None]
+      half = radius_x[chunk, None] * np.sqrt(np.maximum(1 - dy * dy, 0))
+      half[np.abs(dy) > 1] = -1
+      self._fill_spans(
+          ys,
+          center_x[chunk, None] - half,
+          center_x[chunk, None] + half,
+          colors[chunk],
+          pixels,
+          width,
+          height
+      )
+
+  def _fill_polygons(
+      self,
+      points:np.ndarray,
+      colors:np.ndarray,
+      pixels:np.ndarray,
+      width:int,
+      height:int,
+  )->None:
+    """
+    points - N x K x 2 vertices of convex polygons, in either winding
+    """
+    num_points = points.shape[1]
+    top = np.ceil(points[:, :, 1].min(axis=1)).astype(np.int64)
+    bottom = np.floor(points[:, :, 1].max(axis=1)).astype(np.int64)
+    edges = np.roll(points, -1, axis=1) - points
+    # Twice the signed area, so insides are on the same side of every edge
+    winding = np.sign(
+        (points[:, :, 0] * np.roll(points[:, :, 1], -1, axis=1)).sum(axis=1)
+        - (points[:, :, 1] * np.roll(points[:, :, 0], -1, axis=1)).sum(axis=1)
+    )
+    edges *= winding[:, None, None]
+    for chunk in self._chunks(top, bottom):
+      rows = int(max((bottom[chunk] - top[chunk]).max() + 1, 1))
+      ys = top[chunk, None] + np.arange(rows)
+      x_min = np.full(ys.shape, -np.inf)
+      x_max = np.full(ys.shape, np.inf)
+      with np.errstate(divide="ignore", invalid="ignore"):
+        for k in range(num_points):
+          px = points[chunk, k, 0, None]
+          py = points[chunk, k, 1, None]
+          ex = edges[chunk, k, 0, None]
+          ey = edges[chunk, k, 1, None]
+          # Inside means ex * (y - py) - ey * (x - px) >= 0, solved for x
+          bound = px + ex * (ys - py) / ey
+          x_max = np.where(ey > 0, np.minimum(x_max, bound), x_max)
+          x_min = np.where(ey < 0, np.maximum(x_min, bound), x_min)
+          # Horizontal edges rule out whole rows
+          outside = (ey == 0) & (ex * (ys - py) < 0)
+          x_max[outside] = -np.inf
+      self._fill_spans(
+          ys, x_min, x_max, colors[chunk], pixels, width, height
+      )
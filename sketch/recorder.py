@@ -1,21 +1,169 @@
-from PIL import Image, ImageDraw
 from pathlib import Path
+from sketch.canvas import Canvas
+from sketch.draw_commands import DrawCommandBuffer
+from sketch.encoders import FFmpegEncoder
+from sketch.encoders import OpenCVEncoder
+from sketch.profiler import NULL_PROFILER
+from sketch.profiler import Profiler
+from sketch.rasterizer import NumpyRasterizer
 from sketch.scene import Scene
 from sketch.sounds import AudioSampler
+from sketch.sounds import StreamingAudioSampler
+from sketch.sounds import VoiceManager
+from sketch.sprites import SpriteCache
 from sketch.util.color import Color
 from sketch.util.point import Point
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from copy import copy
 from tqdm import tqdm
-import cv2
-import moviepy.editor as mp
+from typing import Dict, Optional
+import math
 import numpy as np
-from typing import Dict
+import os
+import queue
+import threading
+import uuid
+
+
+class PipelineAborted(Exception):
+  """
+  Raised in one pipeline stage when another stage has failed.
+  """
+  pass
+
+
+def _put(q:queue.Queue, item, failed:threading.Event)->None:
+  # Blocks like q.put, but gives up if another stage failed
+  while True:
+    if failed.is_set():
+      raise PipelineAborted()
+    try:
+      q.put(item, timeout=0.1)
+      return
+    except queue.Full:
+      pass
+
+
+def _get(q:queue.Queue, failed:threading.Event):
+  # Blocks like q.get, but gives up if another stage failed
+  while True:
+    if failed.is_set():
+      raise PipelineAborted()
+    try:
+      return q.get(timeout=0.1)
+    except queue.Empty:
+      pass
+
+
+def step_to(
+    scene:Scene,
+    frame_time:float,
+    timestep:float,
+    audio_sampler:AudioSampler,
+    interpolate:bool=False,
+)->float:
+  """
+  Steps scene by timestep until its clock reaches frame_time, give or take
+  half a step. If interpolate, the scene saves its transforms before the
+  last step. Returns how far through the last step frame_time is, from 0
+  to 1, to draw the frame with.
+  """
+  # Half a step of slack, so float error in the clock can't add a step
+  end = frame_time - timestep / 2
+  while scene.clock < end:
+    if interpolate and scene.clock + timestep >= end:
+      scene.save_transforms()
+    scene.step(timestep, audio_sampler=audio_sampler)
+    # Lets a streaming sampler write out what can't change any more
+    audio_sampler.advance(scene.clock)
+  return min(1 - (scene.clock - frame_time) / timestep, 1)
+
+
+def _interpolated(scene:Scene, alpha:float):
+  # Only Scenes interpolate, and only frames between steps need it
+  if alpha < 1:
+    return scene.interpolated(alpha)
+  return nullcontext()
+
+
+def draw_frame(
+    scene:Scene,
+    canvas:Canvas,
+    rasterizer:Optional[NumpyRasterizer]=None,
+    alpha:float=1,
+)->None:
+  """
+  Draws scene onto canvas, with PIL, or through a command buffer that
+  rasterizer fills if given. alpha is from step_to.
+  """
+  if rasterizer is None:
+    with _interpolated(scene, alpha):
+      scene.draw(canvas.draw_ctx, canvas)
+  else:
+    commands = DrawCommandBuffer(
+        draws_sprites=canvas.sprite_cache is not None
+    )
+    with _interpolated(scene, alpha):
+      scene.draw(commands)
+    with scene.profiler.section("rasterize", "draw"):
+      rasterizer.replay(commands, canvas)
+
+
+def _render_segment(
+    snapshot:bytes,
+    num_frames:int,
+    start_time:float,
+    timestep:float,
+    physics_timestep:float,
+    interpolate:bool,
+    duration:float,
+    canvas_size:Point,
+    image_format:str,
+    video_encoder:FFmpegEncoder,
+    sprite_cache_size:int=0,
+    draw_backend:str="pil",
+    profile:bool=False,
+)->Optional[Profiler]:
+  """
+  Runs in a worker process. Restores a scene snapshot and records up to
+  num_frames frames of it with video_encoder, the first at start_time plus
+  timestep. Audio triggers are dropped,
+  the parent process collects those. If profile, returns a Profiler of the
+  segment.
+  """
+  scene = Scene.from_snapshot(snapshot)
+  audio_sampler = AudioSampler(duration=duration, out_path=None)
+  profiler = Profiler() if profile else None
+  if profile:
+    scene.profiler = profiler
+    audio_sampler.profiler = profiler
+    video_encoder.profiler = profiler
+  sprite_cache = None
+  if sprite_cache_size > 0:
+    sprite_cache = SpriteCache(max_size=sprite_cache_size)
+  canvas = Canvas(canvas_size, image_format, sprite_cache)
+  rasterizer = NumpyRasterizer() if draw_backend == "numpy" else None
+  video_encoder.open()
+  frame_time = start_time
+  try:
+    for _ in range(num_frames):
+      if frame_time >= duration:
+        break
+      frame_time += timestep
+      alpha = step_to(
+          scene,
+          frame_time,
+          physics_timestep,
+          audio_sampler,
+          interpolate
+      )
+      draw_frame(scene, canvas, rasterizer, alpha)
+      video_encoder.write(canvas.array)
+  finally:
+    video_encoder.close()
+  return profiler
 
-def image_to_array(image):
-  # outputs Height x Width x Channels (weirdly whats expected)
-  data = np.array(image.copy())
-  # Convert colors to BGR
-  data = cv2.cvtColor(data, cv2.COLOR_RGB2BGR)
-  return data
 
 class Recorder(object):
   """
@@ -30,7 +178,26 @@ class Recorder(object):
       canvas_size:Point,
       duration:float,
       silence_pbar=False,
-      tmp_dir="/tmp"
+      tmp_dir="/tmp",
+      encoder:str="ffmpeg",
+      codec:str="libx264",
+      preset:str="medium",
+      crf:int=23,
+      threads:int=0,
+      pipeline_depth:int=0,
+      workers:int=1,
+      start_time:Optional[float]=None,
+      resume_from:Optional[Path]=None,
+      checkpoint_every:Optional[float]=None,
+      checkpoint_dir:Optional[Path]=None,
+      sprite_cache_size:int=0,
+      draw_backend:str="pil",
+      profile_path:Optional[Path]=None,
+      stream_audio:bool=False,
+      max_voices:Optional[int]=None,
+      retrigger_cooldown:float=0,
+      merge_window:float=0,
+      physics_rate:Optional[float]=None,
   ):
     """
     Recorder uses scene to generate scenes that are written as a video.
@@ -38,9 +205,42 @@ class Recorder(object):
     framerate - frames per second
     out_path - where to put the video. Expected to be a .mp4
     canvas_size - x/y = width/height of output video
-    duration - seconds long the video is
+    duration - scene time, in seconds, at which the video ends
     silence_pbar - if true, don't tqdm
-    tmp_dir - used to write a mp4 and a wav. These will get merged.
+    tmp_dir - used to write a mp4 and a wav. These will get merged. Names
+      are unique, so recorders running at once can share it.
+    encoder - "ffmpeg" streams frames into one ffmpeg process and muxes the
+      audio without re-encoding the video. "opencv" writes with
+      cv2.VideoWriter and re-encodes with moviepy to add audio.
+    codec, preset, crf, threads - ffmpeg encoder settings
+    pipeline_depth - if positive, simulation, rasterization and encoding run
+      on separate threads, with up to this many frames queued between each.
+      Otherwise, each frame is stepped, drawn and encoded in turn.
+    workers - if more than one, the video is split into this many segments
+      that are drawn and encoded by a pool of processes, then joined.
+      Requires the ffmpeg encoder and a scene with a background color.
+    start_time - scene time at which the video starts. The scene is stepped
+      up to this point without drawing or encoding anything. Defaults to
+      the scene's clock.
+    resume_from - a checkpoint to load into the scene before anything else.
+    checkpoint_every - if set, Scene.save_checkpoint is written to
+      checkpoint_dir (default tmp_dir) every this many seconds of scene time.
+    sprite_cache_size - if positive, entities that support it are drawn as
+      anti-aliased sprites, and up to this many are kept for reuse.
+    draw_backend - "pil" draws each shape with PIL ImageDraw. "numpy"
+      records each frame's draw calls and fills runs of shapes together
+      with NumpyRasterizer. The scene's static layer is PIL only.
+    profile_path - if set, each stage of the render is timed, a summary
+      table is printed at the end, and a Chrome trace is written here.
+    stream_audio - if true, audio is mixed as the scene runs and written to
+      the wav in tmp_dir block by block, so memory doesn't grow with
+      duration. The wav is 44.1kHz 16 bit mono.
+    max_voices, retrigger_cooldown, merge_window - if any is set, the scene
+      triggers sounds through a VoiceManager with these limits.
+    physics_rate - if set, the scene is stepped this many times a second,
+      at least framerate, rather than once a frame. Each frame is drawn with
+      moving entities between where they were at the steps either side of
+      it. Sounds are still triggered at the step they happen in.
     """
     tmp_dir = Path(tmp_dir)
     assert tmp_dir.is_dir(), f"Cannot find dir: {tmp_dir}"
@@ -58,64 +258,324 @@ class Recorder(object):
     assert self.out_path.suffix == ".mp4", "Must write MP4 file."
     assert self.canvas_size.is_positive(), "Must supply positive canvas size."
     assert 0 < self.duration, "Invalid end time."
+    assert encoder in ("ffmpeg", "opencv"), f"Unknown encoder: {encoder}"
+    assert pipeline_depth >= 0, "Pipeline depth cannot be negative."
+    self.pipeline_depth = pipeline_depth
+    assert workers >= 1, "Need at least one worker."
+    assert workers == 1 or encoder == "ffmpeg", \
+        "Parallel rendering needs the ffmpeg encoder."
+    assert workers == 1 or pipeline_depth == 0, \
+        "Parallel rendering cannot be pipelined."
+    self.workers = workers
+    self._in_context = False
+
+    if resume_from is not None:
+      self.scene.load_checkpoint(resume_from)
+    if start_time is None:
+      start_time = self.scene.clock
+    self.start_time = start_time
+    assert self.start_time < self.duration, "Start time is after the end."
+    assert checkpoint_every is None or checkpoint_every > 0, \
+        "Checkpoint interval must be positive."
+    self.checkpoint_every = checkpoint_every
+    self.checkpoint_dir = Path(
+        checkpoint_dir if checkpoint_dir is not None else self.tmp_dir
+    )
+    if self.checkpoint_every is not None:
+      assert self.checkpoint_dir.is_dir(), \
+          f"Cannot find dir: {self.checkpoint_dir}"
+    self._next_checkpoint = None
+    assert draw_backend in ("pil", "numpy"), \
+        f"Unknown draw backend: {draw_backend}"
+    self.draw_backend = draw_backend
+    self.rasterizer = None
+    if draw_backend == "numpy":
+      self.rasterizer = NumpyRasterizer()
+    assert sprite_cache_size >= 0, "Sprite cache size cannot be negative."
+    self.sprite_cache_size = sprite_cache_size
+    self.sprite_cache = None
+    if sprite_cache_size > 0:
+      self.sprite_cache = SpriteCache(max_size=sprite_cache_size)
 
-    self.video_writer = None
     self.timestep = 1.0/float(self.framerate)
+    assert physics_rate is None or physics_rate >= self.framerate, \
+        "Physics rate cannot be below the framerate."
+    self.interpolate = physics_rate is not None
+    self.physics_timestep = self.timestep
+    if physics_rate is not None:
+      self.physics_timestep = 1.0/float(physics_rate)
+    # Scene time of the last frame made
+    self._frame_time = None
     self.image_format = "RGBA"
 
-    self.tmp_video = self.tmp_dir.joinpath("__video__.mp4")
-    if self.tmp_video.is_file():
-      print("Warning, removing", self.tmp_video)
-      self.tmp_video.unlink()
-
-    self.tmp_audio = self.tmp_dir.joinpath("__audio__.wav")
-    if self.tmp_audio.is_file():
-      print("Warning, removing", self.tmp_audio)
-      self.tmp_audio.unlink()
-    self.audio_sampler = AudioSampler(
-        duration=duration,
-        out_path=self.tmp_audio
+    # Unique per recorder, so renders can share tmp_dir
+    token = f"{os.getpid()}_{uuid.uuid4().hex[:8]}"
+    self.tmp_video = self.tmp_dir.joinpath(f"__video_{token}__.mp4")
+    self.tmp_audio = self.tmp_dir.joinpath(f"__audio_{token}__.wav")
+    sampler_type = StreamingAudioSampler if stream_audio else AudioSampler
+    self.audio_sampler = sampler_type(
+        duration=duration - self.start_time,
+        out_path=self.tmp_audio,
+        start_time=self.start_time,
     )
 
+    # What the scene triggers sounds on
+    self.voices = self.audio_sampler
+    if max_voices is not None or retrigger_cooldown > 0 or merge_window > 0:
+      self.voices = VoiceManager(
+          self.audio_sampler,
+          max_voices=max_voices,
+          cooldown=retrigger_cooldown,
+          merge_window=merge_window,
+      )
+
+    self.profile_path = profile_path
+    self.profiler = NULL_PROFILER
+    if profile_path is not None:
+      self.profiler = Profiler()
+      self.scene.profiler = self.profiler
+      self.audio_sampler.profiler = self.profiler
+
+    if encoder == "ffmpeg":
+      self.video_encoder = FFmpegEncoder(
+          path=self.tmp_video,
+          framerate=self.framerate,
+          canvas_size=self.canvas_size,
+          image_format=self.image_format,
+          codec=codec,
+          preset=preset,
+          crf=crf,
+          threads=threads,
+      )
+    else:
+      self.video_encoder = OpenCVEncoder(
+          path=self.tmp_video,
+          framerate=self.framerate,
+          canvas_size=self.canvas_size,
+      )
+    self.video_encoder.profiler = self.profiler
+
 
   def __enter__(self):
-    self.video_writer = cv2.VideoWriter(
-        str(self.tmp_video),
-        cv2.VideoWriter_fourcc(*"avc1"),
-        self.framerate,
-        (self.canvas_size.x, self.canvas_size.y)
-    )
+    if self.workers == 1:
+      # Otherwise, each worker opens its own
+      self.video_encoder.open()
     self.audio_sampler.clear()
+    self._in_context = True
     return self
 
   def __exit__(self, *options):
-    self.video_writer.release()
-    self.video_writer = None
-    self.audio_sampler.export()
-
-    mp.VideoFileClip(str(self.tmp_video)).set_audio(
-      mp.AudioFileClip(str(self.tmp_audio))
-    ).write_videofile(str(self.out_path))
-
+    self._in_context = False
+    if self.video_encoder.is_open:
+      self.video_encoder.close()
+    with self.profiler.section("mux", "video"):
+      self.video_encoder.mux(self.audio_sampler, self.out_path)
     self.tmp_video.unlink()
-    self.tmp_audio.unlink()
+    if self.profile_path is not None:
+      self.profiler.write_chrome_trace(self.profile_path)
+      print(self.profiler.summary())
     return False
 
+  def _fast_forward(self)->None:
+    """
+    Steps the scene up to start_time. Nothing is drawn or encoded, but
+    audio triggers are kept, so sounds started earlier carry over.
+    """
+    step_to(self.scene, self.start_time, self.physics_timestep, self.voices)
+
+  def _step_frame(self)->float:
+    """
+    Steps the scene up to the next frame's time. Returns its alpha, see
+    step_to.
+    """
+    self._frame_time += self.timestep
+    return step_to(
+        self.scene,
+        self._frame_time,
+        self.physics_timestep,
+        self.voices,
+        self.interpolate
+    )
+
+  def _maybe_checkpoint(self)->None:
+    if self._next_checkpoint is None:
+      return
+    if self.scene.clock < self._next_checkpoint - self.timestep / 2:
+      return
+    frame_idx = round(self.scene.clock * self.framerate)
+    self.scene.save_checkpoint(
+        self.checkpoint_dir.joinpath(f"checkpoint_{frame_idx:08d}.ckpt")
+    )
+    self._next_checkpoint += self.checkpoint_every
+
   def record(self):
     """
     Actually runs the scene, makes a frame, draws the frame, outputs results.
     """
-    assert self.video_writer is not None, "Record called outside of context"
-    pbar = tqdm(total=self.duration, disable=self.silence_pbar)
-    # we're going to constantly write to this
-    frame = Image.new(
-        self.image_format,
-        (self.canvas_size.x, self.canvas_size.y),
+    assert self._in_context, "Record called outside of context"
+    self._fast_forward()
+    self._frame_time = self.scene.clock
+    if self.checkpoint_every is not None:
+      self._next_checkpoint = self.scene.clock + self.checkpoint_every
+    pbar = tqdm(
+        total=self.duration - self.start_time,
+        disable=self.silence_pbar
     )
-    draw_ctx = ImageDraw.Draw(frame)
-    while self.scene.clock < self.duration:
-      self.scene.step(self.timestep, audio_sampler=self.audio_sampler)
+    if self.workers > 1:
+      self._record_parallel(pbar)
+      return
+    if self.pipeline_depth > 0:
+      self._record_pipelined(pbar)
+      return
+    # we're going to constantly write to this
+    canvas = Canvas(self.canvas_size, self.image_format, self.sprite_cache)
+    while self._frame_time < self.duration:
+      alpha = self._step_frame()
+      self._maybe_checkpoint()
       pbar.update(self.timestep)
-      self.scene.draw(draw_ctx)
-      frame_data = image_to_array(frame)
-      self.video_writer.write(frame_data)
+      draw_frame(self.scene, canvas, self.rasterizer, alpha)
+      self.video_encoder.write(canvas.array)
+
+  def _record_pipelined(self, pbar:tqdm):
+    """
+    Same output as record, in three stages connected by bounded queues:
+    this thread steps the scene and snapshots each frame as draw commands,
+    a rasterizer thread replays them onto a pool of canvases, and an encoder
+    thread writes finished canvases. Full queues block the stage before.
+    """
+    draw_queue = queue.Queue(maxsize=self.pipeline_depth)
+    encode_queue = queue.Queue(maxsize=self.pipeline_depth)
+    # One canvas per queued frame, plus the ones being drawn and encoded
+    free_canvases = queue.Queue()
+    for _ in range(self.pipeline_depth + 2):
+      # The cache is only used from the rasterizer thread
+      free_canvases.put(
+          Canvas(self.canvas_size, self.image_format, self.sprite_cache)
+      )
+    # Without a background, each frame draws over the one before
+    accumulate = self.scene.background_color is None
+    failed = threading.Event()
+    errors = []
+
+    def rasterize():
+      last_canvas = None
+      try:
+        while True:
+          commands = _get(draw_queue, failed)
+          if commands is None:
+            break
+          canvas = _get(free_canvases, failed)
+          if accumulate and last_canvas is not None:
+            np.copyto(canvas.array, last_canvas.array)
+          with self.profiler.section("rasterize", "draw"):
+            if self.rasterizer is None:
+              commands.replay(canvas.draw_ctx)
+            else:
+              self.rasterizer.replay(commands, canvas)
+          _put(encode_queue, canvas, failed)
+          last_canvas = canvas
+        _put(encode_queue, None, failed)
+      except BaseException as e:
+        errors.append(e)
+        failed.set()
+
+    def encode():
+      try:
+        while True:
+          canvas = _get(encode_queue, failed)
+          if canvas is None:
+            break
+          self.video_encoder.write(canvas.array)
+          free_canvases.put(canvas)
+      except BaseException as e:
+        errors.append(e)
+        failed.set()
+
+    workers = [
+        threading.Thread(target=rasterize, name="rasterize"),
+        threading.Thread(target=encode, name="encode"),
+    ]
+    for worker in workers:
+      worker.start()
+    try:
+      while self._frame_time < self.duration:
+        alpha = self._step_frame()
+        self._maybe_checkpoint()
+        pbar.update(self.timestep)
+        commands = DrawCommandBuffer(
+            draws_sprites=self.sprite_cache is not None
+        )
+        with _interpolated(self.scene, alpha):
+          self.scene.draw(commands)
+        _put(draw_queue, commands, failed)
+      _put(draw_queue, None, failed)
+    except BaseException as e:
+      errors.append(e)
+      failed.set()
+    for worker in workers:
+      worker.join()
+    # Report the original failure, not the stages it aborted
+    for error in errors:
+      if not isinstance(error, PipelineAborted):
+        raise error
+
+  def _record_parallel(self, pbar:tqdm):
+    """
+    Same output as record. This process only steps the scene, collecting
+    audio and taking a snapshot at the start of each segment. Each snapshot
+    goes to a worker process that draws and encodes its segment, while the
+    simulation moves on. The segments are then joined without re-encoding.
+    """
+    assert self.scene.background_color is not None, \
+        "Segments can't draw over earlier frames without a background."
+    segment_frames = math.ceil(
+        (self.duration - self.start_time) * self.framerate / self.workers
+    )
+    segment_paths = []
+    futures = []
+    with ProcessPoolExecutor(max_workers=self.workers) as pool:
+      frame_idx = 0
+      while self._frame_time < self.duration:
+        if frame_idx % segment_frames == 0:
+          segment_path = self.tmp_video.with_name(
+              f"{self.tmp_video.stem}_{len(segment_paths)}.mp4"
+          )
+          segment_encoder = copy(self.video_encoder)
+          segment_encoder.path = segment_path
+          # Workers time themselves and send the results back
+          segment_encoder.profiler = NULL_PROFILER
+          segment_paths.append(segment_path)
+          futures.append(pool.submit(
+              _render_segment,
+              snapshot=self.scene.snapshot(),
+              num_frames=segment_frames,
+              start_time=self._frame_time,
+              timestep=self.timestep,
+              physics_timestep=self.physics_timestep,
+              interpolate=self.interpolate,
+              duration=self.duration,
+              canvas_size=self.canvas_size,
+              image_format=self.image_format,
+              video_encoder=segment_encoder,
+              sprite_cache_size=self.sprite_cache_size,
+              draw_backend=self.draw_backend,
+              profile=self.profiler.enabled,
+          ))
+        self._step_frame()
+        self._maybe_checkpoint()
+        pbar.update(self.timestep)
+        frame_idx += 1
+      try:
+        for future in futures:
+          segment_profiler = future.result()
+          if segment_profiler is not None:
+            self.profiler.merge(
+                segment_profiler.events,
+                segment_profiler.counts
+            )
+        with self.profiler.section("concat", "video"):
+          self.video_encoder.concat(segment_paths)
+      finally:
+        for segment_path in segment_paths:
+          if segment_path.is_file():
+            segment_path.unlink()
@@ -0,0 +1,168 @@
+"""
+An on-disk cache of decoded audio samples.
+
+Decoding a sample means an ffmpeg subprocess. SampleCache keeps each
+decoded, volume adjusted and trimmed sample as a .npy file named after a
+hash of the source file's contents and those settings, and loads it back
+memory mapped. Later renders, and every worker process, then share the
+decoded audio through the page cache instead of decoding it again.
+"""
+from pathlib import Path
+from typing import Callable, Optional
+import hashlib
+import json
+import numpy as np
+import os
+import pydub
+import tempfile
+
+# Bump when the cached layout changes, so old entries are ignored
+CACHE_VERSION = 1
+
+
+class CachedSample(object):
+  """
+  A decoded sample in a SampleCache. Raw PCM bytes, memory mapped on first
+  use, along with their format.
+  """
+  def __init__(
+      self,
+      cache:"SampleCache",
+      key:str,
+      frame_rate:int,
+      channels:int,
+      sample_width:int,
+  ):
+    self.cache = cache
+    self.key = key
+    self.frame_rate = frame_rate
+    self.channels = channels
+    self.sample_width = sample_width
+    self._data = None
+
+  def __getstate__(self):
+    # Other processes map the file themselves, rather than get a copy
+    state = self.__dict__.copy()
+    state["_data"] = None
+    return state
+
+  @property
+  def data(self)->np.ndarray:
+    if self._data is None:
+      self._data = self.cache.load_array(self.key)
+    return self._data
+
+  def __len__(self):
+    """
+    Milliseconds, as for pydub.AudioSegment.
+    """
+    frames = len(self.data) // (self.sample_width * self.channels)
+    return round(1000 * frames / self.frame_rate)
+
+  def to_audio_segment(self)->pydub.AudioSegment:
+    return pydub.AudioSegment(
+        data=self.data.tobytes(),
+        sample_width=self.sample_width,
+        frame_rate=self.frame_rate,
+        channels=self.channels,
+    )
+
+
+class SampleCache(object):
+  """
+  Content addressed store of decoded samples, and of arrays derived from
+  them, in cache_dir. Safe to share between processes, entries are written
+  to a temporary file and renamed into place.
+  """
+  def __init__(self, cache_dir:Path):
+    self.cache_dir = Path(cache_dir)
+    self.cache_dir.mkdir(parents=True, exist_ok=True)
+    # (path, size, mtime) -> content hash, so files are read once per run
+    self._file_hashes = {}
+
+  def __getstate__(self):
+    state = self.__dict__.copy()
+    state["_file_hashes"] = {}
+    return state
+
+  def file_hash(self, path:Path)->str:
+    path = Path(path).resolve()
+    stat = path.stat()
+    memo_key = (str(path), stat.st_size, stat.st_mtime_ns)
+    if memo_key not in self._file_hashes:
+      digest = hashlib.sha256()
+      with open(path, "rb") as sample_file:
+        for chunk in iter(lambda: sample_file.read(1 << 20), b""):
+          digest.update(chunk)
+      self._file_hashes[memo_key] = digest.hexdigest()
+    return self._file_hashes[memo_key]
+
+  def _path(self, key:str, suffix:str)->Path:
+    return self.cache_dir.joinpath(f"{key}{suffix}")
+
+  def _write(self, path:Path, write:Callable[[str], None])->None:
+    # Written beside the destination, so the rename is atomic
+    handle, tmp_path = tempfile.mkstemp(
+        dir=self.cache_dir,
+        suffix=path.suffix
+    )
+    os.close(handle)
+    try:
+      write(tmp_path)
+      os.replace(tmp_path, path)
+    finally:
+      if os.path.exists(tmp_path):
+        os.unlink(tmp_path)
+
+  def load_array(self, key:str)->np.ndarray:
+    return np.load(self._path(key, ".npy"), mmap_mode="r")
+
+  def array(self, key:str, make:Callable[[], np.ndarray])->np.ndarray:
+    """
+    Returns the array stored under key, memory mapped, storing make() there
+    first if there is none.
+    """
+    path = self._path(key, ".npy")
+    if not path.is_file():
+      array = np.ascontiguousarray(make())
+      self._write(path, lambda tmp_path: np.save(tmp_path, array))
+    return self.load_array(key)
+
+  def load(
+      self,
+      sample_path:Path,
+      volume:float,
+      duration:Optional[float],
+      decode:Callable[[], pydub.AudioSegment],
+  )->CachedSample:
+    """
+    Returns the sample at sample_path with volume and duration applied,
+    calling decode to make it only if it isn't cached yet.
+    """
+    key = hashlib.sha256(json.dumps([
+        CACHE_VERSION,
+        self.file_hash(sample_path),
+        volume,
+        duration,
+    ]).encode()).hexdigest()
+    meta_path = self._path(key, ".json")
+    # Either file may have been evicted since
+    if not (meta_path.is_file() and self._path(key, ".npy").is_file()):
+      sample = decode()
+      self.array(
+          key,
+          lambda: np.frombuffer(sample.raw_data, dtype=np.uint8)
+      )
+      meta = {
+          "frame_rate": sample.frame_rate,
+          "channels": sample.channels,
+          "sample_width": sample.sample_width,
+      }
+      def write_meta(tmp_path):
+        with open(tmp_path, "w") as meta_file:
+          json.dump(meta, meta_file)
+      # Written last, so the entry is complete once both files are there
+      self._write(meta_path, write_meta)
+    with open(meta_path) as meta_file:
+      meta = json.load(meta_file)
+    return CachedSample(cache=self, key=key, **meta)
@@ -1,20 +1,84 @@
+from sketch.canvas import Canvas
+from sketch.collision_batch import collide_circle_poly_pairs
+from sketch.collision_batch import is_circle_poly_pair
 from sketch.entities.entity import Entity
+from sketch.entities.entity import reverse_response
+from sketch.entities.physics_entity import PhysicsArrays
+from sketch.entities.physics_entity import PhysicsCircle
+from sketch.entities.physics_entity import PhysicsEntity
+from sketch.profiler import NULL_PROFILER
+from sketch.swept_collision import circle_poly_time_of_impact
 from sketch.util.point import Point
 from sketch.util.color import Color
-from typing import List, Optional
+from sketch.util.spatial_hash import SpatialHash
+from bisect import insort
+from contextlib import contextmanager
+from operator import attrgetter
+from pathlib import Path
+from typing import Iterator, List, Optional, Set, Tuple
+import math
+import numpy as np
+import pickle
+import random
 from PIL.ImageDraw import Draw
 from sketch.sounds import AudioSampler
+import collision
 
 class Scene(object):
   """
   A scene is something that updates and draws entities each frame.
   """
+  # Past this many moving entities, copying the whole static layer is
+  # cheaper than restoring each one's rectangle.
+  max_dirty_rects = 32
+  # How far past the point of impact a swept circle is left, so that the
+  # narrow phase sees the hit and responds to it as usual.
+  sweep_skin = 1e-3
+
   def __init__(
       self,
       canvas_size:Point,
       background_color:Optional[Color]=None,
       entities:List[Entity]=None,
+      broad_phase:bool=True,
+      collision_cell_size:Optional[float]=None,
+      vectorized_physics:bool=False,
+      batched_narrow_phase:bool=True,
+      static_layer:bool=True,
+      dirty_rects:bool=True,
+      skip_sleeping:bool=True,
+      continuous_collision:bool=False,
   ):
+    """
+    canvas_size - x/y = width/height of the drawing area
+    background_color - if set, cleared to this color before each draw
+    entities - everything updated and drawn by this scene
+    broad_phase - if true, a spatial hash finds candidate collision pairs
+      and each pair is checked once. Otherwise, every entity checks every
+      partner in collides_with.
+    collision_cell_size - width of a broad phase cell. Defaults to the mean
+      extent of the collidable entities, recomputed each frame.
+    vectorized_physics - if true, the motion of all PhysicsEntities is kept
+      in shared NumPy arrays and integrated in one call per step.
+    batched_narrow_phase - if true (and broad_phase is on), all candidate
+      circle vs polygon pairs are checked together with NumPy.
+    static_layer - if true (and background_color is set), the background
+      and the static entities below and above every moving one are drawn
+      once into a cached layer, which is copied onto the canvas each frame.
+      Static entities above are only drawn again where moving entities go
+      under them. Only used when draw is given the canvas.
+    dirty_rects - if true (and static_layer is on), only the parts of the
+      canvas where moving entities were drawn last frame are restored from
+      the cached layer.
+    skip_sleeping - if true, entities that report is_sleeping are not
+      stepped or prepared for collisions, and only get collision_step after
+      colliding. Needs broad_phase to know who collided.
+    continuous_collision - if true, moving PhysicsCircles are swept along
+      each step's motion against the frozen polygons they collide with, and
+      stopped at the first one they hit instead of passing through it. They
+      spend the rest of the step moving on from the hit. Allows much longer
+      timesteps with fast circles and thin polygons.
+    """
     if entities is not None:
       self.entities = entities
     else:
@@ -27,39 +91,546 @@ class Scene(object):
     self.canvas_size = canvas_size.copy()
     self._clock = 0
     self._ordered = False
+    self.broad_phase = broad_phase
+    assert collision_cell_size is None or collision_cell_size > 0, \
+        "Cell size must be positive."
+    self.collision_cell_size = collision_cell_size
+    self.vectorized_physics = vectorized_physics
+    self.batched_narrow_phase = batched_narrow_phase
+    self._physics_arrays = None
+    self._physics_stale = False
+    self.static_layer = static_layer
+    self.dirty_rects = dirty_rects
+    self._reset_layer()
+    self.skip_sleeping = skip_sleeping
+    # id -> bounds of each entity skipped last step
+    self._sleeping = {}
+    # Active entities that were awake last step, in action order, or None
+    # to sort every entity out again
+    self._awake = None
+    # id -> action_order position, taken when everything was sorted out
+    self._order_index = {}
+    # id -> entity for each inactive or sleeping entity left out of _awake,
+    # checked again each step
+    self._resting = {}
+    # id -> entity passed to wake since last step
+    self._recheck = {}
+    # id -> entity for each entity told about a collision during this step
+    self._woken = {}
+    self.continuous_collision = continuous_collision
+    # id -> (bounds, points) of each frozen polygon swept against, or None
+    # if it isn't one. Kept while the entity sleeps.
+    self._obstacles = {}
+    # (entity, x, y, angle) of each awake entity, see save_transforms
+    self._saved_transforms = []
+    # Times the phases of step and draw, see sketch.profiler
+    self.profiler = NULL_PROFILER
+
+  def _reset_layer(self)->None:
+    # Pre-rendered static layer, and the entities/transforms it was made of
+    self._layer = None
+    self._layer_key = None
+    # The layer without the static entities above moving ones, and each of
+    # those entities with the pixels it covers
+    self._under_layer = None
+    self._top_rects = []
+    # The canvas drawn last, and where moving entities were drawn on it.
+    # A None list means anywhere.
+    self._last_canvas = None
+    self._last_dirty = None
+
+  def __getstate__(self):
+    state = self.__dict__.copy()
+    # Caches of drawn pixels, rebuilt on the next draw
+    for key in (
+        "_layer",
+        "_layer_key",
+        "_under_layer",
+        "_last_canvas",
+        "_last_dirty",
+    ):
+      state[key] = None
+    state["_top_rects"] = []
+    # Keyed on object ids, which are meaningless in another process
+    state["_sleeping"] = {}
+    state["_awake"] = None
+    state["_order_index"] = {}
+    state["_resting"] = {}
+    state["_recheck"] = {}
+    state["_woken"] = {}
+    state["_obstacles"] = {}
+    # Whoever profiles the copy attaches their own
+    state["profiler"] = NULL_PROFILER
+    return state
 
   @property
   def clock(self):
     return self._clock
 
+  def snapshot(self)->bytes:
+    """
+    Serializes the whole scene, along with the state of the random module,
+    so that from_snapshot continues exactly where this scene is now.
+    """
+    return pickle.dumps(
+        (self, random.getstate()),
+        protocol=pickle.HIGHEST_PROTOCOL
+    )
+
+  def save_checkpoint(self, path:Path)->None:
+    """
+    Writes the changing state of this scene (clock, random module state and
+    each entity's get_state) to path. Unlike snapshot, this leaves out
+    everything fixed when the scene was built, so it is small, and only
+    meaningful to a scene built the same way.
+    """
+    checkpoint = {
+        "clock": self._clock,
+        "random_state": random.getstate(),
+        "entities": [entity.get_state() for entity in self.entities],
+    }
+    with open(path, "wb") as checkpoint_file:
+      pickle.dump(checkpoint, checkpoint_file, protocol=pickle.HIGHEST_PROTOCOL)
+
+  def load_checkpoint(self, path:Path)->None:
+    """
+    Restores a save_checkpoint from a scene built the same way as this one.
+    This also restores the random module.
+    """
+    with open(path, "rb") as checkpoint_file:
+      checkpoint = pickle.load(checkpoint_file)
+    assert len(checkpoint["entities"]) == len(self.entities), \
+        "Checkpoint is from a different scene."
+    for entity, state in zip(self.entities, checkpoint["entities"]):
+      entity.set_state(state)
+    # Entities may have moved while asleep
+    self._sleeping = {}
+    self._awake = None
+    self._clock = checkpoint["clock"]
+    random.setstate(checkpoint["random_state"])
+
+  @classmethod
+  def from_snapshot(cls, snapshot:bytes)->"Scene":
+    """
+    Rebuilds a scene from snapshot. This also restores the random module.
+    """
+    scene, random_state = pickle.loads(snapshot)
+    random.setstate(random_state)
+    return scene
+
   def step(self, timestep:float, audio_sampler:AudioSampler):
     self._establish_order()
     self._clock += timestep
+    starts = None
+    if self.continuous_collision:
+      starts = self._sweep_starts()
+    if self._physics_arrays is not None:
+      self._physics_arrays.integrate(timestep)
+    profiler = self.profiler
+    awake = self._wake_order()
+    profiler.count_classes("step", awake)
     # All Step
-    for entity in self.action_order:
-      if entity.active:
+    with profiler.section("step", "scene"):
+      for entity in awake:
         entity.step(timestep=timestep, scene=self, audio_sampler=audio_sampler)
+    if starts is not None:
+      with profiler.section("sweep", "scene"):
+        self._sweep_step(starts)
     # All prepare for collisions
-    for entity in self.action_order:
-      if entity.active:
+    with profiler.section("pre_collision", "scene"):
+      for entity in awake:
         entity.pre_collision()
     # All check collisions
-    for entity in self.action_order:
-      if entity.active:
-        entity.check_collisions()
+    self._woken = {}
+    with profiler.section("check_collisions", "scene"):
+      if self.broad_phase:
+        pairs = self._candidate_pairs()
+        if self.batched_narrow_phase:
+          pairs = self._collide_pairs_batched(pairs)
+        for a, b in pairs:
+          self._collide_pair(a, b)
+      else:
+        for entity in self.action_order:
+          if entity.active:
+            entity.check_collisions()
     # Update based on collisions
-    for entity in self.action_order:
-      if entity.active:
+    if len(self._sleeping) > 0:
+      sleeping = self._sleeping
+      woken = [e for key, e in self._woken.items() if key in sleeping]
+      if len(woken) > 0:
+        awake = self._in_action_order(awake + woken)
+      awake = [e for e in awake if e.active]
+    profiler.count_classes("collision_step", awake)
+    with profiler.section("collision_step", "scene"):
+      for entity in awake:
         entity.collision_step(
             timestep=timestep,
             scene=self,
             audio_sampler=audio_sampler
         )
 
+  def save_transforms(self)->None:
+    """
+    Keeps the position and angle of every active entity, so that
+    interpolated can draw them between now and a later step. Sleeping ones
+    are kept too, in case they wake before then, and are skipped if they
+    didn't move.
+    """
+    saved = []
+    for entity in self.entities:
+      entity._teleported = False
+      if entity.active:
+        position = entity.position
+        saved.append((entity, position.x, position.y, entity.angle))
+    self._saved_transforms = saved
+
+  @contextmanager
+  def interpolated(self, alpha:float)->Iterator[None]:
+    """
+    Within this context, entities kept by save_transforms are placed alpha
+    of the way from where they were then to where they are now, for drawing
+    a frame that falls between steps. Entities put somewhere since are
+    left where they are. Everything is moved back on exit.
+    """
+    moved = []
+    for entity, x, y, angle in self._saved_transforms:
+      if entity._teleported:
+        continue
+      position = entity.position
+      now = (position.x, position.y, entity.angle)
+      if now == (x, y, angle):
+        continue
+      position.set((x + alpha*(now[0]-x), y + alpha*(now[1]-y)))
+      entity.angle = angle + alpha*(now[2]-angle)
+      # Some entities draw their collision shape
+      entity._sync_collision_shape()
+      moved.append((entity, now))
+    try:
+      yield
+    finally:
+      for entity, (x, y, angle) in moved:
+        entity.position.set((x, y))
+        entity.angle = angle
+        entity._sync_collision_shape()
+
+  def _sweep_starts(self)->List[Tuple[PhysicsCircle, float, float]]:
+    """
+    Returns each circle that may be swept this step, with its position
+    before moving.
+    """
+    starts = []
+    for entity in self.action_order:
+      if (
+          entity.active
+          and isinstance(entity, PhysicsCircle)
+          and len(entity.collides_with) > 0
+          and not entity.frozen
+      ):
+        starts.append((entity, entity.position.x, entity.position.y))
+    return starts
+
+  def _sweep_step(self, starts:List[Tuple[PhysicsCircle, float, float]])->None:
+    """
+    Moves each circle back to where it started this step and sweeps it to
+    where it was going.
+    """
+    sleeping = self._sleeping
+    self._obstacles = {
+        key: value for key, value in self._obstacles.items()
+        if key in sleeping
+    }
+    num_hits = 0
+    for entity, x, y in starts:
+      end_x, end_y = entity.position
+      if end_x == x and end_y == y:
+        continue
+      entity.position.set((x, y))
+      entity._unswept = self.sweep(entity, (end_x - x, end_y - y))
+      if entity._unswept > 0:
+        num_hits += 1
+    self.profiler.count("sweep_hits", num_hits)
+
+  def _obstacle(
+      self,
+      entity:Entity,
+  )->Optional[Tuple[Tuple[Tuple[float, float], Tuple[float, float]], list]]:
+    """
+    Bounds and points of entity if it's an active, frozen polygon, else
+    None.
+    """
+    key = id(entity)
+    if key in self._obstacles:
+      return self._obstacles[key]
+    obstacle = None
+    if (
+        entity.active
+        and isinstance(entity, PhysicsEntity)
+        and isinstance(entity.collision_shape, collision.Poly)
+        and entity.frozen
+    ):
+      bounds = self._sleeping.get(key)
+      if bounds is None:
+        bounds = entity.bounds()
+      points = [(p.x, p.y) for p in entity.collision_shape.points]
+      obstacle = (bounds, points)
+    self._obstacles[key] = obstacle
+    return obstacle
+
+  def sweep(self, entity:PhysicsCircle, motion:Tuple[float, float])->float:
+    """
+    Moves entity by motion, stopping just past the first frozen polygon in
+    its way. Returns the fraction of motion left, 0 if nothing was hit.
+    """
+    x, y = entity.position
+    dx, dy = motion
+    radius = entity.radius
+    x_min = min(x, x + dx) - radius
+    x_max = max(x, x + dx) + radius
+    y_min = min(y, y + dy) - radius
+    y_max = max(y, y + dy) + radius
+    first = None
+    for partner in entity.collides_with:
+      obstacle = self._obstacle(partner)
+      if obstacle is None:
+        continue
+      (o_min, o_max), points = obstacle
+      if (
+          o_max[0] < x_min or x_max < o_min[0]
+          or o_max[1] < y_min or y_max < o_min[1]
+      ):
+        continue
+      t = circle_poly_time_of_impact((x, y), (dx, dy), radius, points)
+      if t is not None and (first is None or t < first):
+        first = t
+    if first is None:
+      entity.position.set((x + dx, y + dy))
+      return 0
+    length = math.sqrt(dx*dx + dy*dy)
+    # Never past the end of the motion
+    t = min(first + self.sweep_skin / length, 1)
+    entity.position.set((x + t*dx, y + t*dy))
+    return 1 - t
+
+  def wake(self, entity:Entity)->None:
+    """
+    Checks entity for sleep again next step, retaking its bounds if it's
+    still asleep. Call this after moving a sleeping entity.
+    """
+    key = id(entity)
+    self._sleeping.pop(key, None)
+    self._recheck[key] = entity
+
+  def _wake_order(self)->List[Entity]:
+    """
+    Returns the active entities that are awake, in action order, and
+    records the sleeping ones in _sleeping. Inactive and sleeping entities
+    are set aside, and only rejoin the awake ones, in order, once they're
+    active and awake again.
+    """
+    if not (self.skip_sleeping and self.broad_phase):
+      self._sleeping = {}
+      self._awake = None
+      return [e for e in self.action_order if e.active]
+    sleeping = self._sleeping
+    resting = self._resting
+    if self._awake is None:
+      candidates = self.action_order
+      sleeping.clear()
+      resting.clear()
+      self._recheck = {}
+      self._order_index = {id(e): i for i, e in enumerate(candidates)}
+    else:
+      candidates = self._awake
+      returning = self._recheck
+      self._recheck = {}
+      for key, entity in resting.items():
+        if not entity.active:
+          # May be moved before it's active again
+          sleeping.pop(key, None)
+        elif key not in sleeping or not entity.is_sleeping():
+          returning[key] = entity
+      if len(returning) > 0:
+        for key in returning:
+          resting.pop(key, None)
+        candidates = self._in_action_order(
+            candidates + list(returning.values())
+        )
+    awake = []
+    for entity in candidates:
+      key = id(entity)
+      if not entity.active:
+        resting[key] = entity
+        sleeping.pop(key, None)
+      elif not entity.is_sleeping():
+        awake.append(entity)
+        sleeping.pop(key, None)
+      else:
+        resting[key] = entity
+        if key not in sleeping:
+          # Just fell asleep, so sync the collision shape one last time.
+          entity.pre_collision()
+          sleeping[key] = entity.bounds()
+    self._awake = awake
+    return awake
+
+  def _in_action_order(self, entities:List[Entity])->List[Entity]:
+    """
+    Returns entities without duplicates, sorted into action order.
+    """
+    unique = {id(e): e for e in entities}
+    index = self._order_index
+    return [unique[key] for key in sorted(unique, key=index.__getitem__)]
 
+  def _partner_ids(self, entity:Entity)->Set[int]:
+    """
+    Ids of everything in entity.collides_with. Cached until the list is
+    replaced or changes length.
+    """
+    partners = entity.collides_with
+    key = (id(partners), len(partners))
+    cached = getattr(entity, "_partner_id_cache", None)
+    if cached is None or cached[0] != key:
+      cached = (key, set(map(id, partners)))
+      entity._partner_id_cache = cached
+    return cached[1]
 
-  def draw(self, draw_ctx:Draw):
+  def _candidate_pairs(self)->List[Tuple[Entity, Entity]]:
+    """
+    Buckets all collidable entities into a spatial hash and returns each pair
+    that shares a cell and where at least one side lists the other as a
+    partner. Each pair is returned once.
+    """
+    collidable = []
+    sleeping = self._sleeping
+    for entity in self.action_order:
+      if entity.active and entity.collision_shape is not None:
+        # Sleeping entities haven't moved since their bounds were taken
+        bounds = sleeping.get(id(entity))
+        if bounds is None:
+          bounds = entity.bounds()
+        collidable.append((entity, bounds))
+    if len(collidable) == 0:
+      return []
+    cell_size = self.collision_cell_size
+    if cell_size is None:
+      total_extent = 0
+      for _, ((x_min, y_min), (x_max, y_max)) in collidable:
+        total_extent += max(x_max-x_min, y_max-y_min)
+      cell_size = max(total_extent / len(collidable), 1)
+    grid = SpatialHash(cell_size)
+    for entity, bounds in collidable:
+      grid.insert(entity, bounds)
+    pairs = []
+    seen = set()
+    for a, bounds in collidable:
+      if len(a.collides_with) == 0:
+        continue
+      partners = self._partner_ids(a)
+      for b in grid.query(bounds, among=partners):
+        if b is a:
+          continue
+        key = (id(a), id(b)) if id(a) < id(b) else (id(b), id(a))
+        if key not in seen:
+          seen.add(key)
+          pairs.append((a, b))
+    return pairs
+
+  def _orient_pair(self, a:Entity, b:Entity):
+    """
+    Returns (a, b, a_wants, b_wants), where a is the side the narrow phase
+    should run from, and a/b_wants is whether each side lists the other as
+    a partner.
+    """
+    a_wants = id(b) in self._partner_ids(a)
+    b_wants = id(a) in self._partner_ids(b)
+    # Check from the side that needs a response, so it can be reversed for
+    # the other side if needed.
+    if not a_wants or (
+        b_wants
+        and b._needs_collision_response
+        and not a._needs_collision_response
+    ):
+      return b, a, b_wants, a_wants
+    return a, b, a_wants, b_wants
+
+  def _dispatch_collision(
+      self,
+      a:Entity,
+      b:Entity,
+      a_wants:bool,
+      b_wants:bool,
+      response:Optional[collision.Response],
+  )->None:
+    """
+    Sends on_collision to each side of a colliding pair that wants it.
+    response is from a's point of view.
+    """
+    if a_wants:
+      a.on_collision(b, response)
+      self._woken[id(a)] = a
+    if b_wants:
+      self._woken[id(b)] = b
+      b_response = None
+      if b._needs_collision_response:
+        b_response = reverse_response(response)
+      b.on_collision(a, b_response)
+
+  def _collide_pair(self, a:Entity, b:Entity)->None:
+    """
+    Runs the narrow phase once for a candidate pair and sends on_collision to
+    each side that lists the other as a partner.
+    """
+    a, b, a_wants, b_wants = self._orient_pair(a, b)
+    collided, response = a.check_collision(b)
+    if collided:
+      self._dispatch_collision(a, b, a_wants, b_wants, response)
+
+  def _collide_pairs_batched(
+      self,
+      pairs:List[Tuple[Entity, Entity]]
+  )->List[Tuple[Entity, Entity]]:
+    """
+    Runs the batched narrow phase over every circle vs polygon pair.
+    Returns the pairs it could not handle.
+    """
+    batch = []
+    remaining = []
+    for a, b in pairs:
+      if is_circle_poly_pair(a.collision_shape, b.collision_shape):
+        batch.append(self._orient_pair(a, b))
+      else:
+        remaining.append((a, b))
+    if len(batch) > 0:
+      results = collide_circle_poly_pairs([
+          (a.collision_shape, b.collision_shape, a._needs_collision_response)
+          for a, b, _, _ in batch
+      ])
+      for (a, b, a_wants, b_wants), (collided, response) in zip(
+          batch, results
+      ):
+        if collided:
+          self._dispatch_collision(a, b, a_wants, b_wants, response)
+    return remaining
+
+  def draw(self, draw_ctx:Draw, canvas:Optional[Canvas]=None):
+    """
+    Draws every visible entity in z order.
+    canvas - the canvas draw_ctx draws on, if any. Lets the scene copy its
+      cached static layer onto it, see static_layer and dirty_rects.
+    """
+    with self.profiler.section("draw", "scene"):
+      self._draw(draw_ctx, canvas)
+
+  def _draw(self, draw_ctx:Draw, canvas:Optional[Canvas])->None:
     self._establish_order()
+    if (
+        canvas is not None
+        and self.static_layer
+        and self.background_color is not None
+    ):
+      self._draw_layered(canvas)
+      return
+    self._last_canvas = None
     if self.background_color is not None:
       draw_ctx.rectangle(
         [(0, 0), tuple(self.canvas_size+(1,1))],
@@ -69,12 +640,231 @@ class Scene(object):
       if entity.visible:
         entity.draw(draw_ctx)
 
+  def _static_ends(self)->Tuple[int, int, tuple]:
+    """
+    Returns how many entities, from the bottom and from the top of z_order,
+    can be drawn from the cached layer, and a key that changes whenever
+    their look does. Those on top also need draw_bounds, to know where
+    moving entities go under them.
+    """
+    key = []
+    for entity in self.z_order:
+      if not entity.visible:
+        key.append((id(entity), None))
+      elif entity.is_static():
+        key.append((id(entity), entity.get_draw_transform()))
+      else:
+        break
+    num_bottom = len(key)
+    for entity in reversed(self.z_order[num_bottom:]):
+      if not entity.visible:
+        key.append((id(entity), None))
+      elif entity.is_static() and entity.draw_bounds() is not None:
+        key.append((id(entity), entity.get_draw_transform()))
+      else:
+        break
+    return num_bottom, len(key) - num_bottom, tuple(key)
+
+  def _pixel_rect(self, bounds)->Optional[Tuple[int, int, int, int]]:
+    """
+    Pixel columns/rows (x0, y0, x1, y1) covering bounds, with a margin for
+    rounding, clipped to the canvas. None if it misses the canvas.
+    """
+    (x_min, y_min), (x_max, y_max) = bounds
+    x0 = max(int(math.floor(x_min)) - 2, 0)
+    y0 = max(int(math.floor(y_min)) - 2, 0)
+    x1 = min(int(math.ceil(x_max)) + 3, int(self.canvas_size.x))
+    y1 = min(int(math.ceil(y_max)) + 3, int(self.canvas_size.y))
+    if x0 >= x1 or y0 >= y1:
+      return None
+    return (x0, y0, x1, y1)
+
+  def _draw_layered(self, canvas:Canvas)->None:
+    """
+    Same pixels as draw, but the background and static entities come from
+    the cached layer.
+    """
+    num_bottom, num_top, key = self._static_ends()
+    num_moving = len(self.z_order) - num_bottom - num_top
+    moving = self.z_order[num_bottom:num_bottom + num_moving]
+    if (
+        self._layer is None
+        or self._layer_key != key
+        or self._layer.image_format != canvas.image_format
+    ):
+      self._build_layers(canvas, num_bottom, num_top)
+      self._layer_key = key
+      # Static entities may have changed anywhere
+      self._last_dirty = None
+
+    # Where moving entities are drawn this frame
+    dirty = []
+    if num_moving > self.max_dirty_rects:
+      dirty = None
+    else:
+      for entity in moving:
+        if not entity.visible:
+          continue
+        bounds = entity.draw_bounds()
+        if bounds is None:
+          dirty = None
+          break
+        rect = self._pixel_rect(bounds)
+        if rect is not None:
+          dirty.append(rect)
+
+    # Only the pixels moving entities were drawn on last frame differ from
+    # the layer, as long as nothing else drew on this canvas since.
+    if (
+        not self.dirty_rects
+        or self._last_canvas is not canvas
+        or self._last_dirty is None
+    ):
+      np.copyto(canvas.array, self._layer.array)
+    else:
+      for x0, y0, x1, y1 in self._last_dirty:
+        canvas.array[y0:y1, x0:x1] = self._layer.array[y0:y1, x0:x1]
+    # Static entities on top are drawn again over moving ones under them,
+    # on what was under them.
+    covering = self._covering_tops(dirty)
+    for _, (x0, y0, x1, y1) in covering:
+      canvas.array[y0:y1, x0:x1] = self._under_layer.array[y0:y1, x0:x1]
+    for entity in moving:
+      if entity.visible:
+        entity.draw(canvas.draw_ctx)
+    for entity, _ in covering:
+      entity.draw(canvas.draw_ctx)
+    self._last_canvas = canvas
+    self._last_dirty = dirty
+
+  def _build_layers(
+      self,
+      canvas:Canvas,
+      num_bottom:int,
+      num_top:int,
+  )->None:
+    """
+    Draws the background and the static entities at each end of z_order
+    into the cached layer, and the under layer if there are any on top.
+    """
+    self._layer = Canvas(
+        self.canvas_size,
+        canvas.image_format,
+        sprite_cache=canvas.sprite_cache
+    )
+    self._layer.draw_ctx.rectangle(
+      [(0, 0), tuple(self.canvas_size+(1,1))],
+      fill=self.background_color.to8bit_rgba()
+    )
+    for entity in self.z_order[:num_bottom]:
+      if entity.visible:
+        entity.draw(self._layer.draw_ctx)
+    self._under_layer = None
+    self._top_rects = []
+    if num_top == 0:
+      return
+    self._under_layer = Canvas(self.canvas_size, canvas.image_format)
+    np.copyto(self._under_layer.array, self._layer.array)
+    for entity in self.z_order[len(self.z_order) - num_top:]:
+      if not entity.visible:
+        continue
+      entity.draw(self._layer.draw_ctx)
+      rect = self._pixel_rect(entity.draw_bounds())
+      if rect is not None:
+        self._top_rects.append((entity, rect))
+
+  def _covering_tops(
+      self,
+      dirty:Optional[List[Tuple[int, int, int, int]]],
+  )->List[Tuple[Entity, Tuple[int, int, int, int]]]:
+    """
+    The static entities on top, with their rectangles, that cover any of
+    the dirty rectangles, or all of them if dirty is None. Restoring one's
+    rectangle erases any other overlapping it, so those are included too.
+    """
+    tops = self._top_rects
+    if dirty is None:
+      return list(tops)
+    def overlap(a, b):
+      return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+    covering = [
+        any(overlap(rect, d) for d in dirty) for _, rect in tops
+    ]
+    grown = any(covering)
+    while grown:
+      grown = False
+      for idx, (_, rect) in enumerate(tops):
+        if not covering[idx] and any(
+            covering[other] and overlap(rect, other_rect)
+            for other, (_, other_rect) in enumerate(tops)
+        ):
+          covering[idx] = True
+          grown = True
+    return [top for top, covers in zip(tops, covering) if covers]
+
   def add_entity(self, entity:Entity):
-    self.entities.append(entity)
-    self._ordered = False
+    self.add_entities([entity])
+
+  def add_entities(self, entities:List[Entity])->None:
+    """
+    Adds entities after everything already in the scene. Once ordered, each
+    is inserted into action_order and z_order after the entities with the
+    same order value, where a full sort would put it.
+    """
+    entities = list(entities)
+    self.entities.extend(entities)
+    self._awake = None
+    if not self._ordered:
+      return
+    if len(entities) > len(self.action_order) // 4:
+      # Cheaper to sort everything again
+      self._ordered = False
+      return
+    for entity in entities:
+      insort(self.action_order, entity, key=attrgetter("action_order"))
+      insort(self.z_order, entity, key=attrgetter("z_order"))
+      if self.vectorized_physics and isinstance(entity, PhysicsEntity):
+        self._physics_stale = True
+
+  def remove_entity(self, entity:Entity)->None:
+    self.remove_entities([entity])
+
+  def remove_entities(self, entities:List[Entity])->None:
+    """
+    Removes entities from the scene in one pass over each list. Partners'
+    collides_with lists are left alone, so without broad_phase, deactivate
+    removed entities that are still listed as partners.
+    Checkpoints only load into scenes with the same entities, so prefer
+    an EntityPool for entities that come and go.
+    """
+    removed = set(map(id, entities))
+    if len(removed) == 0:
+      return
+    keep = lambda e: id(e) not in removed
+    num_entities = len(self.entities)
+    self.entities[:] = filter(keep, self.entities)
+    assert num_entities - len(self.entities) == len(removed), \
+        "Can only remove entities in the scene."
+    if self._ordered:
+      self.action_order[:] = filter(keep, self.action_order)
+      self.z_order[:] = filter(keep, self.z_order)
+      if self._physics_arrays is not None and any(
+          isinstance(e, PhysicsEntity) for e in entities
+      ):
+        self._physics_stale = True
+    for key in removed:
+      self._sleeping.pop(key, None)
+    self._awake = None
 
   def _establish_order(self):
     if not self._ordered:
       self.action_order = sorted(self.entities, key=lambda e: e.action_order)
       self.z_order = sorted(self.entities, key=lambda e: e.z_order)
+      self._physics_stale = self.vectorized_physics
       self._ordered = True
+    if self._physics_stale:
+      # Rebinding copies each entity's current motion into the new arrays
+      self._physics_arrays = PhysicsArrays([
+        e for e in self.action_order if isinstance(e, PhysicsEntity)
+      ])
+      self._physics_stale = False
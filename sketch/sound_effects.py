@@ -1,5 +1,7 @@
+import numpy as np
 import pydub
 from sketch.sounds import sec_to_mil
+from typing import Callable
 
 def fade_out(
     duration:float,
@@ -28,3 +30,105 @@ def fade_in_and_out(
         sec_to_mil(out_duration)
       )
   )
+
+
+## The same fades on arrays of samples, for sounds.sine_bank.
+## Each takes a tones x frames int array and the frame rate.
+
+def _fade_gains(
+    num_frames:int,
+    frame_rate:int,
+    from_gain:float,
+    to_gain:float,
+    start:int,
+    end:int,
+)->np.ndarray:
+  """
+  The gain AudioSegment.fade applies to each frame, fading between start
+  and end milliseconds. Whatever part of the fade falls outside the frames
+  is left off, so the ramp keeps its slope and the length never changes.
+  """
+  # Fades are in DB, where -120 means silent
+  from_power = 10 ** (from_gain / 20)
+  to_power = 10 ** (to_gain / 20)
+  def frame(ms):
+    return np.trunc(ms * (frame_rate / 1000.0)).astype(np.int64)
+  def clamp(frames):
+    return np.clip(frames, 0, num_frames)
+  gains = np.ones(num_frames)
+  gains[:clamp(frame(start))] = from_power
+  duration = end - start
+  gain_delta = to_power - from_power
+  if duration > 100:
+    # One step per millisecond, as pydub does for long fades
+    step = gain_delta / duration
+    bounds = clamp(frame(start + np.arange(duration + 1)))
+    gains[bounds[0]:bounds[-1]] = np.repeat(
+        from_power + step * np.arange(duration),
+        np.diff(bounds)
+    )
+  else:
+    start_frame = start * (frame_rate / 1000.0)
+    fade_frames = end * (frame_rate / 1000.0) - start_frame
+    step = gain_delta / fade_frames
+    # Every frame up to end, where pydub can lose the last one to rounding
+    first = int(np.floor(start_frame))
+    steps = np.arange(frame(end) - first)
+    frames = first + steps
+    inside = (frames >= 0) & (frames < num_frames)
+    gains[frames[inside]] = from_power + step * steps[inside]
+  gains[clamp(frame(end)):] = to_power
+  return gains
+
+
+def _apply_gains(samples:np.ndarray, gains:np.ndarray)->np.ndarray:
+  # Rounds down, like audioop.mul
+  return np.floor(samples * gains).astype(samples.dtype)
+
+
+def fade_in_samples(
+    duration:float,
+)->Callable[[np.ndarray, int], np.ndarray]:
+  """
+  fade_in, for sample arrays.
+  """
+  def effect(samples, frame_rate):
+    num_frames = samples.shape[-1]
+    fade = sec_to_mil(duration)
+    return _apply_gains(
+        samples,
+        _fade_gains(num_frames, frame_rate, -120, 0, 0, fade)
+    )
+  return effect
+
+
+def fade_out_samples(
+    duration:float,
+)->Callable[[np.ndarray, int], np.ndarray]:
+  """
+  fade_out, for sample arrays.
+  """
+  def effect(samples, frame_rate):
+    num_frames = samples.shape[-1]
+    length = round(1000 * num_frames / frame_rate)
+    fade = sec_to_mil(duration)
+    return _apply_gains(
+        samples,
+        _fade_gains(num_frames, frame_rate, 0, -120, length - fade, length)
+    )
+  return effect
+
+
+def fade_in_and_out_samples(
+    in_duration:float,
+    out_duration:float,
+)->Callable[[np.ndarray, int], np.ndarray]:
+  """
+  fade_in_and_out, for sample arrays.
+  """
+  fade_in_effect = fade_in_samples(in_duration)
+  fade_out_effect = fade_out_samples(out_duration)
+  return lambda samples, frame_rate: fade_out_effect(
+      fade_in_effect(samples, frame_rate),
+      frame_rate
+  )
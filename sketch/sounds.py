@@ -1,8 +1,14 @@
 import pydub
 from pydub.generators import SignalGenerator
 from pathlib import Path
-from typing import Dict, Callable
+from sketch.profiler import NULL_PROFILER
+from sketch.sample_cache import CachedSample
+from sketch.sample_cache import SampleCache
+from typing import Dict, Callable, List, Optional, Sequence, Tuple
+import hashlib
 import math
+import numpy as np
+import wave
 
 def pitch_to_frequency(pitch:int)->float:
   assert 0 <= pitch <= 88, "Pitch is one of 88 keyboard keys"
@@ -11,33 +17,143 @@ def pitch_to_frequency(pitch:int)->float:
 def sec_to_mil(seconds:float):
   return int(seconds * 1000)
 
+
+# Synthesized tones are 16 bit, like pydub's generators by default
+MAX_SAMPLE = 2 ** 15 - 1
+
+# Seconds a stopped voice takes to fade out, short enough to sound like a
+# cut but long enough not to click
+RELEASE_DURATION = 0.005
+
+
+def release(samples:np.ndarray, stop:int, frame_rate:int)->np.ndarray:
+  """
+  samples (frames x channels), faded out from frame stop over
+  RELEASE_DURATION and cut there.
+  """
+  stop = max(stop, 0)
+  num_release = max(int(RELEASE_DURATION * frame_rate), 1)
+  released = samples[:stop+num_release].copy()
+  tail = released[stop:]
+  ramp = 1 - np.arange(len(tail)) / num_release
+  tail[:] = np.trunc(tail * ramp[:, None]).astype(tail.dtype)
+  return released
+
+
+def sine_bank(
+    frequencies:Sequence[float],
+    duration:float,
+    volume:float=0,
+    frame_rate:int=44100,
+    effect:Callable[[np.ndarray, int], np.ndarray]=None,
+)->np.ndarray:
+  """
+  Renders one sine tone per frequency, all at once, as a tones x frames
+  int16 array. Sample for sample what pydub.generators.Sine makes.
+  volume - DB, with 0 being the loudest
+  effect - applied to the whole bank, with the frame rate, such as
+    sound_effects.fade_in_and_out_samples
+  """
+  num_frames = int(frame_rate * (sec_to_mil(duration) / 1000.0))
+  gain = 10 ** (volume / 20)
+  # Each row's phase step, as Sine.generate computes it
+  steps = np.array(frequencies, dtype=np.float64) * 2 * math.pi / frame_rate
+  samples = np.sin(steps[:, None] * np.arange(num_frames))
+  samples = np.trunc(samples * MAX_SAMPLE * gain).astype(np.int16)
+  if effect is not None:
+    samples = effect(samples, frame_rate)
+  return samples
+
+
+def tone_bank(
+    pitches:Sequence[int],
+    duration:float,
+    volume:float=0,
+    frame_rate:int=44100,
+    effect:Callable[[np.ndarray, int], np.ndarray]=None,
+)->List["SoundDescription"]:
+  """
+  One SoundDescription per pitch (see pitch_to_frequency), rendered in one
+  batch by sine_bank.
+  """
+  samples = sine_bank(
+      [pitch_to_frequency(pitch) for pitch in pitches],
+      duration=duration,
+      volume=volume,
+      frame_rate=frame_rate,
+      effect=effect,
+  )
+  return [SoundDescription().add_samples(row, frame_rate) for row in samples]
+
 class SoundDescription(object):
   def __init__(self):
     self.audio_segments = []
     # Used to cache get_sound
     self.sound = None
+    # Used to cache get_samples, keyed by format
+    self._samples = {}
+
+  def __getstate__(self):
+    state = self.__dict__.copy()
+    if self._cache_key() is not None:
+      # Rebuilt from the sample cache rather than copied
+      state["sound"] = None
+      state["_samples"] = {}
+    return state
 
   def add_sample(
       self,
       sample_path:Path,
       volume:float=0,
       duration:float=None,
+      cache:Optional[SampleCache]=None,
   ):
     """
     Adds a prerecorded sample to the description.
     Volume corresponds to DB, with 0 being the loudest.
     Duration is the number of seconds to cut the clip to.
+    cache - if set, the decoded sample, and get_samples of descriptions
+      made only of cached samples, are kept in and loaded from here.
     """
     sample_path = Path(sample_path)
     assert sample_path.is_file(), "Cannot find audio sample."
     assert duration is None or duration > 0, "Must have positive duration."
 
-    sample = pydub.AudioSegment.from_file(sample_path)
-    sample += volume
-    if duration is not None and len(sample) > sec_to_mil(duration):
-      sample = sample[:sec_to_mil(duration)]
+    def decode():
+      sample = pydub.AudioSegment.from_file(sample_path)
+      sample += volume
+      if duration is not None and len(sample) > sec_to_mil(duration):
+        sample = sample[:sec_to_mil(duration)]
+      return sample
+    if cache is None:
+      sample = decode()
+    else:
+      sample = cache.load(sample_path, volume, duration, decode)
     self.audio_segments.append(sample)
     self.sound = None
+    self._samples = {}
+    return self
+
+  def add_samples(
+      self,
+      samples:np.ndarray,
+      frame_rate:int,
+  ):
+    """
+    Adds int16 samples, such as a row of sine_bank. Either one channel, or
+    frames x channels.
+    """
+    samples = np.asarray(samples)
+    assert samples.dtype == np.int16, "Samples must be 16 bit."
+    channels = 1 if samples.ndim == 1 else samples.shape[1]
+    self.audio_segments.append(pydub.AudioSegment(
+        data=samples.astype("<i2").tobytes(),
+        sample_width=2,
+        frame_rate=frame_rate,
+        channels=channels,
+    ))
+    self.sound = None
+    self._samples = {}
     return self
 
   def add_generator(
@@ -57,8 +173,39 @@ class SoundDescription(object):
         seg
     )
     self.sound = None
+    self._samples = {}
     return self
 
+  def _cache_key(self)->Optional[str]:
+    """
+    Names this description in the sample cache, if it only has cached
+    samples.
+    """
+    if len(self.audio_segments) == 0 or not all(
+        isinstance(seg, CachedSample) for seg in self.audio_segments
+    ):
+      return None
+    return "-".join(seg.key for seg in self.audio_segments)
+
+  def get_format(self)->Tuple[int, int, int]:
+    """
+    The (frame_rate, channels, sample_width) of get_sound, without making
+    it.
+    """
+    # Overlays take the highest quality, starting from the silent defaults
+    frame_rate, channels, sample_width = 11025, 1, 2
+    for seg in self.audio_segments:
+      frame_rate = max(frame_rate, seg.frame_rate)
+      channels = max(channels, seg.channels)
+      sample_width = max(sample_width, seg.sample_width)
+    return frame_rate, channels, sample_width
+
+  def get_duration(self)->float:
+    """
+    Seconds long get_sound is, without making it.
+    """
+    return max(map(len, self.audio_segments)) / 1000
+
   def get_sound(self)->pydub.AudioSegment:
     assert len(self.audio_segments) > 0, "Called overlay with no segments."
     if self.sound is None:
@@ -66,42 +213,480 @@ class SoundDescription(object):
       duration = max(map(len, self.audio_segments))
       self.sound = pydub.AudioSegment.silent(duration=duration)
       for seg in self.audio_segments:
+        if isinstance(seg, CachedSample):
+          seg = seg.to_audio_segment()
         self.sound = self.sound.overlay(seg, position=0)
     return self.sound
 
+  def get_samples(
+      self,
+      frame_rate:int,
+      channels:int,
+      sample_width:int,
+  )->np.ndarray:
+    """
+    Returns get_sound() converted to the given format, as a
+    frames x channels integer array.
+    """
+    key = (frame_rate, channels, sample_width)
+    if key not in self._samples:
+      def convert():
+        sound = (
+            self.get_sound()
+            .set_frame_rate(frame_rate)
+            .set_channels(channels)
+            .set_sample_width(sample_width)
+        )
+        return np.array(sound.get_array_of_samples()).reshape(-1, channels)
+      cache_key = self._cache_key()
+      if cache_key is None:
+        self._samples[key] = convert()
+      else:
+        cache_key = hashlib.sha256(
+            f"{cache_key}-{frame_rate}-{channels}-{sample_width}".encode()
+        ).hexdigest()
+        cache = self.audio_segments[0].cache
+        self._samples[key] = cache.array(cache_key, convert)
+    return self._samples[key]
+
 
 class AudioSampler(object):
   """
   This class plays audio_samples from a collection at specific times. It can output
   its results to a file.
+
+  Triggers are only recorded as they happen. They are mixed together in one
+  pass when the result is needed, so the cost grows with the number of
+  triggers rather than triggers times duration.
   """
 
   def __init__(
       self,
       duration:float,
-      out_path:Path,
+      out_path:Optional[Path],
+      normalize:bool=False,
+      start_time:float=0,
   ):
     """
     Samples must all be named.
+    duration - seconds long the output is
+    out_path - where export writes to. If None, the result is only
+      available through mix.
+    normalize - if true, a mix that would clip is scaled down to fit instead
+    start_time - scene time at the start of the output. Sounds triggered
+      earlier still contribute whatever is left of them.
     """
     assert duration > 0, f"Invalid duration"
-    assert not out_path.exists(), f"Refusing to overwrite {out_path}"
+    assert out_path is None or not out_path.exists(), \
+        f"Refusing to overwrite {out_path}"
     self.out_path = out_path
-    self.base = pydub.AudioSegment.silent(duration=sec_to_mil(duration))
+    self.duration = duration
+    self.normalize = normalize
+    self.start_time = start_time
+    # (sound, seconds) in the order they were triggered
+    self.events = []
+    # event index -> seconds it was stopped at
+    self.stops = {}
+    # Times triggers and mixing, see sketch.profiler
+    self.profiler = NULL_PROFILER
+
+  def trigger(self, sound_desc:SoundDescription, when:float)->int:
+    """
+    Triggers the sample at 'when' seconds into the base. Returns an id for
+    stop.
+    """
+    with self.profiler.section("trigger", "audio"):
+      self.events.append((sound_desc, when))
+      return len(self.events) - 1
+
+  def stop(self, voice:int, when:float)->None:
+    """
+    Fades out a triggered sound at 'when', see release.
+    """
+    self.stops[voice] = when
 
-  def trigger(self, sound_desc:SoundDescription, when:float)->None:
+  def get_format(self)->Tuple[int, int, int]:
     """
-    Triggers the sample at 'when' seconds into the base.
+    Returns the (frame_rate, channels, sample_width) of the mix. As with
+    pydub overlays, this is the highest quality among the triggered sounds.
+    """
+    # Matches the pydub.AudioSegment.silent defaults
+    frame_rate, channels, sample_width = 11025, 1, 2
+    for sound_desc in set(sound_desc for sound_desc, _ in self.events):
+      sound_format = sound_desc.get_format()
+      frame_rate = max(frame_rate, sound_format[0])
+      channels = max(channels, sound_format[1])
+      sample_width = max(sample_width, sound_format[2])
+    if sample_width == 3:
+      # NumPy has no 24 bit integers
+      sample_width = 4
+    return frame_rate, channels, sample_width
+
+  def mix(self)->pydub.AudioSegment:
     """
-    self.base = self.base.overlay(
-        sound_desc.get_sound(),
-        position=sec_to_mil(when)
+    Adds every triggered sound into one buffer spanning the duration.
+    """
+    with self.profiler.section("mix", "audio"):
+      return self._mix()
+
+  def _mix(self)->pydub.AudioSegment:
+    frame_rate, channels, sample_width = self.get_format()
+    num_frames = int(self.duration * frame_rate)
+    max_val = 2 ** (8 * sample_width - 1) - 1
+    min_val = -max_val - 1
+    buffer = np.zeros(
+        (num_frames, channels),
+        dtype=np.int32 if sample_width <= 2 else np.int64
+    )
+    for idx, (sound_desc, when) in enumerate(self.events):
+      samples = sound_desc.get_samples(frame_rate, channels, sample_width)
+      start = int((when - self.start_time) * frame_rate)
+      if idx in self.stops:
+        stop = int((self.stops[idx] - self.start_time) * frame_rate)
+        samples = release(samples, stop - start, frame_rate)
+      if start >= num_frames or start + len(samples) <= 0:
+        continue
+      skip = max(0, -start)
+      start += skip
+      end = min(start + len(samples) - skip, num_frames)
+      buffer[start:end] += samples[skip:skip+end-start]
+
+    if self.normalize:
+      peak = np.abs(buffer).max(initial=0)
+      if peak > max_val:
+        buffer = buffer * (max_val / peak)
+    buffer = np.clip(buffer, min_val, max_val)
+    return pydub.AudioSegment(
+        data=buffer.astype(f"<i{sample_width}").tobytes(),
+        sample_width=sample_width,
+        frame_rate=frame_rate,
+        channels=channels,
     )
 
   def export(self)->None:
+    assert self.out_path is not None, "No path to export to."
     assert not self.out_path.exists(), \
         f"Refusing to overwrite: {self.out_path}"
-    self.base.export(self.out_path)
+    self.mix().export(self.out_path)
+
+  def advance(self, clock:float)->None:
+    """
+    Tells the sampler that no more sounds will be triggered before clock.
+    """
+    pass
+
+  def clear(self)->None:
+    self.events = []
+    self.stops = {}
+
+
+class StreamingAudioSampler(AudioSampler):
+  """
+  An AudioSampler that mixes as it goes, into a ring buffer a little longer
+  than the longest sound, and writes finished audio to a wav file. Sounds
+  must be triggered in time order, so everything before the last trigger
+  (or advance) is final. Memory use depends on the longest sound, not on
+  duration.
+
+  Unlike AudioSampler, the format is fixed up front and nothing is kept to
+  mix again, so mix reads the wav back and clipping can't be normalized
+  away.
+  """
+
+  def __init__(
+      self,
+      duration:float,
+      out_path:Path,
+      start_time:float=0,
+      frame_rate:int=44100,
+      channels:int=1,
+      sample_width:int=2,
+      block_duration:float=1,
+  ):
+    """
+    duration, out_path, start_time - as for AudioSampler
+    frame_rate, channels, sample_width - format of the wav. Sounds are
+      converted to it.
+    block_duration - seconds of finished audio gathered before each write
+    """
+    assert out_path is not None, "Streaming needs somewhere to write."
+    assert sample_width in (2, 4), "Wav samples must be 16 or 32 bit."
+    assert block_duration > 0, "Blocks must have positive duration."
+    AudioSampler.__init__(
+        self,
+        duration=duration,
+        out_path=Path(out_path),
+        start_time=start_time,
+    )
+    self.frame_rate = frame_rate
+    self.channels = channels
+    self.sample_width = sample_width
+    self.block_frames = max(int(block_duration * frame_rate), 1)
+    self.num_frames = int(duration * frame_rate)
+    self.events = None
+    self._wav = None
+    self.clear()
+
+  def get_format(self)->Tuple[int, int, int]:
+    return self.frame_rate, self.channels, self.sample_width
 
   def clear(self)->None:
-    self.base = pydub.AudioSegment.silent(duration=len(self.base))
+    if self._wav is not None:
+      self._wav.close()
+      self._wav = None
+    if self.out_path.exists():
+      self.out_path.unlink()
+    self.num_triggers = 0
+    # id -> (sound, start frame) of voices that may still be stopped
+    self._voices = {}
+    # Frame ring[f % len(ring)] holds output frame f, for
+    # written <= f < written + len(ring). Grows to fit the longest sound.
+    self._ring = np.zeros(
+        (2 * self.block_frames, self.channels),
+        dtype=np.int32 if self.sample_width <= 2 else np.int64
+    )
+    self._written = 0
+
+  def _to_frame(self, when:float)->int:
+    return int((when - self.start_time) * self.frame_rate)
+
+  def trigger(self, sound_desc:SoundDescription, when:float)->int:
+    with self.profiler.section("trigger", "audio"):
+      self.num_triggers += 1
+      samples = sound_desc.get_samples(
+          self.frame_rate, self.channels, self.sample_width
+      )
+      start = self._to_frame(when)
+      self._commit(start)
+      voice = self.num_triggers
+      self._voices[voice] = (sound_desc, start)
+      self._mix_in(start, samples)
+      return voice
+
+  def stop(self, voice:int, when:float)->None:
+    """
+    Takes back the part of the voice after 'when' that release removes.
+    Only voices still in the ring can be stopped.
+    """
+    if voice not in self._voices:
+      return
+    sound_desc, start = self._voices.pop(voice)
+    samples = sound_desc.get_samples(
+        self.frame_rate, self.channels, self.sample_width
+    )
+    stop = self._to_frame(when) - start
+    kept = release(samples, stop, self.frame_rate).astype(self._ring.dtype)
+    removed = samples.astype(self._ring.dtype)
+    removed[:len(kept)] -= kept
+    self._mix_in(start, -removed)
+
+  def _mix_in(self, start:int, samples:np.ndarray)->None:
+    """
+    Adds samples starting at frame start, other than frames already written
+    or past the end.
+    """
+    # Whatever falls before written (or the start) was already finished
+    skip = max(0, self._written - start)
+    start += skip
+    end = min(start + len(samples) - skip, self.num_frames)
+    if end <= start:
+      return
+    if end - self._written > len(self._ring):
+      self._grow(end - self._written)
+    self._add(start, samples[skip:skip+end-start])
+
+  def advance(self, clock:float)->None:
+    self._commit(self._to_frame(clock))
+
+  def _add(self, start:int, samples:np.ndarray)->None:
+    # Splits in two where the ring wraps around
+    size = len(self._ring)
+    offset = start % size
+    first = min(len(samples), size - offset)
+    self._ring[offset:offset+first] += samples[:first]
+    self._ring[:len(samples)-first] += samples[first:]
+
+  def _grow(self, min_size:int)->None:
+    size = len(self._ring)
+    pending = np.roll(self._ring, -(self._written % size), axis=0)
+    self._ring = np.zeros(
+        (max(min_size, 2 * size), self.channels),
+        dtype=self._ring.dtype
+    )
+    self._ring[:size] = pending
+    # Frame written now lives at the start of the new ring
+    self._ring = np.roll(self._ring, self._written % len(self._ring), axis=0)
+
+  def _commit(self, frame:int)->None:
+    """
+    Writes out every whole block before frame.
+    """
+    frame = min(frame, self.num_frames)
+    if frame - self._written >= self.block_frames:
+      self._flush(frame - (frame - self._written) % self.block_frames)
+      # Voices that are all written out can't be stopped any more
+      for voice, (sound_desc, start) in list(self._voices.items()):
+        samples = sound_desc.get_samples(
+            self.frame_rate, self.channels, self.sample_width
+        )
+        if start + len(samples) <= self._written:
+          del self._voices[voice]
+
+  def _flush(self, frame:int)->None:
+    """
+    Writes out frames up to frame, and clears their place in the ring.
+    """
+    with self.profiler.section("mix", "audio"):
+      if self._wav is None:
+        self._wav = wave.open(str(self.out_path), "wb")
+        self._wav.setnchannels(self.channels)
+        self._wav.setsampwidth(self.sample_width)
+        self._wav.setframerate(self.frame_rate)
+      max_val = 2 ** (8 * self.sample_width - 1) - 1
+      size = len(self._ring)
+      while self._written < frame:
+        offset = self._written % size
+        count = min(frame - self._written, size - offset)
+        block = self._ring[offset:offset+count]
+        self._wav.writeframes(
+            np.clip(block, -max_val - 1, max_val)
+            .astype(f"<i{self.sample_width}")
+            .tobytes()
+        )
+        block[:] = 0
+        self._written += count
+
+  def mix(self)->pydub.AudioSegment:
+    """
+    Exports, unless that was already done, and reads the wav back from
+    out_path.
+    """
+    if self._wav is not None or self._written == 0:
+      self.export()
+    return pydub.AudioSegment.from_wav(self.out_path)
+
+  def export(self)->None:
+    """
+    Writes out the rest of the audio, up to duration, and closes the file.
+    """
+    assert self._wav is not None or self._written == 0, "Already exported."
+    self._flush(self.num_frames)
+    self._wav.close()
+    self._wav = None
+
+
+class VoiceManager(object):
+  """
+  Sits between entities and an AudioSampler, with the same trigger, and
+  limits how many sounds play:
+  - a sound triggered again within merge_window of its last voice, while
+    that voice still plays, is merged into it: the voice stands for both,
+    and counts as just triggered when picking the oldest voice to steal
+  - otherwise, a sound triggered again within its cooldown is dropped
+  - past max_voices playing at once, a playing voice is stopped (with a
+    short release) to make room: the oldest, or the quietest if that is
+    quieter than the new sound. Otherwise the new sound is dropped.
+  Sounds must be triggered in time order.
+  """
+  def __init__(
+      self,
+      audio_sampler:AudioSampler,
+      max_voices:Optional[int]=None,
+      cooldown:float=0,
+      merge_window:float=0,
+      steal:str="oldest",
+  ):
+    """
+    audio_sampler - where sounds that make it through go
+    max_voices - sounds playing at once. Unlimited if None.
+    cooldown - seconds before a sound can retrigger. set_cooldown changes
+      it for one sound.
+    merge_window - triggers of one sound this close after its playing voice
+      started merge into that voice
+    steal - "oldest" or "quietest", which voice to stop when full
+    """
+    assert max_voices is None or max_voices > 0, "Need at least one voice."
+    assert cooldown >= 0, "Cooldown cannot be negative."
+    assert merge_window >= 0, "Merge window cannot be negative."
+    assert steal in ("oldest", "quietest"), f"Unknown steal policy: {steal}"
+    self.audio_sampler = audio_sampler
+    self.max_voices = max_voices
+    self.cooldown = cooldown
+    self.merge_window = merge_window
+    self.steal = steal
+    # id(sound) -> cooldown, for sounds that differ from the default
+    self._cooldowns = {}
+    # id(sound) -> seconds its last voice started
+    self._last_start = {}
+    # id(sound) -> [end seconds, seconds last triggered, peak, voice id] of
+    # its last voice. The end is moved up to when the voice is stolen.
+    self._last_voice = {}
+    # The _last_voice entries of voices that may still be playing, when
+    # max_voices is set
+    self._playing = []
+    # id(sound) -> (seconds long, peak sample)
+    self._sound_info = {}
+    self.num_played = 0
+    self.num_merged = 0
+    self.num_cooled = 0
+    self.num_stolen = 0
+    self.num_dropped = 0
+
+  def set_cooldown(self, sound_desc:SoundDescription, cooldown:float)->None:
+    assert cooldown >= 0, "Cooldown cannot be negative."
+    self._cooldowns[id(sound_desc)] = cooldown
+
+  def _info(self, sound_desc:SoundDescription)->Tuple[float, int]:
+    key = id(sound_desc)
+    if key not in self._sound_info:
+      self._sound_info[key] = (
+          sound_desc.get_duration(),
+          sound_desc.get_sound().max,
+      )
+    return self._sound_info[key]
+
+  def advance(self, clock:float)->None:
+    self.audio_sampler.advance(clock)
+
+  def trigger(self, sound_desc:SoundDescription, when:float)->Optional[int]:
+    """
+    Passes the sound on to the sampler, unless it is merged, cooling down,
+    or there is no voice for it. Returns the sampler's voice id, if played.
+    """
+    key = id(sound_desc)
+    last_start = self._last_start.get(key)
+    if last_start is not None:
+      since = when - last_start
+      standing = self._last_voice[key]
+      if since < self.merge_window and standing[0] > when:
+        # Stands for both, so it's as young as the newer trigger
+        standing[1] = when
+        self.num_merged += 1
+        return None
+      if since < self._cooldowns.get(key, self.cooldown):
+        self.num_cooled += 1
+        return None
+    duration, peak = self._info(sound_desc)
+    if self.max_voices is not None:
+      self._playing = [v for v in self._playing if v[0] > when]
+      if len(self._playing) >= self.max_voices:
+        if self.steal == "oldest":
+          victim = min(self._playing, key=lambda v: v[1])
+        else:
+          victim = min(self._playing, key=lambda v: (v[2], v[1]))
+          if victim[2] > peak:
+            # Everything playing is louder than the new sound
+            self.num_dropped += 1
+            return None
+        self._playing.remove(victim)
+        victim[0] = when
+        self.audio_sampler.stop(victim[3], when)
+        self.num_stolen += 1
+    voice = self.audio_sampler.trigger(sound_desc, when)
+    self._last_start[key] = when
+    entry = [when + duration, when, peak, voice]
+    self._last_voice[key] = entry
+    if self.max_voices is not None:
+      self._playing.append(entry)
+    self.num_played += 1
+    return voice
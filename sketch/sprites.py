@@ -0,0 +1,217 @@
+"""
+Pre-rasterized, anti-aliased sprites for entity outlines.
+
+An outline (see Entity.get_outline) with a draw transform and fill is drawn
+once, supersampled, into a small RGBA image. Later draws of the same shape,
+rotation, scale, color and sub-pixel offset only paste that image.
+"""
+from PIL import Image, ImageDraw
+from collections import OrderedDict
+from typing import Any, Tuple
+import math
+
+Outline = Tuple[str, Any]
+Transform = Tuple[float, float, float, float]
+RGBA = Tuple[int, int, int, int]
+
+
+def transform_outline(outline:Outline, transform:Transform):
+  """
+  Where draw_outline would draw, as ("circle", (x0, y0, x1, y1)) or
+  ("polygon", [(x, y), ...]). Rotates like collision.Vector.rotate.
+  """
+  kind, shape = outline
+  x, y, angle, scale = transform
+  if kind == "circle":
+    return kind, (x-shape, y-shape, x+shape, y+shape)
+  cos, sin = math.cos(angle), math.sin(angle)
+  return kind, [
+      (x + scale * (px*cos - py*sin), y + scale * (px*sin + py*cos))
+      for px, py in shape
+  ]
+
+
+def draw_outline(
+    draw_ctx:ImageDraw.ImageDraw,
+    outline:Outline,
+    transform:Transform,
+    fill:RGBA,
+)->None:
+  """
+  Rasterizes an outline as plain geometry, without a sprite.
+  """
+  kind, shape = transform_outline(outline, transform)
+  if kind == "circle":
+    draw_ctx.ellipse(shape, fill=fill)
+  else:
+    draw_ctx.polygon(shape, fill=fill)
+
+
+class SpriteCache(object):
+  """
+  Least recently used cache of rendered sprites.
+  """
+  def __init__(
+      self,
+      max_size:int=4096,
+      supersample:int=4,
+      subpixel_steps:int=4,
+      angle_steps:int=360,
+      scale_steps:int=64,
+  ):
+    """
+    max_size - sprites kept before the least recently used is dropped
+    supersample - sprites are drawn this many times larger, then averaged
+      down, for anti-aliased edges
+    subpixel_steps - positions snap to this many steps per pixel
+    angle_steps - rotations snap to this many steps per turn
+    scale_steps - scales snap to this many steps per unit
+    """
+    assert max_size > 0, "Cache must hold at least one sprite."
+    assert supersample >= 1, "Supersample factor must be positive."
+    assert subpixel_steps >= 1, "Need at least one subpixel step."
+    assert angle_steps >= 1, "Need at least one angle step."
+    assert scale_steps >= 1, "Need at least one scale step."
+    self.max_size = max_size
+    self.supersample = supersample
+    self.subpixel_steps = subpixel_steps
+    self.angle_steps = angle_steps
+    self.scale_steps = scale_steps
+    # geometry key -> (coverage mask, (x offset, y offset))
+    self.masks = OrderedDict()
+    # geometry key + fill -> (image, (x offset, y offset))
+    self.sprites = OrderedDict()
+    self.hits = 0
+    self.misses = 0
+
+  def __len__(self):
+    return len(self.sprites)
+
+  def get(
+      self,
+      outline:Outline,
+      transform:Transform,
+      fill:RGBA,
+  )->Tuple[Image.Image, Tuple[int, int]]:
+    """
+    Returns the sprite for this outline, and the pixel to paste its top
+    left corner at.
+    """
+    kind, shape = outline
+    x, y, angle, scale = transform
+    steps = self.subpixel_steps
+    qx = math.floor(x * steps + 0.5)
+    qy = math.floor(y * steps + 0.5)
+    ix, fx = divmod(qx, steps)
+    iy, fy = divmod(qy, steps)
+    if kind == "circle":
+      # Circles look the same at every angle
+      angle_bucket = 0
+      shape_key = shape
+    else:
+      angle_bucket = round(angle / (2*math.pi) * self.angle_steps)
+      angle_bucket %= self.angle_steps
+      shape_key = tuple(shape)
+    scale_bucket = round(scale * self.scale_steps)
+    mask_key = (kind, shape_key, angle_bucket, scale_bucket, fx, fy)
+    key = (mask_key, fill)
+
+    sprite = self.sprites.get(key)
+    if sprite is None:
+      self.misses += 1
+      # Differently colored copies of a shape share one rasterization
+      mask = self.masks.get(mask_key)
+      if mask is None:
+        mask = self._render_mask(
+            outline=outline,
+            transform=(
+              fx / steps,
+              fy / steps,
+              angle_bucket * 2*math.pi / self.angle_steps,
+              scale_bucket / self.scale_steps,
+            ),
+        )
+        self.masks[mask_key] = mask
+        if len(self.masks) > self.max_size:
+          self.masks.popitem(last=False)
+      else:
+        self.masks.move_to_end(mask_key)
+      coverage, offset = mask
+      image = Image.new("RGBA", coverage.size, fill)
+      if fill[3] < 255:
+        coverage = coverage.point(lambda v: v * fill[3] // 255)
+      image.putalpha(coverage)
+      sprite = (image, offset)
+      self.sprites[key] = sprite
+      if len(self.sprites) > self.max_size:
+        self.sprites.popitem(last=False)
+    else:
+      self.hits += 1
+      self.sprites.move_to_end(key)
+    image, (ox, oy) = sprite
+    return image, (ix + ox, iy + oy)
+
+  def _render_mask(
+      self,
+      outline:Outline,
+      transform:Transform,
+  )->Tuple[Image.Image, Tuple[int, int]]:
+    """
+    Supersamples the outline into an "L" image of how much of each pixel it
+    covers.
+    """
+    kind, shape = transform_outline(outline, transform)
+    if kind == "circle":
+      xs = shape[0::2]
+      ys = shape[1::2]
+    else:
+      xs = [px for px, _ in shape]
+      ys = [py for _, py in shape]
+    # One pixel of margin, as PIL includes the far edge
+    ox = math.floor(min(xs)) - 1
+    oy = math.floor(min(ys)) - 1
+    width = math.ceil(max(xs)) + 2 - ox
+    height = math.ceil(max(ys)) + 2 - oy
+    ss = self.supersample
+    image = Image.new("L", (width*ss, height*ss), 0)
+    draw_ctx = ImageDraw.Draw(image)
+    if kind == "circle":
+      x0, y0, x1, y1 = shape
+      draw_ctx.ellipse(
+          ((x0-ox)*ss, (y0-oy)*ss, (x1-ox)*ss, (y1-oy)*ss),
+          fill=255
+      )
+    else:
+      draw_ctx.polygon(
+          [((px-ox)*ss, (py-oy)*ss) for px, py in shape],
+          fill=255
+      )
+    if ss > 1:
+      image = image.reduce(ss)
+    return image, (ox, oy)
+
+
+class SpriteDraw(ImageDraw.ImageDraw):
+  """
+  A PIL draw context that can also paste cached sprites. Entities check
+  draws_sprites, and call sprite instead of drawing geometry.
+  """
+  draws_sprites = True
+
+  def __init__(self, image:Image.Image, sprite_cache:SpriteCache):
+    ImageDraw.ImageDraw.__init__(self, image)
+    self.image = image
+    self.sprite_cache = sprite_cache
+
+  def sprite(
+      self,
+      outline:Outline,
+      transform:Transform,
+      fill:RGBA,
+  )->None:
+    image, (x, y) = self.sprite_cache.get(outline, transform, fill)
+    width, height = image.size
+    core = image.im
+    # The sprite's alpha blends it over what is already drawn. Pastes on
+    # the core image directly, Image.paste costs more than the copy here.
+    self.im.paste(core, (x, y, x + width, y + height), core)
@@ -0,0 +1,79 @@
+"""
+Continuous collision of moving circles against convex polygons.
+
+A circle moving in a straight line touches a polygon exactly when its center
+crosses the polygon grown by the circle's radius. That shape's boundary is
+each edge pushed out by the radius, joined by a circle around each corner,
+so the first contact is the earliest crossing of any of those.
+"""
+from typing import Optional, Sequence, Tuple
+import math
+
+Pair = Tuple[float, float]
+
+
+def circle_poly_time_of_impact(
+    start:Pair,
+    motion:Pair,
+    radius:float,
+    points:Sequence[Pair],
+)->Optional[float]:
+  """
+  Fraction of motion, from 0 to 1, at which a circle centered on start first
+  touches the convex polygon with the given absolute points. None if it
+  doesn't touch it along the way, or if it already overlaps it at start.
+  """
+  x0, y0 = start
+  dx, dy = motion
+  motion2 = dx*dx + dy*dy
+  if motion2 == 0:
+    return None
+  radius2 = radius * radius
+  num_points = len(points)
+  first = None
+  # Signs of start against each edge, all the same if it's inside
+  num_left = num_right = 0
+  for i in range(num_points):
+    ax, ay = points[i]
+    bx, by = points[(i + 1) % num_points]
+    ex, ey = bx - ax, by - ay
+    length2 = ex*ex + ey*ey
+    if length2 == 0:
+      continue
+    mx, my = x0 - ax, y0 - ay
+    along = (mx*ex + my*ey) / length2
+    along = min(max(along, 0), 1)
+    cx, cy = mx - along*ex, my - along*ey
+    if cx*cx + cy*cy < radius2:
+      return None
+    if ex*my - ey*mx > 0:
+      num_left += 1
+    else:
+      num_right += 1
+
+    # The edge, pushed out by the radius on start's side
+    length = math.sqrt(length2)
+    nx, ny = ey / length, -ex / length
+    side = mx*nx + my*ny
+    closing = dx*nx + dy*ny
+    if side * closing < 0:
+      t = (math.copysign(radius, side) - side) / closing
+      if 0 <= t <= 1 and (first is None or t < first):
+        hx, hy = mx + t*dx, my + t*dy
+        if 0 <= (hx*ex + hy*ey) / length2 <= 1:
+          first = t
+
+    # The circle around corner a
+    b = mx*dx + my*dy
+    if b < 0:
+      c = mx*mx + my*my - radius2
+      disc = b*b - motion2*c
+      if disc >= 0:
+        t = (-b - math.sqrt(disc)) / motion2
+        if 0 <= t <= 1 and (first is None or t < first):
+          first = t
+
+  if num_points >= 3 and (num_left == 0 or num_right == 0):
+    # Start is inside the polygon
+    return None
+  return first
@@ -0,0 +1,381 @@
+"""
+Simulate once, render many times.
+
+record_trajectory runs a scene headless and writes what every entity looks
+like on every frame, plus the audio trigger log, to a directory of .npy
+files. TrajectoryPlayer reads that directory back and stands in for the
+Scene given to a Recorder, so re-rendering only costs drawing and encoding.
+"""
+from PIL.ImageDraw import Draw
+from numpy.lib.format import open_memmap
+from pathlib import Path
+from sketch.canvas import Canvas
+from sketch.scene import Scene
+from sketch.sounds import AudioSampler
+from sketch.sounds import SoundDescription
+from sketch.util.color import Color
+from sketch.util.point import Point
+from tqdm import tqdm
+from typing import Optional
+import json
+import numpy as np
+import pickle
+import random
+
+CIRCLE = 0
+POLYGON = 1
+
+
+def count_frames(timestep:float, duration:float)->int:
+  """
+  Number of frames Recorder makes, accumulating the clock the same way.
+  """
+  clock = 0
+  num_frames = 0
+  while clock < duration:
+    clock += timestep
+    num_frames += 1
+  return num_frames
+
+
+def record_trajectory(
+    scene:Scene,
+    framerate:int,
+    duration:float,
+    out_dir:Path,
+    silence_pbar:bool=False,
+)->None:
+  """
+  Steps scene for duration seconds without drawing, and writes to out_dir:
+    position.npy - frames x entities x 2, float32
+    angle.npy, scale.npy - frames x entities, float32
+    visible.npy - frames x entities, bool
+    kind.npy, radius.npy, points.npy, color.npy, z_order.npy - per entity
+    trigger_frame.npy, trigger_time.npy, trigger_sound.npy - audio log
+    sounds/<idx>.wav - each triggered sound
+    meta.json - everything else
+  Every entity must have an outline (see Entity.get_outline).
+  """
+  out_dir = Path(out_dir)
+  assert not out_dir.exists(), f"Refusing to overwrite: {out_dir}"
+  assert framerate > 0, "Must supply positive framerate"
+  entities = scene.entities
+  outlines = [entity.get_outline() for entity in entities]
+  assert None not in outlines, "Every entity needs an outline to replay."
+  out_dir.mkdir(parents=True)
+  sound_dir = out_dir.joinpath("sounds")
+  sound_dir.mkdir()
+
+  num_entities = len(entities)
+  max_points = max(
+      [len(shape) for kind, shape in outlines if kind == "polygon"],
+      default=0
+  )
+  kind = np.array(
+      [CIRCLE if k == "circle" else POLYGON for k, _ in outlines],
+      dtype=np.uint8
+  )
+  radius = np.zeros(num_entities, dtype=np.float32)
+  # Polygons with fewer points are padded with NaN
+  points = np.full((num_entities, max_points, 2), np.nan, dtype=np.float32)
+  for idx, (k, shape) in enumerate(outlines):
+    if k == "circle":
+      radius[idx] = shape
+    else:
+      points[idx, :len(shape)] = shape
+  np.save(out_dir.joinpath("kind.npy"), kind)
+  np.save(out_dir.joinpath("radius.npy"), radius)
+  np.save(out_dir.joinpath("points.npy"), points)
+  np.save(
+      out_dir.joinpath("color.npy"),
+      np.array([e.color.to8bit_rgba() for e in entities], dtype=np.uint8)
+  )
+  np.save(
+      out_dir.joinpath("z_order.npy"),
+      np.array([e.z_order for e in entities], dtype=np.float64)
+  )
+
+  timestep = 1.0/float(framerate)
+  num_frames = count_frames(timestep, duration)
+  def column(name, shape, dtype):
+    return open_memmap(
+        out_dir.joinpath(f"{name}.npy"),
+        mode="w+",
+        dtype=dtype,
+        shape=(num_frames,) + shape
+    )
+  position = column("position", (num_entities, 2), np.float32)
+  angle = column("angle", (num_entities,), np.float32)
+  scale = column("scale", (num_entities,), np.float32)
+  visible = column("visible", (num_entities,), bool)
+
+  audio_sampler = AudioSampler(duration=duration, out_path=None)
+  trigger_frame = []
+  pbar = tqdm(total=duration, disable=silence_pbar)
+  for frame_idx in range(num_frames):
+    num_events = len(audio_sampler.events)
+    scene.step(timestep, audio_sampler=audio_sampler)
+    pbar.update(timestep)
+    trigger_frame += [frame_idx] * (len(audio_sampler.events) - num_events)
+    transforms = np.array(
+        [e.get_draw_transform() for e in entities],
+        dtype=np.float64
+    ).reshape(num_entities, 4)
+    position[frame_idx] = transforms[:, :2]
+    angle[frame_idx] = transforms[:, 2]
+    scale[frame_idx] = transforms[:, 3]
+    visible[frame_idx] = [e.visible for e in entities]
+  for array in (position, angle, scale, visible):
+    array.flush()
+
+  sound_ids = {}
+  for sound_desc, _ in audio_sampler.events:
+    if id(sound_desc) not in sound_ids:
+      sound_desc.get_sound().export(
+          sound_dir.joinpath(f"{len(sound_ids)}.wav"),
+          format="wav"
+      )
+      sound_ids[id(sound_desc)] = len(sound_ids)
+  np.save(
+      out_dir.joinpath("trigger_frame.npy"),
+      np.array(trigger_frame, dtype=np.int64)
+  )
+  np.save(
+      out_dir.joinpath("trigger_time.npy"),
+      np.array([when for _, when in audio_sampler.events], dtype=np.float64)
+  )
+  np.save(
+      out_dir.joinpath("trigger_sound.npy"),
+      np.array(
+        [sound_ids[id(s)] for s, _ in audio_sampler.events],
+        dtype=np.int64
+      )
+  )
+
+  background_color = None
+  if scene.background_color is not None:
+    background_color = list(scene.background_color)
+  with open(out_dir.joinpath("meta.json"), "w") as meta_file:
+    json.dump(
+        {
+          "framerate": framerate,
+          "duration": duration,
+          "num_frames": num_frames,
+          "num_sounds": len(sound_ids),
+          "canvas_size": list(scene.canvas_size),
+          "background_color": background_color,
+        },
+        meta_file,
+        indent=2
+    )
+
+
+class TrajectoryPlayer(object):
+  """
+  Replays a directory written by record_trajectory. Has the parts of the
+  Scene interface a Recorder uses, so it can be recorded like a scene, but
+  holds no entities, physics or collision shapes.
+  The recorder must use the trajectory's framerate.
+  """
+  def __init__(
+      self,
+      path:Path,
+      canvas_size:Optional[Point]=None,
+      background_color:Optional[Color]=None,
+  ):
+    """
+    path - a directory written by record_trajectory
+    canvas_size - draw at this size instead of the recorded one. Positions
+      and sizes are scaled to match.
+    background_color - replaces the recorded background
+    """
+    self.path = Path(path)
+    with open(self.path.joinpath("meta.json")) as meta_file:
+      self.meta = json.load(meta_file)
+    recorded_size = Point(self.meta["canvas_size"])
+    if canvas_size is None:
+      canvas_size = recorded_size
+    self.canvas_size = Point(canvas_size)
+    self._draw_scale = np.array([
+        self.canvas_size.x / recorded_size.x,
+        self.canvas_size.y / recorded_size.y,
+    ])
+    if background_color is not None:
+      self.background_color = background_color.copy()
+    elif self.meta["background_color"] is not None:
+      self.background_color = Color(*self.meta["background_color"])
+    else:
+      self.background_color = None
+    self.timestep = 1.0/float(self.meta["framerate"])
+    self._clock = 0
+    self._frame_idx = -1
+    self._load()
+
+  def _load(self)->None:
+    def load(name):
+      return np.load(self.path.joinpath(f"{name}.npy"), mmap_mode="r")
+    self.position = load("position")
+    self.angle = load("angle")
+    self.scale = load("scale")
+    self.visible = load("visible")
+    self.kind = np.load(self.path.joinpath("kind.npy"))
+    self.radius = np.load(self.path.joinpath("radius.npy"))
+    self.points = np.load(self.path.joinpath("points.npy"))
+    # Zero for circles
+    self.num_points = (~np.isnan(self.points[:, :, 0])).sum(axis=1)
+    # Editable, to recolor a render
+    self.color = np.load(self.path.joinpath("color.npy"))
+    # Same stable sort Scene uses
+    self.z_order = np.argsort(
+        np.load(self.path.joinpath("z_order.npy")),
+        kind="stable"
+    )
+    self.trigger_frame = np.load(self.path.joinpath("trigger_frame.npy"))
+    self.trigger_time = np.load(self.path.joinpath("trigger_time.npy"))
+    self.trigger_sound = np.load(self.path.joinpath("trigger_sound.npy"))
+    self.sounds = [
+        SoundDescription().add_sample(
+          self.path.joinpath("sounds", f"{idx}.wav")
+        )
+        for idx in range(self.meta["num_sounds"])
+    ]
+
+  def __getstate__(self):
+    # Memory maps are reopened rather than copied into the pickle
+    state = {
+        "path": self.path,
+        "meta": self.meta,
+        "canvas_size": self.canvas_size,
+        "_draw_scale": self._draw_scale,
+        "background_color": self.background_color,
+        "timestep": self.timestep,
+        "_clock": self._clock,
+        "_frame_idx": self._frame_idx,
+        "color": self.color,
+    }
+    return state
+
+  def __setstate__(self, state):
+    color = state.pop("color")
+    self.__dict__.update(state)
+    self._load()
+    self.color = color
+
+  @property
+  def clock(self):
+    return self._clock
+
+  def snapshot(self)->bytes:
+    # Same format as Scene.snapshot, so Scene.from_snapshot restores it
+    return pickle.dumps(
+        (self, random.getstate()),
+        protocol=pickle.HIGHEST_PROTOCOL
+    )
+
+  def save_checkpoint(self, path:Path)->None:
+    with open(path, "wb") as checkpoint_file:
+      pickle.dump(
+          {"clock": self._clock, "frame_idx": self._frame_idx},
+          checkpoint_file,
+          protocol=pickle.HIGHEST_PROTOCOL
+      )
+
+  def load_checkpoint(self, path:Path)->None:
+    with open(path, "rb") as checkpoint_file:
+      checkpoint = pickle.load(checkpoint_file)
+    self._clock = checkpoint["clock"]
+    self._frame_idx = checkpoint["frame_idx"]
+
+  def step(self, timestep:float, audio_sampler:AudioSampler):
+    """
+    Moves to the next recorded frame and replays its audio triggers.
+    """
+    assert abs(timestep - self.timestep) < 1e-9, \
+        "Trajectories replay at the framerate they were recorded at."
+    self._clock += timestep
+    self._frame_idx += 1
+    assert self._frame_idx < self.meta["num_frames"], "Ran out of frames."
+    start, end = np.searchsorted(
+        self.trigger_frame,
+        [self._frame_idx, self._frame_idx + 1]
+    )
+    for event_idx in range(start, end):
+      audio_sampler.trigger(
+          self.sounds[self.trigger_sound[event_idx]],
+          float(self.trigger_time[event_idx])
+      )
+
+  def draw(self, draw_ctx:Draw, canvas:Optional[Canvas]=None):
+    if self.background_color is not None:
+      draw_ctx.rectangle(
+        [(0, 0), tuple(self.canvas_size+(1,1))],
+        fill=self.background_color.to8bit_rgba()
+      )
+    frame_idx = max(self._frame_idx, 0)
+    position = self.position[frame_idx].astype(np.float64) * self._draw_scale
+    angle = self.angle[frame_idx].astype(np.float64)
+    scale = self.scale[frame_idx].astype(np.float64)
+    visible = self.visible[frame_idx]
+    if (
+        getattr(draw_ctx, "draws_batches", False)
+        and self._draw_scale[0] == self._draw_scale[1]
+    ):
+      self._draw_batches(draw_ctx, position, angle, scale, visible)
+      return
+    for idx in self.z_order:
+      if not visible[idx]:
+        continue
+      fill = tuple(int(c) for c in self.color[idx])
+      x, y = position[idx]
+      if self.kind[idx] == CIRCLE:
+        rx, ry = self.radius[idx] * self._draw_scale
+        draw_ctx.ellipse((x - rx, y - ry, x + rx, y + ry), fill=fill)
+      else:
+        points = self.points[idx]
+        points = points[~np.isnan(points[:, 0])] * scale[idx]
+        cos, sin = np.cos(angle[idx]), np.sin(angle[idx])
+        rotated = np.stack([
+            points[:, 0] * cos - points[:, 1] * sin,
+            points[:, 0] * sin + points[:, 1] * cos,
+        ], axis=1) * self._draw_scale
+        draw_ctx.polygon(
+            [(x + px, y + py) for px, py in rotated.tolist()],
+            fill=fill
+        )
+
+  def _draw_batches(
+      self,
+      draw_ctx:Draw,
+      position:np.ndarray,
+      angle:np.ndarray,
+      scale:np.ndarray,
+      visible:np.ndarray,
+  )->None:
+    """
+    Same as draw, but each run of circles, or of polygons with the same
+    number of points, in z order is one circles or polygons call.
+    """
+    order = self.z_order[visible[self.z_order]]
+    if len(order) == 0:
+      return
+    draw_scale = self._draw_scale[0]
+    # Circles have no points, so circles and polygons never share a key
+    run_key = self.num_points[order]
+    breaks = np.flatnonzero(run_key[1:] != run_key[:-1]) + 1
+    for run in np.split(order, breaks):
+      num_points = self.num_points[run[0]]
+      if num_points == 0:
+        draw_ctx.circles(
+            position[run],
+            self.radius[run] * draw_scale,
+            self.color[run]
+        )
+        continue
+      points = self.points[run, :num_points] * scale[run, None, None]
+      cos = np.cos(angle[run])[:, None]
+      sin = np.sin(angle[run])[:, None]
+      rotated = np.stack([
+          points[:, :, 0] * cos - points[:, :, 1] * sin,
+          points[:, :, 0] * sin + points[:, :, 1] * cos,
+      ], axis=2) * draw_scale
+      draw_ctx.polygons(rotated + position[run, None, :], self.color[run])
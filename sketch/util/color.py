@@ -12,6 +12,12 @@ class Color(object):
     self.b = b
     self.a = a
 
+  def __setattr__(self, name, value):
+    object.__setattr__(self, name, value)
+    if name in ("r", "g", "b", "a"):
+      # Invalidates to8bit_rgba
+      object.__setattr__(self, "_rgba8", None)
+
   def __iter__(self):
     yield self.r
     yield self.g
@@ -22,7 +28,12 @@ class Color(object):
     return Color(self.r, self.g, self.b, self.a)
 
   def to8bit_rgba(self):
-    return tuple(int(255*x) for x in [self.r, self.g, self.b, self.a])
+    # Cached, since every entity asks for this every frame
+    if self._rgba8 is None:
+      self._rgba8 = tuple(
+          int(255*x) for x in [self.r, self.g, self.b, self.a]
+      )
+    return self._rgba8
 
   @classmethod
   def Random(cls):
@@ -1,8 +1,13 @@
 from random import random
+from typing import Iterable
 import math
+import numpy as np
 import collision
 
 class Point:
+  # No per-point __dict__, as physics keeps several points per entity
+  __slots__ = ("x", "y")
+
   def __init__(self, x, y=None):
     if y is None:
       self.x = x[0]
@@ -21,9 +26,13 @@ class Point:
   def __setitem__(self, idx, val):
     if idx == 0:
       self.x = val
-    if idx == 1:
+    elif idx == 1:
       self.y = val
-    raise ValueError("Invalid point index")
+    else:
+      raise ValueError("Invalid point index")
+
+  def __reduce__(self):
+    return (Point, (self.x, self.y))
 
   def __iadd__(self, other):
     self.x += other[0]
@@ -58,7 +67,7 @@ class Point:
       y=self.y*scale
     )
 
-  def __idiv__(self, scale):
+  def __itruediv__(self, scale):
     self.x /= scale
     self.y /= scale
     return self
@@ -72,6 +81,27 @@ class Point:
   def __neg__(self):
     return self * -1
 
+  ## In-place updates that make no temporary points
+
+  def add_scaled(self, other, scale:float)->"Point":
+    """
+    self += other * scale. other has x and y, like a Point or a
+    collision.Vector.
+    """
+    self.x += other.x * scale
+    self.y += other.y * scale
+    return self
+
+  def reflect(self, axis)->"Point":
+    """
+    self += collision.Vector.reflect(self, axis), mirroring this point
+    across the line perpendicular to axis (which has x and y).
+    """
+    x, y = self.x, self.y
+    amt = (x * axis.x + y * axis.y) / (axis.x * axis.x + axis.y * axis.y)
+    self.x = x - amt * axis.x * 2
+    self.y = y - amt * axis.y * 2
+    return self
 
   def magnitude(self):
     return math.sqrt(self.x**2 + self.y**2)
@@ -95,8 +125,7 @@ class Point:
     return self.x > 0 and self.y > 0
 
   def __iter__(self):
-    yield self.x
-    yield self.y
+    return iter((self.x, self.y))
 
   def __eq__(self, other):
     return self.x == other[0] and self.y == other[1]
@@ -108,6 +137,13 @@ class Point:
   def to_collision_vec(self)->collision.Vector:
     return collision.Vector(self.x, self.y)
 
+  def set_collision_vec(self, vec:collision.Vector)->None:
+    """
+    Copies this point into an existing collision.Vector.
+    """
+    vec.x = self.x
+    vec.y = self.y
+
   @classmethod
   def RandomDirection(cls):
     return Point(random()-0.5, random()-0.5).unit()
@@ -134,3 +170,94 @@ class Point:
   @classmethod
   def Down(cls):
     return Point(x=0, y=1)
+
+
+class PointView(Point):
+  """
+  A Point whose coordinates live in row `index` of an (n, 2) array, so
+  writes through the Point API land in the array and vice versa.
+  Arithmetic that makes a new point still returns a plain Point.
+  """
+  __slots__ = ("_data", "_index", "_row")
+
+  def __init__(self, data, index:int):
+    self._data = data
+    self._index = index
+    self._row = data[index]
+
+  def __reduce__(self):
+    # Pickle the whole array (shared with other views via the pickle memo)
+    # rather than a copy of the row, so unpickled views stay linked.
+    return (PointView, (self._data, self._index))
+
+  @property
+  def x(self):
+    return float(self._row[0])
+
+  @x.setter
+  def x(self, val):
+    self._row[0] = val
+
+  @property
+  def y(self):
+    return float(self._row[1])
+
+  @y.setter
+  def y(self, val):
+    self._row[1] = val
+
+
+class PointArray(object):
+  """
+  Many points in one (n, 2) float array, for updating a batch at once.
+  Indexing returns a PointView, so single points keep the Point API.
+  """
+  def __init__(self, points:Iterable=()):
+    """
+    points - anything NumPy reads as (n, 2), such as Points or an array.
+    """
+    if not isinstance(points, np.ndarray):
+      points = [tuple(p) for p in points]
+    self.data = np.array(points, dtype=np.float64).reshape(-1, 2)
+
+  @classmethod
+  def zeros(cls, num:int)->"PointArray":
+    return cls(np.zeros((num, 2)))
+
+  def __len__(self):
+    return len(self.data)
+
+  def __getitem__(self, idx:int)->PointView:
+    return PointView(self.data, idx)
+
+  def __iter__(self):
+    for idx in range(len(self.data)):
+      yield PointView(self.data, idx)
+
+  @property
+  def x(self)->np.ndarray:
+    return self.data[:, 0]
+
+  @property
+  def y(self)->np.ndarray:
+    return self.data[:, 1]
+
+  def add_scaled(self, other, scale, where=None)->"PointArray":
+    """
+    self += other * scale, in place. other is a PointArray or (n, 2)
+    array, scale a number or per point array. Only rows where the boolean
+    mask is set change, if given.
+    """
+    other = getattr(other, "data", other)
+    if where is None:
+      self.data += other * np.reshape(scale, (-1, 1))
+    else:
+      scale = np.broadcast_to(np.reshape(scale, (-1, 1)), (len(self), 1))
+      self.data[where] += other[where] * scale[where]
+    return self
+
+  def to_points(self):
+    return [Point(float(x), float(y)) for x, y in self.data]
+
+  def to_collision_vecs(self):
+    return [collision.Vector(float(x), float(y)) for x, y in self.data]
@@ -0,0 +1,54 @@
+from collections import defaultdict
+from typing import List, Optional, Set, Tuple
+import math
+
+Bounds = Tuple[Tuple[float, float], Tuple[float, float]]
+
+class SpatialHash(object):
+  """
+  A uniform grid that buckets objects by the cells their bounds touch.
+  Used as a broad phase: only objects sharing a cell can possibly overlap.
+  """
+  def __init__(self, cell_size:float):
+    assert cell_size > 0, "Cell size must be positive."
+    self.cell_size = float(cell_size)
+    # cell -> {id(item): item}
+    self._cells = defaultdict(dict)
+
+  def _cell_range(self, bounds:Bounds)->Tuple[int, int, int, int]:
+    (x_min, y_min), (x_max, y_max) = bounds
+    return (
+        math.floor(x_min / self.cell_size),
+        math.floor(y_min / self.cell_size),
+        math.floor(x_max / self.cell_size),
+        math.floor(y_max / self.cell_size),
+    )
+
+  def clear(self)->None:
+    self._cells.clear()
+
+  def insert(self, item:object, bounds:Bounds)->None:
+    x_min, y_min, x_max, y_max = self._cell_range(bounds)
+    for x in range(x_min, x_max+1):
+      for y in range(y_min, y_max+1):
+        self._cells[(x, y)][id(item)] = item
+
+  def query(self, bounds:Bounds, among:Optional[Set[int]]=None)->List[object]:
+    """
+    Returns every item sharing a cell with bounds, once each.
+    If among is set, only items whose id is in among are returned.
+    """
+    x_min, y_min, x_max, y_max = self._cell_range(bounds)
+    found = {}
+    for x in range(x_min, x_max+1):
+      for y in range(y_min, y_max+1):
+        bucket = self._cells.get((x, y))
+        if bucket is None:
+          continue
+        if among is None:
+          found.update(bucket)
+        else:
+          # Set intersection iterates the smaller side
+          for key in bucket.keys() & among:
+            found[key] = bucket[key]
+    return list(found.values())
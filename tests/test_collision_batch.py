@@ -0,0 +1,64 @@
+from sketch.collision_batch import collide_circle_poly_pairs
+from sketch.entities.physics_entity import to_collision_rect
+from sketch.util.point import Point
+import collision
+import math
+import random
+
+
+def make_pairs(num_pairs, seed=0):
+  rng = random.Random(seed)
+  pairs = []
+  for idx in range(num_pairs):
+    poly = to_collision_rect(
+        size=Point(rng.uniform(5, 80), rng.uniform(5, 80)),
+        position=Point(rng.uniform(0, 100), rng.uniform(0, 100)),
+        angle=rng.uniform(0, math.pi),
+    )
+    if idx % 3 == 0:
+      # Triangles, so polygons of different sizes share a batch
+      poly = collision.Poly(
+          collision.Vector(rng.uniform(0, 100), rng.uniform(0, 100)),
+          [
+            collision.Vector(0, 0),
+            collision.Vector(rng.uniform(10, 40), 0),
+            collision.Vector(0, rng.uniform(10, 40)),
+          ],
+      )
+    circle = collision.Circle(
+        collision.Vector(rng.uniform(0, 100), rng.uniform(0, 100)),
+        rng.uniform(1, 30),
+    )
+    if idx % 2 == 0:
+      pairs.append((circle, poly, True))
+    else:
+      pairs.append((poly, circle, True))
+  return pairs
+
+
+def test_matches_collision_collide():
+  pairs = make_pairs(500)
+  results = collide_circle_poly_pairs(pairs)
+  num_hits = 0
+  for (a, b, _), (collided, response) in zip(pairs, results):
+    expected = collision.Response()
+    assert collided == collision.collide(a, b, expected)
+    if not collided:
+      continue
+    num_hits += 1
+    assert response.a is a and response.b is b
+    assert response.overlap == expected.overlap
+    assert response.overlap_n.x == expected.overlap_n.x
+    assert response.overlap_n.y == expected.overlap_n.y
+    assert response.overlap_v.x == expected.overlap_v.x
+    assert response.overlap_v.y == expected.overlap_v.y
+    assert response.a_in_b == expected.a_in_b
+    assert response.b_in_a == expected.b_in_a
+  # Enough of both outcomes to mean something
+  assert 50 < num_hits < 450
+
+
+def test_response_only_when_wanted():
+  pairs = [(a, b, False) for a, b, _ in make_pairs(100, seed=1)]
+  for collided, response in collide_circle_poly_pairs(pairs):
+    assert response is None
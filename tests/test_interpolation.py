@@ -0,0 +1,40 @@
+from sketch.entities.physics_entity import PhysicsCircle
+from sketch.scene import Scene
+from sketch.sounds import AudioSampler
+from sketch.util.point import Point
+
+
+class SleepyCircle(PhysicsCircle):
+  def is_sleeping(self):
+    return self.frozen
+
+
+def make_scene():
+  ball = SleepyCircle(radius=5, position=Point(10, 10), frozen=True)
+  scene = Scene(canvas_size=Point(100, 100), entities=[ball])
+  audio_sampler = AudioSampler(duration=1, out_path=None)
+  scene.step(1/60, audio_sampler=audio_sampler)
+  return scene, ball, audio_sampler
+
+
+def test_waking_entity_is_interpolated():
+  scene, ball, audio_sampler = make_scene()
+  assert ball.is_sleeping()
+  scene.save_transforms()
+  ball.frozen = False
+  ball.velocity = Point(60, 0)
+  scene.step(1/60, audio_sampler=audio_sampler)
+  with scene.interpolated(0.5):
+    assert tuple(ball.position) == (10.5, 10)
+  assert tuple(ball.position) == (11, 10)
+
+
+def test_teleport_is_forgotten_while_sleeping():
+  scene, ball, audio_sampler = make_scene()
+  ball.put(Point(20, 20))
+  scene.save_transforms()
+  ball.frozen = False
+  ball.velocity = Point(60, 0)
+  scene.step(1/60, audio_sampler=audio_sampler)
+  with scene.interpolated(0.5):
+    assert tuple(ball.position) == (20.5, 20)
@@ -0,0 +1,47 @@
+from falling_balls import build_scene
+from sketch.entities.physics_entity import PhysicsArrays
+from sketch.entities.physics_entity import PhysicsCircle
+from sketch.sounds import AudioSampler
+from sketch.util.point import Point
+
+
+def run_scene(vectorized_physics, num_steps=300):
+  scene = build_scene(num_balls=30, with_audio=False, seed=3)
+  scene.vectorized_physics = vectorized_physics
+  audio_sampler = AudioSampler(duration=num_steps, out_path=None)
+  for _ in range(num_steps):
+    scene.step(1/60, audio_sampler=audio_sampler)
+  return [
+      (tuple(e.position), tuple(e.velocity), e.angle)
+      for e in scene.entities
+  ]
+
+
+def test_vectorized_scene_matches_per_entity():
+  assert run_scene(True) == run_scene(False)
+
+
+def test_integrate_matches_step():
+  def make():
+    return [
+        PhysicsCircle(
+            radius=5,
+            position=Point(i, 2*i),
+            velocity=Point(3, -i),
+            acceleration=Point(0, 9.8),
+            frozen=(i == 1),
+            active=(i != 2),
+        )
+        for i in range(4)
+    ]
+  stepped = make()
+  integrated = make()
+  arrays = PhysicsArrays(integrated)
+  for _ in range(10):
+    for entity in stepped:
+      if entity.active:
+        entity.step(0.1, scene=None, audio_sampler=None)
+    arrays.integrate(0.1)
+  for a, b in zip(stepped, integrated):
+    assert tuple(a.position) == tuple(b.position)
+    assert tuple(a.velocity) == tuple(b.velocity)
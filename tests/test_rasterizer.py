@@ -0,0 +1,53 @@
+import numpy as np
+
+from sketch.canvas import Canvas
+from sketch.draw_commands import DrawCommandBuffer
+from sketch.rasterizer import NumpyRasterizer
+from sketch.util.point import Point
+
+RED = (255, 0, 0, 255)
+GREEN = (0, 255, 0, 255)
+BLUE = (0, 0, 255, 255)
+
+# An L, with its notch at the top right
+CONCAVE = [(10, 10), (30, 10), (30, 40), (60, 40), (60, 60), (10, 60)]
+STAR = [
+    (40 + 25 * np.sin(a), 40 - 25 * np.cos(a))
+    for a in np.arange(5) * 4 * np.pi / 5
+]
+
+
+def draw(commands, rasterize):
+  buffer = DrawCommandBuffer()
+  for xy, fill in commands:
+    buffer.polygon(xy, fill=fill)
+  canvas = Canvas(Point(80, 80))
+  if rasterize:
+    NumpyRasterizer().replay(buffer, canvas)
+  else:
+    buffer.replay(canvas.draw_ctx)
+  return canvas.array
+
+
+def test_polygons_that_are_not_convex_are_drawn_by_pil():
+  commands = [
+      (CONCAVE, RED),
+      ([coord for point in CONCAVE for coord in point], GREEN),
+      (STAR, BLUE),
+      ([(0, 0), (20, 20), (40, 40)], RED),
+  ]
+  assert np.array_equal(draw(commands, True), draw(commands, False))
+
+
+def test_convex_polygons_keep_their_order():
+  square = [(5, 5), (70, 5), (70, 70), (5, 70)]
+  triangle = [(40, 20), (75, 75), (20, 75)]
+  commands = [(square, RED), (CONCAVE, GREEN), (triangle, BLUE)]
+  rasterized = draw(commands, True)
+  # The notch shows the square, and the triangle is on top of the L
+  assert tuple(rasterized[20, 50]) == RED
+  assert tuple(rasterized[20, 20]) == GREEN
+  assert tuple(rasterized[55, 45]) == BLUE
+  # Convex edges may differ from PIL by a pixel
+  differ = (rasterized != draw(commands, False)).any(axis=2)
+  assert differ.sum() < 200
@@ -0,0 +1,36 @@
+import render_farm
+from falling_balls import make_notes
+from render_farm import expand_grid
+from render_farm import job_name
+from render_farm import render_job
+
+
+def test_defaults_are_part_of_the_name():
+  implicit = expand_grid({"seed": [0, 1]})
+  explicit = expand_grid({"seed": [0, 1], "duration": 20})
+  assert list(map(job_name, implicit)) == list(map(job_name, explicit))
+
+
+def test_fixed_lists_are_not_expanded():
+  palette = [[1, 0, 0], [0, 1, 0]]
+  jobs = expand_grid({"seed": [0, 1]}, fixed={"palette": palette})
+  assert len(jobs) == 2
+  assert all(job["palette"] == palette for job in jobs)
+
+
+def test_palette_job(tmp_path):
+  render_farm._init_worker(make_notes())
+  (params,) = expand_grid(
+      {"seed": 0},
+      fixed={
+        "palette": [[1, 0, 0], [0, 1, 0]],
+        "canvas_width": 64,
+        "canvas_height": 64,
+        "duration": 0.5,
+        "framerate": 10,
+      },
+  )
+  out_path = tmp_path.joinpath(f"{job_name(params)}.mp4")
+  timing = render_job(params, out_path, tmp_path)
+  assert out_path.exists()
+  assert timing["params"]["palette"] == [[1, 0, 0], [0, 1, 0]]
@@ -0,0 +1,60 @@
+import pickle
+
+from pydub.generators import Sine
+
+from sketch.sample_cache import SampleCache
+from sketch.sounds import AudioSampler
+from sketch.sounds import SoundDescription
+
+
+def write_sample(tmp_path):
+  path = tmp_path / "tone.wav"
+  Sine(440).to_audio_segment(duration=400).export(path, format="wav")
+  return path
+
+
+def mix(sound_desc):
+  sampler = AudioSampler(duration=1, out_path=None)
+  sampler.trigger(sound_desc, 0.1)
+  sampler.trigger(sound_desc, 0.3)
+  return sampler.mix().raw_data
+
+
+def test_cached_sample_mixes_like_uncached(tmp_path):
+  path = write_sample(tmp_path)
+  cache = SampleCache(tmp_path / "cache")
+  uncached = SoundDescription().add_sample(path, volume=-3, duration=0.25)
+  cached = SoundDescription().add_sample(
+      path, volume=-3, duration=0.25, cache=cache
+  )
+  expected = mix(uncached)
+  assert mix(cached) == expected
+  assert mix(pickle.loads(pickle.dumps(cached))) == expected
+
+
+def test_second_load_does_not_decode(tmp_path):
+  path = write_sample(tmp_path)
+  cache = SampleCache(tmp_path / "cache")
+  decoded = []
+  def decode():
+    decoded.append(path)
+    return Sine(440).to_audio_segment(duration=400)
+  first = cache.load(path, 0, None, decode)
+  second = SampleCache(tmp_path / "cache").load(path, 0, None, decode)
+  assert len(decoded) == 1
+  assert second.to_audio_segment() == first.to_audio_segment()
+
+
+def test_evicted_array_is_decoded_again(tmp_path):
+  path = write_sample(tmp_path)
+  cache = SampleCache(tmp_path / "cache")
+  decoded = []
+  def decode():
+    decoded.append(path)
+    return Sine(440).to_audio_segment(duration=400)
+  sample = cache.load(path, 0, None, decode)
+  for array_path in cache.cache_dir.glob("*.npy"):
+    array_path.unlink()
+  reloaded = cache.load(path, 0, None, decode)
+  assert len(decoded) == 2
+  assert len(reloaded.data) == len(sample.data)
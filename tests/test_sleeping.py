@@ -0,0 +1,48 @@
+from falling_balls import build_scene
+from sketch.entities.falling_ball import FallingBall
+from sketch.entities.music_box import MusicBox
+from sketch.sounds import AudioSampler
+from sketch.util.point import Point
+
+
+def run_scene(skip_sleeping, num_steps=300):
+  scene = build_scene(num_balls=30, with_audio=False, seed=4)
+  scene.skip_sleeping = skip_sleeping
+  audio_sampler = AudioSampler(duration=num_steps, out_path=None)
+  for _ in range(num_steps):
+    scene.step(1/60, audio_sampler=audio_sampler)
+  return scene, [
+      (tuple(e.position), tuple(e.velocity), e.angle)
+      for e in scene.entities
+  ]
+
+
+def test_skipping_sleepers_matches_stepping_everything():
+  assert run_scene(True)[1] == run_scene(False)[1]
+
+
+def test_reactivated_entity_steps_again():
+  scene, _ = run_scene(True, num_steps=10)
+  ball = next(e for e in scene.entities if isinstance(e, FallingBall))
+  audio_sampler = AudioSampler(duration=1, out_path=None)
+  ball.active = False
+  for _ in range(5):
+    scene.step(1/60, audio_sampler=audio_sampler)
+  stopped = tuple(ball.position)
+  ball.active = True
+  scene.step(1/60, audio_sampler=audio_sampler)
+  assert tuple(ball.position) != stopped
+
+
+def test_unfrozen_entity_wakes():
+  scene, _ = run_scene(True, num_steps=10)
+  box = next(
+      e for e in scene.entities
+      if isinstance(e, MusicBox) and e.is_sleeping()
+  )
+  audio_sampler = AudioSampler(duration=1, out_path=None)
+  box.frozen = False
+  box.velocity = Point(0, -600)
+  start = tuple(box.position)
+  scene.step(1/60, audio_sampler=audio_sampler)
+  assert tuple(box.position) != start
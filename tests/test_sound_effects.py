@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+from pydub.generators import Sine
+
+from sketch.sound_effects import fade_in_and_out_samples
+from sketch.sound_effects import fade_in_samples
+from sketch.sound_effects import fade_out_samples
+from sketch.sounds import sec_to_mil
+from sketch.sounds import sine_bank
+
+
+def assert_matches_pydub(samples, segment):
+  expected = np.array(segment.get_array_of_samples())
+  # pydub can lose the last frame of a fade to rounding
+  assert len(samples) - len(expected) in (0, 1)
+  assert np.array_equal(samples[:len(expected)], expected)
+
+
+@pytest.mark.parametrize("frame_rate", [44100, 11025])
+@pytest.mark.parametrize("duration", [0.3, 0.333])
+@pytest.mark.parametrize("fade", [0.03, 0.1, 0.15])
+def test_fades_match_pydub(frame_rate, duration, fade):
+  samples = sine_bank([440], duration, frame_rate=frame_rate)
+  segment = Sine(440, sample_rate=frame_rate).to_audio_segment(
+      duration=sec_to_mil(duration)
+  )
+  fade_ms = sec_to_mil(fade)
+  assert_matches_pydub(
+      fade_in_samples(fade)(samples, frame_rate)[0],
+      segment.fade_in(fade_ms)
+  )
+  assert_matches_pydub(
+      fade_out_samples(fade)(samples, frame_rate)[0],
+      segment.fade_out(fade_ms)
+  )
+  assert_matches_pydub(
+      fade_in_and_out_samples(fade, fade)(samples, frame_rate)[0],
+      segment.fade_in(fade_ms).fade_out(fade_ms)
+  )
+
+
+@pytest.mark.parametrize("fade", [0.08, 0.5])
+def test_fades_longer_than_tone_keep_length(fade):
+  samples = sine_bank([220, 440], 0.05)
+  faded_in = fade_in_samples(fade)(samples, 44100)
+  faded_out = fade_out_samples(fade)(samples, 44100)
+  assert faded_in.shape == samples.shape
+  assert faded_out.shape == samples.shape
+  # Only part of the way up, and most of the way down
+  peak = np.abs(samples).max()
+  assert np.abs(faded_in).max() < peak
+  assert np.abs(faded_out[:, -10:]).max() < 0.1 * peak
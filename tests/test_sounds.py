@@ -0,0 +1,30 @@
+from pydub.generators import Sine
+
+from sketch.sounds import AudioSampler
+from sketch.sounds import SoundDescription
+from sketch.sounds import StreamingAudioSampler
+
+
+def test_streamed_mix_matches_mix(tmp_path):
+  sounds = [
+      SoundDescription().add_generator(
+          Sine(freq=freq), volume=-10, duration=0.3
+      )
+      for freq in (220, 330, 440)
+  ]
+  kwargs = dict(duration=2, frame_rate=44100, channels=1, sample_width=2)
+  streamed = StreamingAudioSampler(
+      out_path=tmp_path / "streamed.wav", block_duration=0.25, **kwargs
+  )
+  mixed = AudioSampler(duration=2, out_path=None)
+  for i in range(12):
+    for sampler in (streamed, mixed):
+      voice = sampler.trigger(sounds[i % 3], i * 0.15)
+      if i % 4 == 0:
+        sampler.stop(voice, i * 0.15 + 0.1)
+  expected = mixed.mix()
+  assert expected.frame_rate == 44100
+  result = streamed.mix()
+  assert result.raw_data == expected.raw_data
+  # Reading it again doesn't export twice
+  assert streamed.mix().raw_data == expected.raw_data
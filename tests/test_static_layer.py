@@ -0,0 +1,30 @@
+from falling_balls import build_scene
+from sketch.canvas import Canvas
+from sketch.sounds import AudioSampler
+from sketch.sprites import SpriteCache
+import pytest
+
+
+def draw_frames(static_layer, sprites, num_balls, num_frames=150):
+  scene = build_scene(num_balls=num_balls, with_audio=False, seed=5)
+  scene.static_layer = static_layer
+  sprite_cache = SpriteCache(max_size=2000) if sprites else None
+  canvas = Canvas(scene.canvas_size, "RGBA", sprite_cache)
+  audio_sampler = AudioSampler(duration=num_frames, out_path=None)
+  frames = []
+  for _ in range(num_frames):
+    scene.step(1/60, audio_sampler=audio_sampler)
+    scene.draw(canvas.draw_ctx, canvas)
+    frames.append(canvas.array.copy())
+  return frames
+
+
+# 80 balls is past max_dirty_rects, so whole frames are restored
+@pytest.mark.parametrize("sprites", [False, True])
+@pytest.mark.parametrize("num_balls", [20, 80])
+def test_layer_matches_drawing_everything(sprites, num_balls):
+  # The boxes are static and drawn over the balls
+  layered = draw_frames(True, sprites, num_balls)
+  drawn = draw_frames(False, sprites, num_balls)
+  for idx, (a, b) in enumerate(zip(layered, drawn)):
+    assert (a == b).all(), f"Frame {idx} differs"
@@ -0,0 +1,48 @@
+import math
+
+import pytest
+
+from sketch.swept_collision import circle_poly_time_of_impact
+
+SQUARE = [(0, 0), (10, 0), (10, 10), (0, 10)]
+
+
+def test_edge_hit():
+  t = circle_poly_time_of_impact((-5, 5), (10, 0), 1, SQUARE)
+  # Center stops one radius short of the left edge
+  assert t == pytest.approx(0.4)
+
+
+def test_corner_hit():
+  t = circle_poly_time_of_impact((-5, -5), (10, 10), 1, SQUARE)
+  # Center stops one radius short of the corner, along the diagonal
+  assert t == pytest.approx((5 - math.sqrt(0.5)) / 10)
+
+
+def test_corner_hit_in_any_winding():
+  t = circle_poly_time_of_impact((-5, -5), (10, 10), 1, SQUARE[::-1])
+  assert t == pytest.approx((5 - math.sqrt(0.5)) / 10)
+
+
+def test_moving_away():
+  assert circle_poly_time_of_impact((-5, 5), (-10, 0), 1, SQUARE) is None
+
+
+def test_stopping_short():
+  assert circle_poly_time_of_impact((-5, 5), (3, 0), 1, SQUARE) is None
+
+
+def test_passing_by():
+  assert circle_poly_time_of_impact((-5, 12), (20, 0), 1, SQUARE) is None
+
+
+def test_already_overlapping():
+  assert circle_poly_time_of_impact((-0.5, 5), (10, 0), 1, SQUARE) is None
+
+
+def test_already_inside():
+  assert circle_poly_time_of_impact((5, 5), (20, 0), 1, SQUARE) is None
+
+
+def test_not_moving():
+  assert circle_poly_time_of_impact((-5, 5), (0, 0), 1, SQUARE) is None
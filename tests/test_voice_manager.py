@@ -0,0 +1,88 @@
+from pydub.generators import Sine
+
+from sketch.sounds import AudioSampler
+from sketch.sounds import SoundDescription
+from sketch.sounds import StreamingAudioSampler
+from sketch.sounds import VoiceManager
+
+
+def tone(freq=440, volume=-10, duration=0.3):
+  return SoundDescription().add_generator(
+      Sine(freq=freq), volume=volume, duration=duration
+  )
+
+
+def test_cooldown():
+  a, b = tone(440), tone(660)
+  voices = VoiceManager(AudioSampler(duration=1, out_path=None), cooldown=0.1)
+  voices.set_cooldown(b, 0.5)
+  assert voices.trigger(a, 0) is not None
+  assert voices.trigger(a, 0.05) is None
+  assert voices.trigger(a, 0.15) is not None
+  assert voices.trigger(b, 0) is not None
+  assert voices.trigger(b, 0.2) is None
+  assert voices.num_played == 3
+  assert voices.num_cooled == 2
+
+
+def test_steal_oldest():
+  sampler = AudioSampler(duration=1, out_path=None)
+  voices = VoiceManager(sampler, max_voices=2)
+  first = voices.trigger(tone(220), 0)
+  voices.trigger(tone(330), 0.05)
+  voices.trigger(tone(440), 0.1)
+  assert sampler.stops == {first: 0.1}
+  assert voices.num_stolen == 1
+
+
+def test_steal_quietest():
+  sampler = AudioSampler(duration=1, out_path=None)
+  voices = VoiceManager(sampler, max_voices=2, steal="quietest")
+  voices.trigger(tone(220, volume=-5), 0)
+  quiet = voices.trigger(tone(330, volume=-20), 0.05)
+  voices.trigger(tone(440, volume=-10), 0.1)
+  assert sampler.stops == {quiet: 0.1}
+  # Quieter than everything playing
+  assert voices.trigger(tone(550, volume=-30), 0.15) is None
+  assert voices.num_stolen == 1
+  assert voices.num_dropped == 1
+
+
+def test_merge_rearms_the_standing_voice():
+  sampler = AudioSampler(duration=1, out_path=None)
+  voices = VoiceManager(sampler, max_voices=2, merge_window=0.05)
+  a = tone(220)
+  voices.trigger(a, 0)
+  other = voices.trigger(tone(330), 0.01)
+  assert voices.trigger(a, 0.02) is None
+  # a was merged into after other started, so other is the oldest
+  voices.trigger(tone(440), 0.03)
+  assert sampler.stops == {other: 0.03}
+  assert voices.num_merged == 1
+
+
+def test_merge_needs_a_playing_voice():
+  voices = VoiceManager(
+      AudioSampler(duration=1, out_path=None), merge_window=0.2
+  )
+  short = tone(duration=0.05)
+  voices.trigger(short, 0)
+  assert voices.trigger(short, 0.1) is not None
+  assert voices.num_merged == 0
+
+
+def test_streamed_steals_match_mix(tmp_path):
+  sounds = [tone(freq) for freq in (220, 330, 440, 550)]
+  streamed = StreamingAudioSampler(
+      duration=2,
+      out_path=tmp_path / "streamed.wav",
+      block_duration=0.1,
+  )
+  mixed = AudioSampler(duration=2, out_path=None)
+  for sampler in (streamed, mixed):
+    voices = VoiceManager(sampler, max_voices=2)
+    for i in range(16):
+      voices.trigger(sounds[i % 4], i * 0.1)
+      voices.advance(i * 0.1)
+    assert voices.num_stolen > 0
+  assert streamed.mix().raw_data == mixed.mix().raw_data